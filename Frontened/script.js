@@ -13,6 +13,7 @@ function init(){
   const messageInput = document.getElementById('messageInput');
   const sendBtn = document.getElementById('sendBtn');
   const micBtn = document.getElementById('micBtn');
+  const attachBtn = document.querySelector('.composer .attach');
   const menuBtn = document.getElementById('menuBtn');
   const chatMenuBtn = document.getElementById('chatMenuBtn');
   const popover = document.getElementById('popover');
@@ -24,6 +25,12 @@ function init(){
 
   let chats = [];
   let activeChat = null;
+  // History is fetched a page at a time; cursors come from /chats/<wa_id>?limit=
+  const PAGE_SIZE = 50;
+  let historyCursor = { before: null, after: null };
+  let loadingOlder = false;
+  // Last change sequence seen from /sync
+  let syncSeq = null;
 
   function toNumberish(v){
     if (v == null) return 0;
@@ -61,6 +68,7 @@ function renderChatList(list){
           ${c.muted ? '<i class="mute"></i>' : ''}
         </div>
         <div class="chat-item__time">${fmtTime(c.last_timestamp)}</div>
+        ${c.unread_count > 0 ? `<span class="chat-item__badge">${c.unread_count}</span>` : ''}
       </div>
     `;
     li.addEventListener('click',()=>{
@@ -76,12 +84,140 @@ async function openChat(chat){
   chatTitle.textContent = chat.name;
   chatAvatar.src = '/Frontened/assets/default-avatar.svg';
   chatPresence.textContent = 'online';
-  const res = await fetch(`${API_BASE}/chats/${encodeURIComponent(chat.wa_id)}`);
-  const msgs = await res.json();
-  renderMessages(msgs);
+  if (socket) socket.emit('open_chat', { wa_id: chat.wa_id });
+  historyCursor = { before: null, after: null };
+  const res = await fetch(`${API_BASE}/chats/${encodeURIComponent(chat.wa_id)}?limit=${PAGE_SIZE}`);
+  const page = await res.json();
+  if (activeChat !== chat) return;
+  historyCursor = { before: page.next_before, after: page.next_after };
+  renderMessages(page.messages);
+  const newest = (window.__lastMsgs || []).slice(-1)[0];
+  if (newest) markRead(chat, newest.timestamp);
 }
 
-function renderMessages(messages){
+// Advance the chat's read watermark; calls within a second are coalesced into one POST
+const readTimers = new Map();
+function markRead(chat, ts){
+  const pending = readTimers.get(chat.wa_id);
+  const upTo = Math.max(toNumberish(ts), pending ? pending.upTo : 0);
+  if (pending) clearTimeout(pending.timer);
+  const timer = setTimeout(async () => {
+    readTimers.delete(chat.wa_id);
+    try{
+      const res = await fetch(`${API_BASE}/chats/${encodeURIComponent(chat.wa_id)}/read`, {
+        method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ timestamp: upTo })
+      });
+      if (res.ok) applyRead(await res.json());
+    }catch(e){ console.warn('mark read failed', e); }
+  }, pending ? 1000 : 0);
+  readTimers.set(chat.wa_id, { upTo, timer });
+}
+
+// A read watermark: clears the badge and marks the contact's messages up to it as read.
+// The agent's own messages keep the ticks the contact's receipts gave them.
+function applyRead(r){
+  const chat = chats.find(c => c.wa_id === r.wa_id);
+  if (chat && chat.unread_count !== r.unread_count) {
+    chat.unread_count = r.unread_count;
+    renderChatList(chats);
+  }
+  if (!activeChat || activeChat.wa_id !== r.wa_id) return;
+  const msgs = window.__lastMsgs || [];
+  let changed = false;
+  msgs.forEach(m => {
+    if (m.from !== r.wa_id || m.status === 'read') return;
+    if (toNumberish(m.timestamp) <= r.read_up_to) { m.status = 'read'; changed = true; }
+  });
+  if (changed) renderMessages(msgs, { keepScroll: true });
+}
+
+async function loadOlderMessages(){
+  if (!activeChat || !historyCursor.before || loadingOlder) return;
+  loadingOlder = true;
+  const chat = activeChat;
+  try{
+    const res = await fetch(`${API_BASE}/chats/${encodeURIComponent(chat.wa_id)}?limit=${PAGE_SIZE}&before=${encodeURIComponent(historyCursor.before)}`);
+    const page = await res.json();
+    if (activeChat !== chat) return;
+    historyCursor.before = page.next_before;
+    const prevHeight = messagePane.scrollHeight;
+    renderMessages(mergeMessages(window.__lastMsgs || [], page.messages), { keepScroll: true });
+    messagePane.scrollTop += messagePane.scrollHeight - prevHeight;
+  }catch(e){ console.warn('load older failed', e); }
+  finally{ loadingOlder = false; }
+}
+
+// Union of two message lists keyed by id/wamid; incoming copies win
+function mergeMessages(existing, incoming){
+  const byId = new Map();
+  for (const m of [...existing, ...incoming]) byId.set(m.id || m.wamid || `${m.timestamp}:${m.text && m.text.body}`, m);
+  return [...byId.values()];
+}
+
+// Join the inbox rooms for the chats in the sidebar so chat_updated reaches us
+function watchChats(){
+  if (socket && socket.connected) socket.emit('watch_chats', { wa_ids: chats.map(c => c.wa_id) });
+}
+
+// Move a chat to the top of the list with its latest message, without refetching /chats
+function bumpChat(msg){
+  const chat = chats.find(c => c.wa_id === msg.wa_id);
+  if (!chat) { loadChats(); return; }
+  // Accepts a message or a chat_updated summary
+  const ts = msg.last_timestamp != null ? msg.last_timestamp : msg.timestamp;
+  const body = msg.last_message != null ? msg.last_message : ((msg.text && msg.text.body) || '');
+  if (toNumberish(ts) >= toNumberish(chat.last_timestamp)){
+    chat.last_message = body;
+    chat.last_timestamp = ts;
+  }
+  renderChatList(chats);
+}
+
+// Patch ticks in place for a batch of {wa_id, id, status}; one re-render
+function applyStatuses(updates){
+  if (!activeChat || !updates) return;
+  const msgs = window.__lastMsgs || [];
+  let changed = false;
+  updates.forEach(u => {
+    if (u.wa_id !== activeChat.wa_id) return;
+    const target = msgs.find(m => m.id === u.id || m.wamid === u.id);
+    if (target && target.status !== u.status) {
+      target.status = u.status;
+      changed = true;
+    }
+  });
+  if (changed) renderMessages(msgs, { keepScroll: true });
+}
+
+// Fetch and apply everything that changed since syncSeq
+async function syncChanges(){
+  if (syncSeq == null) {
+    const res = await fetch(`${API_BASE}/sync`);
+    syncSeq = (await res.json()).seq;
+    return;
+  }
+  let more = true;
+  while (more){
+    const res = await fetch(`${API_BASE}/sync?since=${syncSeq}`);
+    const d = await res.json();
+    syncSeq = d.seq;
+    if (d.reset){
+      await loadChats();
+      if (activeChat) await openChat(activeChat);
+      return;
+    }
+    if (activeChat){
+      const incoming = d.messages.filter(m => m.wa_id === activeChat.wa_id);
+      if (incoming.length) renderMessages(mergeMessages(window.__lastMsgs || [], incoming));
+    }
+    d.messages.forEach(bumpChat);
+    applyStatuses(d.statuses);
+    more = d.has_more;
+  }
+}
+
+function renderMessages(messages, opts = {}){
+  const prevTop = messagePane.scrollTop;
   messagePane.innerHTML = '';
   const sorted = [...messages].sort((a,b)=> toUnixTime(a.timestamp) - toUnixTime(b.timestamp));
   let lastDay = '';
@@ -119,16 +255,67 @@ function renderMessages(messages){
       ticksWrap.appendChild(t1);
       ticksWrap.appendChild(t2);
     }
-    bubble.textContent = (m.text && m.text.body) ? m.text.body : '';
+    if (m.media && m.media.id) {
+      bubble.appendChild(mediaElement(m));
+      if (m.text && m.text.body) {
+        const caption = document.createElement('div');
+        caption.textContent = m.text.body;
+        bubble.appendChild(caption);
+      }
+    } else if (m.provider_media) {
+      // Received through the webhook: the file itself is still with the provider
+      const label = document.createElement('div');
+      label.className = 'bubble__media bubble__media--remote';
+      label.textContent = remoteMediaLabel(m);
+      bubble.appendChild(label);
+      if (m.text && m.text.body) {
+        const caption = document.createElement('div');
+        caption.textContent = m.text.body;
+        bubble.appendChild(caption);
+      }
+    } else {
+      bubble.textContent = (m.text && m.text.body) ? m.text.body : '';
+    }
     meta.appendChild(time);
     if (out) meta.appendChild(ticksWrap);
     bubble.appendChild(meta);
     messagePane.appendChild(bubble);
   }
-  messagePane.scrollTop = messagePane.scrollHeight;
+  messagePane.scrollTop = opts.keepScroll ? prevTop : messagePane.scrollHeight;
   toggleScrollBtn();
 }
 
+  function remoteMediaLabel(m){
+    const kind = { image: '📷 Photo', audio: '🎤 Audio', video: '🎥 Video' }[m.type] || '📄 Document';
+    return m.provider_media.filename ? `${kind} · ${m.provider_media.filename}` : kind;
+  }
+
+  // Attachments are fetched by id: a cached thumbnail for images, ranged streams for audio/video
+  function mediaElement(m){
+    const url = `${API_BASE}/media/${m.media.id}`;
+    let el;
+    if (m.type === 'image') {
+      el = document.createElement('a');
+      el.href = url; el.target = '_blank'; el.rel = 'noopener';
+      const img = document.createElement('img');
+      img.src = m.media.preview || `${url}/thumbnail`;
+      img.loading = 'lazy';
+      img.alt = m.media.filename || 'Photo';
+      el.appendChild(img);
+    } else if (m.type === 'audio' || m.type === 'video') {
+      el = document.createElement(m.type);
+      el.controls = true;
+      el.preload = 'metadata';
+      el.src = url;
+    } else {
+      el = document.createElement('a');
+      el.href = url;
+      el.textContent = `📄 ${m.media.filename || 'Document'}${m.media.size ? ` (${Math.ceil(m.media.size / 1024)} KB)` : ''}`;
+    }
+    el.className = 'bubble__media';
+    return el;
+  }
+
   function statusToTick(status){
     const s = String(status || '').toLowerCase();
     if (s === 'read') return 'read';
@@ -149,6 +336,7 @@ async function loadChats(){
     chats = await res.json();
     console.log('Loaded chats:', chats);
     renderChatList(chats);
+    watchChats();
     // Only auto-open on first load
     if (!activeChat && chats.length) openChat(chats[0]);
   }catch(e){
@@ -179,15 +367,75 @@ sendBtn.addEventListener('click', async ()=>{
   toggleScrollBtn();
 });
 
+// Upload the file as the raw request body, then send a message that references it
+async function sendMedia(file, caption){
+  if (!activeChat) return;
+  const wa_id = activeChat.wa_id;
+  const clientId = `c_${Date.now().toString(36)}_${Math.random().toString(36).slice(2,6)}`;
+  const type = (file.type || '').split('/')[0];
+  const preview = type === 'image' ? URL.createObjectURL(file) : null;
+  const optimistic = { wa_id, name: 'You', text: { body: caption || '' }, timestamp: (Date.now()/1000), status: 'sent', id: clientId, wamid: clientId,
+    type: ['image','audio','video'].includes(type) ? type : 'document', media: { id: '', filename: file.name, size: file.size } };
+  try{
+    const res = await fetch(`${API_BASE}/media`, { method: 'POST', body: file,
+      headers: { 'Content-Type': file.type || 'application/octet-stream', 'X-Filename': encodeURIComponent(file.name || '') } });
+    const media = await res.json();
+    if (!res.ok) throw new Error(media.error || `HTTP ${res.status}`);
+    optimistic.media = Object.assign(media, { preview });
+    if (activeChat && activeChat.wa_id === wa_id) renderMessages([...(window.__lastMsgs||[]), optimistic]);
+    window.__lastLocalId = clientId;
+    await fetch(`${API_BASE}/messages`, { method: 'POST', headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ wa_id, media_id: media.id, text: caption || '', name: 'You', client_id: clientId }) });
+  }catch(e){ console.warn('attachment failed', e); alert(`Could not send ${file.name || 'attachment'}: ${e.message}`); }
+}
+
+const fileInput = document.createElement('input');
+fileInput.type = 'file';
+fileInput.hidden = true;
+document.body.appendChild(fileInput);
+attachBtn.addEventListener('click', () => { if (activeChat) fileInput.click(); });
+fileInput.addEventListener('change', () => {
+  const caption = messageInput.value.trim();
+  for (const file of fileInput.files) sendMedia(file, caption);
+  fileInput.value = ''; messageInput.value = ''; toggleSendMic();
+});
+
+// Voice notes: the mic starts recording, a second click stops and sends it
+let recorder = null;
+micBtn.addEventListener('click', async () => {
+  if (recorder) { recorder.stop(); return; }
+  if (!activeChat || !navigator.mediaDevices || !window.MediaRecorder) return;
+  try{
+    const stream = await navigator.mediaDevices.getUserMedia({ audio: true });
+    const parts = [];
+    recorder = new MediaRecorder(stream);
+    recorder.ondataavailable = (e) => parts.push(e.data);
+    recorder.onstop = () => {
+      stream.getTracks().forEach(t => t.stop());
+      const type = recorder.mimeType || 'audio/webm';
+      recorder = null;
+      micBtn.classList.remove('recording');
+      sendMedia(new File(parts, `voice-${Date.now()}.${type.includes('ogg') ? 'ogg' : 'webm'}`, { type }));
+    };
+    recorder.start();
+    micBtn.classList.add('recording');
+  }catch(e){ console.warn('recording failed', e); recorder = null; }
+});
+
 messageInput.addEventListener('keydown', (e)=>{ if(e.key==='Enter') sendBtn.click(); });
 messageInput.addEventListener('input', toggleSendMic); toggleSendMic();
 
 // Add typing indicators
 let typingTimer = null;
+let typingSentAt = 0;
 messageInput.addEventListener('input', () => {
   if (socket && activeChat) {
-    // Emit typing start
-    socket.emit('typing_start', { wa_id: activeChat.wa_id });
+    // Once per burst, repeated every 3s to keep the server's typing state from expiring
+    const now = Date.now();
+    if (now - typingSentAt > 3000) {
+      socket.emit('typing_start', { wa_id: activeChat.wa_id });
+      typingSentAt = now;
+    }
     
     // Clear existing timer
     if (typingTimer) clearTimeout(typingTimer);
@@ -197,6 +445,7 @@ messageInput.addEventListener('input', () => {
       if (socket && activeChat) {
         socket.emit('typing_stop', { wa_id: activeChat.wa_id });
       }
+      typingSentAt = 0;
     }, 2000);
   }
 });
@@ -204,9 +453,32 @@ messageInput.addEventListener('input', () => {
   const backBtn = document.getElementById('backBtn');
   backBtn?.addEventListener('click', ()=>{ document.body.classList.remove('show-chat'); });
 
+// Names match locally; message text is searched on the server once typing pauses
+let searchTimer = null;
 searchInput.addEventListener('input', (e)=>{
-  const q = e.target.value.toLowerCase();
-  renderChatList(chats.filter(c=> c.name.toLowerCase().includes(q)));
+  const raw = e.target.value.trim();
+  const q = raw.toLowerCase();
+  const byName = chats.filter(c=> c.name.toLowerCase().includes(q));
+  renderChatList(byName);
+  if (searchTimer) clearTimeout(searchTimer);
+  if (!raw) return;
+  searchTimer = setTimeout(async ()=>{
+    try{
+      const res = await fetch(`${API_BASE}/search?q=${encodeURIComponent(raw)}&limit=50`);
+      const page = await res.json();
+      if (searchInput.value.trim() !== raw) return;
+      // One row per chat, showing its newest matching message
+      const shown = new Set(byName.map(c=> c.wa_id));
+      const hits = [];
+      (page.results || []).forEach(m=>{
+        if (shown.has(m.wa_id)) return;
+        shown.add(m.wa_id);
+        const chat = chats.find(c=> c.wa_id === m.wa_id) || { wa_id: m.wa_id, name: m.name || m.wa_id };
+        hits.push({ ...chat, last_message: m.text?.body || '', last_timestamp: m.timestamp });
+      });
+      renderChatList(byName.concat(hits));
+    }catch(err){ console.warn('search failed', err); }
+  }, 250);
 });
 
 // Position popover near the triggering element
@@ -256,30 +528,107 @@ function toggleScrollBtn(){
   const nearBottom = messagePane.scrollHeight - messagePane.scrollTop - messagePane.clientHeight < 80;
   if (nearBottom) scrollDownBtn.classList.add('hidden'); else scrollDownBtn.classList.remove('hidden');
 }
-messagePane.addEventListener('scroll', toggleScrollBtn);
+messagePane.addEventListener('scroll', ()=>{
+  toggleScrollBtn();
+  if (messagePane.scrollTop < 80) loadOlderMessages();
+});
 scrollDownBtn.addEventListener('click', ()=>{ messagePane.scrollTop = messagePane.scrollHeight; toggleScrollBtn(); });
 
-  // Real-time: Socket.IO → SSE → Polling
+  // Real-time: Socket.IO → SSE → Polling. Each fallback starts only once the one before it
+  // has failed, so a browser never holds two streams of the same events.
   let socket = null;
-  let boundRealtime = false;
-  
+  let fallbackStarted = false;
+
+  function startFallback(){
+    if (fallbackStarted) return;
+    fallbackStarted = true;
+    if (socket) { socket.close(); socket = null; }
+    try {
+      startSSE();
+    } catch (_) {
+      startPolling();
+    }
+  }
+
+  // Unfiltered: without Socket.IO rooms this stream is also how new chats reach the sidebar
+  function startSSE(){
+    const es = new EventSource((API_BASE || '') + '/events');
+    es.onmessage = (ev) => {
+      if (!ev?.data) return;
+      try {
+        const data = JSON.parse(ev.data);
+        if (data.type === 'new_message') {
+          console.log('📨 New message via SSE:', data.message);
+          const msg = data.message;
+          if (!shouldAcceptIncoming(msg)) return;
+          if (activeChat && msg.wa_id === activeChat.wa_id) {
+            renderMessages([...(window.__lastMsgs || []), msg]);
+            markRead(activeChat, msg.timestamp);
+          }
+          bumpChat(msg);
+        } else if (data.type === 'status_updates') {
+          applyStatuses(data.updates);
+        } else if (data.type === 'chat_read') {
+          applyRead(data.read);
+        } else if (data.type === 'reset') {
+          // Missed more events than the server kept for resume; reload
+          loadChats();
+          if (activeChat) openChat(activeChat);
+        }
+      } catch (_) {}
+    };
+    let opened = false;
+    es.onopen = () => {
+      opened = true;
+      console.log('✅ SSE connected as fallback');
+    };
+    es.onerror = () => {
+      // After a drop the browser reconnects and resumes from Last-Event-ID by itself
+      if (opened && es.readyState !== EventSource.CLOSED) return;
+      es.close();
+      startPolling();
+    };
+  }
+
+  function startPolling(){
+    console.log('⚠️ Using polling fallback');
+    syncChanges().catch(()=>{});
+    setInterval(() => { syncChanges().catch(()=>{}); }, 3000);
+  }
+
+  // Take the change sequence before the first /chats load, so polling picks up from there
+  syncChanges().catch(()=>{});
+
   // Try Socket.IO first (best real-time experience)
   try {
     if (window.io) {
       const socketUrl = API_BASE || window.location.origin;
+      // Stable per-browser id so every tab of this agent shares an agent room
+      let agentId = localStorage.getItem('agentId');
+      if (!agentId) {
+        agentId = `agent_${Math.random().toString(36).slice(2, 10)}`;
+        localStorage.setItem('agentId', agentId);
+      }
       socket = window.io(socketUrl, { 
         transports: ['websocket', 'polling'],
-        timeout: 20000
+        timeout: 20000,
+        auth: { agent_id: agentId }
       });
+      let everConnected = false;
       
       socket.on('connect', () => {
         console.log('✅ Socket.IO connected');
-        boundRealtime = true;
+        everConnected = true;
+        // Rooms do not survive a reconnect
+        watchChats();
+        if (activeChat) socket.emit('open_chat', { wa_id: activeChat.wa_id });
       });
+
+      // Sidebar updates for watched chats, and the first message of chats the server had not announced yet
+      socket.on('chat_updated', (u) => bumpChat(u));
       
       socket.on('disconnect', () => {
         console.log('❌ Socket.IO disconnected');
-        boundRealtime = false;
       });
       
       socket.on('new_message', (msg) => {
@@ -287,79 +636,43 @@ scrollDownBtn.addEventListener('click', ()=>{ messagePane.scrollTop = messagePan
         if (!shouldAcceptIncoming(msg)) return;
         if (activeChat && msg.wa_id === activeChat.wa_id) {
           renderMessages([...(window.__lastMsgs || []), msg]);
-        }
-        loadChats(); // Update chat list
-      });
-      
-      // Optional: Add typing indicators
-      socket.on('typing_start', (data) => {
-        if (activeChat && data.wa_id === activeChat.wa_id) {
-          chatPresence.textContent = 'typing...';
+          markRead(activeChat, msg.timestamp);
         }
       });
+
+      socket.on('chat_read', (r) => applyRead(r));
       
-      socket.on('typing_stop', (data) => {
-        if (activeChat && data.wa_id === activeChat.wa_id) {
-          chatPresence.textContent = 'online';
+      // Typing frames list who started/stopped in a chat since the last frame
+      let myTypingId = null;
+      const typers = new Map();
+      socket.on('session', (data) => { myTypingId = data.typing_id; });
+      socket.on('typing', (frame) => {
+        const set = typers.get(frame.wa_id) || new Set();
+        frame.started.forEach(id => { if (id !== myTypingId) set.add(id); });
+        frame.stopped.forEach(id => set.delete(id));
+        typers.set(frame.wa_id, set);
+        if (activeChat && frame.wa_id === activeChat.wa_id) {
+          chatPresence.textContent = set.size ? 'typing...' : 'online';
         }
       });
       
       // Status updates
-      socket.on('status_update', (u) => {
-        if (!u || !activeChat || u.wa_id !== activeChat.wa_id) return;
-        // Refresh messages for current chat to pick up status change
-        fetch(`${API_BASE}/chats/${encodeURIComponent(activeChat.wa_id)}`)
-          .then(r=>r.json())
-          .then(msgs=>renderMessages(msgs))
-          .catch(()=>{});
-        loadChats();
+      socket.on('status_updates', (batch) => {
+        // One event per chat per scheduler tick
+        applyStatuses(batch.updates);
       });
       
       socket.on('connect_error', (error) => {
         console.warn('Socket.IO connection error:', error);
-        boundRealtime = false;
+        // Also fires when the handshake times out. Once connected, the client reconnects by itself.
+        if (!everConnected) startFallback();
       });
+    } else {
+      startFallback();
     }
   } catch (e) {
     console.warn('Socket.IO not available:', e);
-  }
-
-  // Fallback to SSE if Socket.IO fails
-  if (!boundRealtime) {
-    let es = null;
-    try {
-      es = new EventSource((API_BASE || '') + '/events');
-      es.onmessage = (ev) => {
-        if (!ev?.data) return;
-        try {
-          const data = JSON.parse(ev.data);
-          if (data.type === 'new_message') {
-            console.log('📨 New message via SSE:', data.message);
-            const msg = data.message;
-            if (!shouldAcceptIncoming(msg)) return;
-            if (activeChat && msg.wa_id === activeChat.wa_id) {
-              renderMessages([...(window.__lastMsgs || []), msg]);
-            }
-            loadChats();
-          }
-        } catch (_) {}
-      };
-      boundRealtime = true;
-      console.log('✅ SSE connected as fallback');
-    } catch (_) {}
-  }
-
-  // Final fallback: polling
-  if (!boundRealtime) {
-    console.log('⚠️ Using polling fallback');
-    setInterval(async () => {
-      if (!activeChat) return;
-      try {
-        const res = await fetch(`${API_BASE}/chats/${encodeURIComponent(activeChat.wa_id)}`);
-        const msgs = await res.json();
-        renderMessages(msgs);
-      } catch (_) {}
-    }, 3000);
+    startFallback();
   }
 
 loadChats();
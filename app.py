@@ -1,381 +1,541 @@
 import os
-import json
 import time
 import uuid
+import logging
 import eventlet
 from collections import defaultdict
-from flask import Flask, jsonify, request, send_from_directory, Response, stream_with_context
-from flask_socketio import SocketIO
+from urllib.parse import unquote
+from flask import Flask, jsonify, request, Response, stream_with_context, send_file
+from flask_socketio import SocketIO, emit, join_room, leave_room, rooms
 from flask_cors import CORS
-from pymongo import MongoClient
-from config import MONGO_URI
+from config import (MONGO_URI, MONGO_POOL_SIZE, MONGO_TIMEOUT_MS, MONGO_SOCKET_TIMEOUT_MS, MESSAGE_QUEUE,
+                    MEMORY_MAX_PER_CHAT, MEMORY_BUDGET_MB, LOCAL_DATA_DIR, LOCAL_SYNC, PAYLOADS_DIR,
+                    LOG_LEVEL, LOG_FORMAT, MEDIA_DIR, MEDIA_MAX_MB, ARCHIVE_DIR, ARCHIVE_AFTER_DAYS,
+                    ARCHIVE_INTERVAL_SECONDS)
+from app_logging import setup_logging
+from payload_index import PayloadIndex
+from ingest import iter_changes, message_doc, status_message_id
+from changes import ChangeLog, DEFAULT_SYNC_LIMIT, MAX_SYNC_LIMIT
+from sse_broker import SSEBroker
+from event_bus import make_bus, BusManager
+from status_scheduler import StatusScheduler
+from write_behind import WriteBehindQueue
+from memory_store import MemoryStore
+from log_store import LogStore
+from storage import Storage, MongoRepository, LocalRepository, PayloadRepository, make_mongo_client
+from search_index import SearchIndex, parse_search_cursor
+from http_cache import ConversationVersions, StaticAssets
+from typing_presence import TypingTracker, typer_id
+from media_store import MediaStore, MediaTooLarge, EmptyMedia, media_type
+from archive import Archive, Archiver
+from pagination import parse_limit, decode_cursor, paginate_list
 from datetime import datetime
-import queue
-from bson import json_util
+import fast_json
+from fast_json import Encoded, FastJSONProvider
+from metrics import REGISTRY, HTTP_LATENCY, GREENLETS, greenlet_stats
+
+BOOT_STARTED = time.monotonic()
+# Startup phase -> seconds after the imports above, for /ready
+startup = {}
+
+def mark_startup(phase):
+    startup[phase] = round(time.monotonic() - BOOT_STARTED, 3)
+
+# Before anything spawns, so /metrics counts every greenlet this worker starts
+GREENLETS.install()
+
+# Leveled logs, written by a background thread (see app_logging.py)
+setup_logging(LOG_LEVEL, LOG_FORMAT)
+log = logging.getLogger(__name__)
 
 # Initialize Flask app
-app = Flask(__name__, static_folder='Frontened', static_url_path='/Frontened')
+# /Frontened is served precompressed by static_assets below
+app = Flask(__name__, static_folder=None)
+# orjson when installed; jsonify, Socket.IO packets and SSE events share it (see fast_json.py)
+app.json = FastJSONProvider(app)
 CORS(app)  # Allow cross-origin requests for frontend
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet')
+# With several workers, emits and SSE events travel through a shared bus (see event_bus.py)
+event_bus = make_bus(MESSAGE_QUEUE)
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet', json=fast_json,
+                    **({'client_manager': BusManager(event_bus)} if event_bus is not None else {}))
+
+# Socket.IO rooms: events go only to the sockets that care about them
+#   chat:<wa_id>   sockets with that chat open (messages, ticks, typing)
+#   inbox:<wa_id>  sockets showing that chat in their sidebar (chat_updated)
+#   agent:<id>     every tab of one agent (echo of the agent's own sends)
+#   new_chats      every socket (chat_updated for conversations its sidebar may not list yet)
+NEW_CHATS_ROOM = 'new_chats'
+
+def chat_room(wa_id):
+    return f"chat:{wa_id}"
+
+def inbox_room(wa_id):
+    return f"inbox:{wa_id}"
+
+def agent_room(agent_id):
+    return f"agent:{agent_id}"
+
+def emit_typing_frame(wa_id, started, stopped):
+    socketio.emit('typing', {"wa_id": wa_id, "started": started, "stopped": stopped}, to=chat_room(wa_id))
+
+# Typing state per (sid, chat); only transitions go out, batched into frames
+typing_tracker = TypingTracker(emit_typing_frame)
 
 # Socket.IO event handlers
 @socketio.on('connect')
-def handle_connect():
-    print(f"✅ Client connected: {request.sid}")
+def handle_connect(auth=None):
+    agent_id = (auth or {}).get('agent_id') or request.args.get('agent_id')
+    if agent_id:
+        join_room(agent_room(agent_id))
+    join_room(NEW_CHATS_ROOM)
+    # Lets the client leave itself out of typing frames
+    emit('session', {"typing_id": typer_id(request.sid)})
+    log.debug("Client connected: %s", request.sid)
 
 @socketio.on('disconnect')
-def handle_disconnect():
-    print(f"❌ Client disconnected: {request.sid}")
+def handle_disconnect(*args):
+    typing_tracker.disconnect(request.sid)
+    log.debug("Client disconnected: %s", request.sid)
+
+@socketio.on('open_chat')
+def handle_open_chat(data):
+    # A socket has at most one chat open
+    wa_id = (data or {}).get('wa_id')
+    for room in rooms():
+        if room.startswith('chat:') and room != chat_room(wa_id):
+            leave_room(room)
+    if wa_id:
+        join_room(chat_room(wa_id))
+
+@socketio.on('watch_chats')
+def handle_watch_chats(data):
+    wa_ids = set((data or {}).get('wa_ids') or [])
+    for room in rooms():
+        if room.startswith('inbox:') and room[len('inbox:'):] not in wa_ids:
+            leave_room(room)
+    for wa_id in wa_ids:
+        join_room(inbox_room(wa_id))
 
 @socketio.on('typing_start')
 def handle_typing_start(data):
-    socketio.emit('typing_start', data, include_self=False)
+    wa_id = (data or {}).get('wa_id')
+    if isinstance(wa_id, str) and wa_id:
+        typing_tracker.start(request.sid, wa_id)
 
 @socketio.on('typing_stop')
 def handle_typing_stop(data):
-    socketio.emit('typing_stop', data, include_self=False)
+    wa_id = (data or {}).get('wa_id')
+    if isinstance(wa_id, str) and wa_id:
+        typing_tracker.stop(request.sid, wa_id)
+
+# Local store: serves everything without MongoDB and takes writes while it is down
+if LOCAL_DATA_DIR:
+    # Durable single-node store: survives restarts (see log_store.py)
+    local_store = LogStore(LOCAL_DATA_DIR, sync=LOCAL_SYNC)
+    log.info("Local log store: %d messages recovered from %s", local_store.stats()['messages'], LOCAL_DATA_DIR)
+else:
+    local_store = MemoryStore(MEMORY_MAX_PER_CHAT, MEMORY_BUDGET_MB * 1024 * 1024)
+
+# Contacts and messages parsed from PAYLOADS_DIR, refreshed incrementally (first loaded by warm_up)
+payload_index = PayloadIndex(PAYLOADS_DIR)
+
+# MongoDB client with explicit pool size and short timeouts (no I/O yet); the breaker fails over to local_store
+mongo_client = make_mongo_client(MONGO_URI, MONGO_POOL_SIZE, MONGO_TIMEOUT_MS, MONGO_SOCKET_TIMEOUT_MS) if MONGO_URI else None
+storage = Storage(
+    MongoRepository(mongo_client['whatsapp']) if mongo_client is not None else None,
+    LocalRepository(local_store, ChangeLog()),
+    PayloadRepository(payload_index),
+    PAYLOADS_DIR,
+    archive=Archive(ARCHIVE_DIR) if ARCHIVE_DIR else None,
+)
+# Moves old messages into the archive; started by warm_up once the hot tier is known.
+# The chats it touches get new ETags (archived messages stop counting as unread)
+archiver = Archiver(storage.archive, storage, ARCHIVE_AFTER_DAYS * 86400, ARCHIVE_INTERVAL_SECONDS,
+                    on_moved=lambda wa_ids: bump_versions(wa_ids)) if ARCHIVE_DIR else None
+
+# Attachments, stored once per content hash; messages carry only their ids
+media_store = MediaStore(MEDIA_DIR, MEDIA_MAX_MB * 1024 * 1024)
+# Objects never change, so clients may keep them
+MEDIA_MAX_AGE = 365 * 24 * 3600
+
+# Fan-out broker for SSE subscribers (/events)
+sse_broker = SSEBroker()
+SSE_KEEPALIVE_SECONDS = 15
+
+if event_bus is not None:
+    # Every worker (this one included) feeds bus events to its own SSE subscribers
+    event_bus.subscribe('sse', lambda m: sse_broker.publish(m['data'], topic=m.get('topic')))
+    if mongo_client is None:
+        log.warning("MESSAGE_QUEUE without MONGO_URI: each worker keeps its own in-memory messages")
+
+# Full-text search over message bodies, loaded in the background and kept current on every write
+search_index = SearchIndex()
+
+def build_search_index():
+    try:
+        n = search_index.build(storage.iter_messages())
+        log.info("Search index: %d messages in %.2fs", n, search_index.build_seconds)
+    except Exception as e:
+        log.exception("Search index build failed: %s", e)
+
+def warm_up():
+    """Load payload files, connect MongoDB (bootstrapping an empty database), then build the search index.
+
+    Runs after the worker starts serving. Until storage is ready, requests use the
+    local store and payload files, and /ready answers 503.
+    """
+    payload_index.refresh(force=True)
+    mark_startup('payloads_loaded')
+    storage.connect()
+    mark_startup('storage_ready')
+    # After connecting, so the index is built from MongoDB rather than the local store
+    build_search_index()
+    mark_startup('search_ready')
+    if archiver is not None:
+        archiver.start()
+
+eventlet.spawn(warm_up)
+
+if event_bus is not None:
+    # Writes made by any worker are indexed by all of them
+    event_bus.subscribe('search', lambda m: [search_index.add(msg) for msg in m['messages']])
+
+# Per-conversation version counters behind the ETags of /chats and /chats/<wa_id>
+versions = ConversationVersions()
+
+if event_bus is not None:
+    event_bus.subscribe('versions', lambda m: m['origin'] != versions.epoch and versions.bump(m['wa_ids']))
+
+def bump_versions(wa_ids):
+    """Invalidate cached chat list and history for these conversations, in every worker."""
+    wa_ids = list(set(wa_ids))
+    # Locally first, so this client's next GET already misses
+    versions.bump(wa_ids)
+    if event_bus is not None:
+        event_bus.publish('versions', {'origin': versions.epoch, 'wa_ids': wa_ids})
+
+def cache_context():
+    """Parts of an ETag besides the counters: which backend answers and the payload files' generation."""
+    payload_index.refresh()
+    return ('m' if storage.using_primary else 'l', payload_index.generation)
+
+def index_messages(msgs):
+    """Add newly stored messages to the search index (every worker's, when there are several)."""
+    slim = [{"id": m.get('id') or m.get('wamid'), "wa_id": m['wa_id'], "name": m.get('name'),
+             "timestamp": m.get('timestamp'), "text": m.get('text')} for m in msgs]
+    if event_bus is not None:
+        event_bus.publish('search', {'messages': slim})
+    else:
+        for m in slim:
+            search_index.add(m)
 
-# Connect to MongoDB
-try:
-    client = MongoClient(MONGO_URI)
-    # Test the connection
-    client.admin.command('ping')
-    print("✅ MongoDB connected successfully")
-except Exception as e:
-    print(f"❌ MongoDB connection failed: {e}")
-    # Create a fallback for demo purposes
-    client = None
+def publish_sse(data, topic=None):
+    if event_bus is not None:
+        event_bus.publish('sse', {'data': data, 'topic': topic})
+    else:
+        sse_broker.publish(data, topic=topic)
 
-db = client['whatsapp'] if client else None
-collection = db['processed_messages'] if db else None
+# ---- Status update helpers ----
 
-# In-memory fallback store when MongoDB is not available
-IN_MEMORY_MESSAGES = defaultdict(list)  # wa_id -> list[message]
+def apply_status_batch(transitions):
+    """Scheduler callback: write a tick's worth of ``(wa_id, message_id, status)`` and emit once per chat."""
+    latest = {}
+    for wa_id, message_id, status in transitions:
+        latest[message_id] = status
+    applied = []
+    try:
+        applied = storage.update_statuses(latest)
+    except Exception as e:
+        log.error("DB status update failed: %s", e)
+
+    by_chat = defaultdict(list)
+    for change in applied:
+        by_chat[change['wa_id']].append({"wa_id": change['wa_id'], "id": change['id'], "status": change['status']})
+    if by_chat:
+        bump_versions(by_chat)
+    for wa_id, updates in by_chat.items():
+        # Serialized once, then spliced into the Socket.IO packet and the SSE event
+        updates = Encoded(updates)
+        try:
+            socketio.emit('status_updates', {"wa_id": wa_id, "updates": updates}, to=chat_room(wa_id))
+        except Exception as e:
+            log.error("Socket.IO status emit failed: %s", e)
+        publish_sse(fast_json.dumps({"type": "status_updates", "updates": updates}), topic=wa_id)
 
-PAYLOADS_DIR = 'payloads'
 
-# In-memory queue for SSE events
-event_queue = queue.Queue()
+# Simulated delivered/read ticks and real receipts, applied in batches
+status_scheduler = StatusScheduler(apply_status_batch)
 
-# ---- Status update helpers ----
+# wa_ids whose chat_updated this worker has sent to NEW_CHATS_ROOM. Sidebars join a chat's
+# inbox room only once they list it, so the first message this worker sees of each chat goes
+# to every socket; a chat announced again by another worker or after a restart is harmless.
+announced_chats = set()
 
-def emit_status_update(wa_id: str, message_id: str, status: str):
-    # Update DB or in-memory store
-    updated_doc = None
-    if collection:
-        try:
-            collection.update_one({"$or": [{"id": message_id}, {"wamid": message_id}]}, {"$set": {"status": status}})
-            updated_doc = collection.find_one({"$or": [{"id": message_id}, {"wamid": message_id}]})
-        except Exception as e:
-            print(f"❌ DB status update failed: {e}")
-    else:
-        lst = IN_MEMORY_MESSAGES.get(wa_id, [])
-        for m in lst:
-            if m.get('id') == message_id or m.get('wamid') == message_id:
-                m['status'] = status
-                updated_doc = m
-                break
-    payload = {"wa_id": wa_id, "id": message_id, "status": status}
-    # Emit via websocket
+def emit_new_message(msg, agent_id=None):
+    """Push a new message to SSE subscribers, the chat's room and the sidebars watching it."""
+    wa_id = msg['wa_id']
+    # Serialized once, then spliced into the SSE event and the Socket.IO packet
+    event = Encoded(msg)
+    publish_sse(fast_json.dumps({"type": "new_message", "message": event}), topic=wa_id)
     try:
-        socketio.emit('status_update', payload)
+        targets = [chat_room(wa_id)] + ([agent_room(agent_id)] if agent_id else [])
+        socketio.emit('new_message', event, to=targets)
+        sidebars = [inbox_room(wa_id)]
+        if wa_id not in announced_chats:
+            announced_chats.add(wa_id)
+            sidebars.append(NEW_CHATS_ROOM)
+        socketio.emit('chat_updated', {
+            "wa_id": wa_id,
+            "last_message": (msg.get('text') or {}).get('body', ''),
+            "last_timestamp": msg['timestamp'],
+        }, to=sidebars)
     except Exception as e:
-        print(f"❌ Socket.IO status emit failed: {e}")
-    # Emit via SSE
-    try:
-        ev = json.dumps({"type": "status_update", "update": payload})
-    except TypeError:
-        ev = json_util.dumps({"type": "status_update", "update": payload})
-    event_queue.put(ev)
+        log.error("Socket.IO emit failed: %s", e)
 
 
-def simulate_delivery_and_read(wa_id: str, message_id: str):
+def emit_chat_read(wa_id, read_up_to, unread_count):
+    """One event for a whole read watermark, instead of a status update per message."""
+    event = Encoded({"wa_id": wa_id, "read_up_to": read_up_to, "unread_count": unread_count})
+    publish_sse(fast_json.dumps({"type": "chat_read", "read": event}), topic=wa_id)
     try:
-        eventlet.sleep(1.0)
-        emit_status_update(wa_id, message_id, 'delivered')
-        eventlet.sleep(1.0)
-        emit_status_update(wa_id, message_id, 'read')
+        socketio.emit('chat_read', event, to=[chat_room(wa_id), inbox_room(wa_id)])
     except Exception as e:
-        print(f"❌ Simulation error: {e}")
+        log.error("Socket.IO emit failed: %s", e)
 
-# ---- End helpers ----
 
-def get_contacts_from_json_files():
-    contacts = {}
-    print(f"Scanning directory: {PAYLOADS_DIR}")
-    for filename in os.listdir(PAYLOADS_DIR):
-        if filename.endswith('.json'):
-            filepath = os.path.join(PAYLOADS_DIR, filename)
-            print(f"Processing file: {filename}")
-            with open(filepath, 'r') as f:
-                try:
-                    data = json.load(f)
-                    if isinstance(data, dict) and 'metaData' in data and isinstance(data['metaData'], dict) and 'entry' in data['metaData'] and isinstance(data['metaData']['entry'], list):
-                        for entry in data['metaData']['entry']:
-                            if isinstance(entry, dict) and 'changes' in entry and isinstance(entry['changes'], list):
-                                for change in entry['changes']:
-                                    if isinstance(change, dict) and 'value' in change and isinstance(change['value'], dict) and 'contacts' in change['value'] and isinstance(change['value']['contacts'], list):
-                                        for contact_info in change['value']['contacts']:
-                                            if isinstance(contact_info, dict):
-                                                wa_id = contact_info.get('wa_id')
-                                                profile = contact_info.get('profile', {})
-                                                name = profile.get('name')
-                                                if wa_id and name and wa_id not in contacts:
-                                                    contacts[wa_id] = {'wa_id': wa_id, 'name': name}
-                                                    print(f"Found contact: {name} ({wa_id})")
-                except json.JSONDecodeError:
-                    print(f"Error decoding JSON from {filename}")
-                except Exception as e:
-                    print(f"An unexpected error occurred while processing {filename}: {e}")
-    
-    result = list(contacts.values())
-    print(f"Total contacts found: {len(result)}")
-    return result
-
-def bootstrap_db_from_payloads_if_empty():
-    if not collection:
-        print("❌ MongoDB not available, skipping bootstrap")
-        return
-        
-    try:
-        if collection.estimated_document_count() > 0:
-            return
-    except Exception:
-        # If count fails, try anyway
-        pass
+def flush_webhook_batch(items):
+    """Write-behind flush: store queued webhook messages, then hand their receipts to the scheduler.
 
-    # Minimal ingestion similar to process_payloads.py, but safe in-app
-    try:
-        for filename in os.listdir(PAYLOADS_DIR):
-            if not filename.endswith('.json'):
-                continue
-            filepath = os.path.join(PAYLOADS_DIR, filename)
-            with open(filepath, 'r', encoding='utf-8') as f:
-                try:
-                    data = json.load(f)
-                except json.JSONDecodeError:
-                    print(f"Failed to parse {filename}")
-                    continue
-
-            entry = data.get('metaData', {}).get('entry', [])
-            if not entry:
-                continue
-            for ent in entry:
-                changes = ent.get('changes', []) or []
-                for change in changes:
-                    value = change.get('value', {}) or {}
-                    contacts = (value.get('contacts') or [{}])
-                    first_contact = contacts[0] if contacts else {}
-                    wa_id = first_contact.get('wa_id') or 'unknown'
-                    profile_name = (first_contact.get('profile') or {}).get('name') or 'Unknown'
-
-                    # Insert messages
-                    for msg in value.get('messages', []) or []:
-                        msg_id = msg.get('id')
-                        if not msg_id:
-                            continue
-                        msg['wa_id'] = wa_id
-                        msg['name'] = profile_name
-                        msg['status'] = msg.get('status') or 'sent'
-                        msg['wamid'] = msg_id
-
-                        # Check if message already exists
-                        existing = collection.find_one({"wamid": msg_id})
-                        if not existing:
-                            collection.insert_one(msg)
-                            print(f"Inserted message {msg_id}")
-
-                    # Update statuses
-                    for status in value.get('statuses', []) or []:
-                        meta_id = status.get("id") or status.get("meta", {}).get("meta_msg_id")
-                        new_status = status.get("status")
-                        if meta_id and new_status:
-                            result = collection.update_one(
-                                {"wamid": meta_id},
-                                {"$set": {"status": new_status}}
-                            )
-                            if result.matched_count:
-                                print(f"Updated message {meta_id} to status {new_status}")
-    except Exception as e:
-        print(f"❌ Bootstrap error: {e}")
+    Retried whole when it raises; messages are deduplicated by wamid, so that is safe.
+    """
+    docs = [doc for kind, doc in items if kind == 'message']
+    if docs:
+        storage.append_messages(docs)
+        bump_versions(doc['wa_id'] for doc in docs)
+        index_messages(docs)
+    # After the messages they refer to are stored, so no receipt arrives first
+    for kind, receipt in items:
+        if kind == 'status':
+            status_scheduler.receipt(*receipt)
+
+
+# Webhook deliveries are acknowledged immediately and written here in batches
+webhook_queue = WriteBehindQueue(flush_webhook_batch)
 
+# Frontend files, loaded once with gzip/brotli variants and content-hashed URLs
+static_assets = StaticAssets(os.path.join(app.root_path, 'Frontened'))
+
+# ---- End helpers ----
+
+def socketio_stats():
+    """Engine.IO sessions on this worker and their outgoing packet queues."""
+    depths = [s.queue.qsize() for s in list(socketio.server.eio.sockets.values())]
+    return {"connections": len(depths), "queued_packets": sum(depths), "max_queue_depth": max(depths, default=0)}
+
+def storage_metrics():
+    stats = storage.stats()
+    return {"using_mongo": int(storage.using_primary), "breaker_trips": stats['breaker']['trips'],
+            "pending_reconcile_messages": stats['pending_reconcile']['messages'],
+            "pending_reconcile_statuses": stats['pending_reconcile']['statuses'],
+            "pending_reconcile_reads": stats['pending_reconcile']['reads']}
+
+# Everything below is read at scrape time from the components' own counters
+REGISTRY.add_stats('socketio', socketio_stats)
+REGISTRY.add_stats('sse', sse_broker.stats, counters=('published', 'delivered', 'dropped'))
+if event_bus is not None:
+    REGISTRY.add_stats('event_bus', event_bus.stats, counters=('published', 'received', 'dropped'))
+REGISTRY.add_stats('webhook_queue', webhook_queue.stats,
+                   counters=('accepted', 'rejected', 'flushed', 'batches', 'errors', 'retries', 'dropped'))
+REGISTRY.add_stats('status_scheduler', status_scheduler.stats,
+                   counters=('scheduled', 'applied', 'cancelled', 'batches', 'errors'))
+REGISTRY.add_stats('typing', typing_tracker.stats,
+                   counters=('received', 'rate_limited', 'ignored_repeats', 'expired', 'transitions_emitted',
+                             'frames_emitted', 'errors'))
+REGISTRY.add_stats('storage', storage_metrics, counters=('breaker_trips',))
+REGISTRY.add_stats('local_store', local_store.stats, counters=('evicted_conversations', 'evicted_messages', 'appended', 'commits'))
+REGISTRY.add_stats('search', search_index.stats, counters=('queries',))
+REGISTRY.add_stats('http_cache', versions.stats, counters=('not_modified', 'full_responses'))
+REGISTRY.add_stats('media', media_store.stats, counters=('uploads', 'deduplicated', 'bytes_written',
+                                                        'rejected_too_large', 'thumbnails_made', 'thumbnail_hits'))
+if archiver is not None:
+    REGISTRY.add_stats('archive', archiver.stats, counters=('segments_written', 'rows_written', 'bytes_written',
+                                                            'segment_reads', 'cache_hits', 'runs', 'skipped_runs', 'moved'))
+REGISTRY.add_stats('eventlet', greenlet_stats, counters=('greenlets_started',))
+
+@app.before_request
+def start_timer():
+    request.environ['app.t0'] = time.perf_counter()
+
+@app.after_request
+def record_latency(resp):
+    t0 = request.environ.get('app.t0')
+    if t0 is not None:
+        # Route templates, not paths, so one series per endpoint
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        HTTP_LATENCY.observe(time.perf_counter() - t0, request.method, route, resp.status_code)
+    return resp
 
 @app.route('/')
 def serve_index():
-    return send_from_directory('Frontened', 'index.html')
+    return static_assets.response('index.html')
+
+@app.route('/Frontened/<path:filename>')
+def serve_static(filename):
+    resp = static_assets.response(filename)
+    if resp is None:
+        return jsonify({"error": "not found"}), 404
+    return resp
 
 @app.route('/test')
 def test():
-    return jsonify({"status": "ok", "message": "Flask app is working", "mongo_connected": collection is not None})
+    return jsonify({"status": "ok", "message": "Flask app is working", "mongo_connected": storage.using_primary})
 
-def get_messages_from_payloads(wa_id: str):
-    messages = []
-    try:
-        for filename in os.listdir(PAYLOADS_DIR):
-            if not filename.endswith('.json'):
-                continue
-            filepath = os.path.join(PAYLOADS_DIR, filename)
-            with open(filepath, 'r', encoding='utf-8') as f:
-                try:
-                    data = json.load(f)
-                except json.JSONDecodeError:
-                    continue
-            for ent in (data.get('metaData', {}).get('entry', []) or []):
-                for change in (ent.get('changes', []) or []):
-                    value = change.get('value', {}) or {}
-                    contacts = (value.get('contacts') or [{}])
-                    first_contact = contacts[0] if contacts else {}
-                    file_wa_id = first_contact.get('wa_id')
-                    name = (first_contact.get('profile') or {}).get('name') or 'Unknown'
-                    if not file_wa_id or file_wa_id != wa_id:
-                        continue
-                    for msg in (value.get('messages') or []):
-                        m = dict(msg)
-                        m['wa_id'] = wa_id
-                        m['name'] = name
-                        m['wamid'] = msg.get('id')
-                        m['status'] = m.get('status') or 'sent'
-                        messages.append(m)
-        # sort by timestamp if present
-        def to_num(ts):
-            try:
-                return float(ts)
-            except Exception:
-                return 0.0
-        messages.sort(key=lambda m: to_num(m.get('timestamp')), reverse=False)
-    except Exception as e:
-        print(f"Failed to read messages from payloads: {e}")
-    return messages
-
-
-# Helper to merge and dedupe messages by id/wamid
-
-def merge_dedupe_messages(payload_msgs, memory_msgs):
-    deduped = []
-    seen = set()
-    for msg in (payload_msgs + memory_msgs):
-        key = msg.get('id') or msg.get('wamid') or (msg.get('text',{}).get('body'), msg.get('timestamp'))
-        if key in seen:
-            continue
-        seen.add(key)
-        deduped.append(msg)
-    # sort by timestamp if present
-    try:
-        deduped.sort(key=lambda m: float(m.get('timestamp', 0)))
-    except Exception:
-        pass
-    return deduped
+@app.route('/health')
+def health():
+    """Liveness: the worker answers, whatever the state of its backends."""
+    return jsonify({"status": "ok", "uptime_s": round(time.monotonic() - BOOT_STARTED, 3)})
+
+@app.route('/ready')
+def ready():
+    """Readiness: 503 until the first MongoDB connection attempt (and bootstrap ingest) has finished."""
+    is_ready = storage.state != 'connecting'
+    return jsonify({"ready": is_ready, "storage": storage.state, "startup": startup}), 200 if is_ready else 503
 
 @app.route('/chats', methods=['GET'])
 def get_chats():
-    print("=== /chats endpoint called ===")
+    etag = versions.list_etag(*cache_context())
+    cached = versions.not_modified(etag)
+    if cached is not None:
+        return cached
     try:
-        # Ensure DB has messages from payloads on first run
-        bootstrap_db_from_payloads_if_empty()
-        
-        if not collection:
-            print("❌ MongoDB not available, building chats from payload+memory")
-            json_contacts = get_contacts_from_json_files()
-            all_chats = []
-            for contact in json_contacts:
-                wa_id = contact['wa_id']
-                payload_msgs = get_messages_from_payloads(wa_id)
-                memory_msgs = IN_MEMORY_MESSAGES.get(wa_id, [])
-                merged = merge_dedupe_messages(payload_msgs, memory_msgs)
-                last_msg = merged[-1] if merged else None
-                all_chats.append({
-                    "wa_id": wa_id,
-                    "name": contact['name'],
-                    "last_message": (last_msg or {}).get('text',{}).get('body',''),
-                    "last_timestamp": (last_msg or {}).get('timestamp',''),
-                    "unread_count": 0
-                })
-            print(f"Total chats to return (fallback): {len(all_chats)}")
-            return jsonify(all_chats)
-        
-        # Since MongoDB Atlas doesn't allow aggregation, we'll use a simple approach
-        all_docs = list(collection.find())
-        print(f"Total documents in MongoDB: {len(all_docs)}")
-        chat_groups = {}
-        for doc in all_docs:
-            wa_id = doc.get('wa_id')
-            if not wa_id:
-                continue
-            group = chat_groups.setdefault(wa_id, {
-                '_id': wa_id,
-                'name': doc.get('name', 'Unknown'),
-                'last_message': '',
-                'last_timestamp': 0,
-                'unread_count': 0
-            })
-            ts = doc.get('timestamp', 0)
-            try:
-                ts = float(ts)
-            except Exception:
-                ts = 0
-            if ts >= group['last_timestamp']:
-                group['last_message'] = (doc.get('text') or {}).get('body','')
-                group['last_timestamp'] = ts
-            if doc.get('status') != 'read':
-                group['unread_count'] += 1
-        mongo_chats = list(chat_groups.values())
+        all_chats = storage.conversations()
     except Exception as e:
-        print(f"❌ MongoDB error: {e}")
-        mongo_chats = []
-
-    # Merge with contacts to ensure every contact appears
-    chat_dict = {c['_id']: c for c in mongo_chats}
-    json_contacts = get_contacts_from_json_files()
-    all_chats = []
-    for contact in json_contacts:
-        wa_id = contact['wa_id']
-        if wa_id in chat_dict:
-            c = chat_dict[wa_id]
-            all_chats.append({
-                "wa_id": c['_id'],
-                "name": c.get('name','Unknown'),
-                "last_message": c.get('last_message',''),
-                "last_timestamp": c.get('last_timestamp',''),
-                "unread_count": c.get('unread_count',0)
-            })
-        else:
-            all_chats.append({
-                "wa_id": wa_id,
-                "name": contact['name'],
-                "last_message": '',
-                "last_timestamp": '',
-                "unread_count": 0
-            })
-    print(f"Total chats to return: {len(all_chats)}")
-    return jsonify(all_chats)
+        log.error("Error listing chats: %s", e)
+        return jsonify({"error": "chats unavailable"}), 503
+    log.debug("Total chats to return: %d", len(all_chats))
+    return versions.tag(jsonify(all_chats), etag)
+
+def parse_page_args(args):
+    """Return (limit, before, after) from the query string, or None if no paging was requested."""
+    if not any(k in args for k in ('limit', 'before', 'after')):
+        return None
+    limit = parse_limit(args.get('limit'))
+    before = decode_cursor(args['before']) if args.get('before') else None
+    after = decode_cursor(args['after']) if args.get('after') else None
+    return limit, before, after
 
 @app.route('/chats/<wa_id>', methods=['GET'])
 def get_messages(wa_id):
-    if not collection:
-        print(f"⚠️ MongoDB not available, using payload+memory for {wa_id}")
-        payload_msgs = get_messages_from_payloads(wa_id)
-        memory_msgs = IN_MEMORY_MESSAGES.get(wa_id, [])
-        messages = merge_dedupe_messages(payload_msgs, memory_msgs)
-        return Response(json_util.dumps(messages), mimetype='application/json')
-    
+    # ?limit=&before=&after= returns one page plus cursors; no params returns the whole history
+    try:
+        page_args = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Answered from the version counter alone when the client's copy is current
+    etag = versions.chat_etag(wa_id, *cache_context())
+    cached = versions.not_modified(etag)
+    if cached is not None:
+        return cached
     try:
-        messages = list(collection.find({"wa_id": wa_id}).sort("timestamp", 1))
-        for m in messages:
-            m["_id"] = str(m["_id"])  # Convert ObjectId to string for frontend
-        if not messages:
-            # Fallback to payloads if empty in DB
-            messages = get_messages_from_payloads(wa_id)
-        return Response(json_util.dumps(messages), mimetype='application/json')
+        if page_args:
+            return versions.tag(jsonify(storage.history_page(wa_id, *page_args)), etag)
+        return versions.tag(jsonify(storage.history(wa_id)), etag)
     except Exception as e:
-        print(f"❌ DB error on get_messages: {e}")
-        messages = get_messages_from_payloads(wa_id)
-        return Response(json_util.dumps(messages), mimetype='application/json')
+        log.error("DB error on get_messages: %s", e, extra={"wa_id": wa_id})
+        messages = storage.payloads.history(wa_id)
+        if page_args:
+            return jsonify(paginate_list(messages, *page_args))
+        return jsonify(messages)
+
+@app.route('/chats/<wa_id>/read', methods=['POST'])
+def mark_chat_read(wa_id):
+    """Mark every message up to ``timestamp`` (default: now) read. The watermark only moves forward."""
+    data = request.get_json(silent=True) or {}
+    try:
+        up_to = float(data['timestamp']) if data.get('timestamp') is not None else datetime.now().timestamp()
+    except (TypeError, ValueError):
+        return jsonify({"error": "timestamp must be a number"}), 400
+    try:
+        result = storage.mark_read(wa_id, up_to)
+    except Exception as e:
+        log.error("DB error on mark_read: %s", e, extra={"wa_id": wa_id})
+        return jsonify({"error": "read receipts unavailable"}), 503
+    if result['marked']:
+        bump_versions([wa_id])
+        emit_chat_read(wa_id, result['read_up_to'], result['unread_count'])
+    return jsonify(dict(result, wa_id=wa_id))
+
+@app.route('/media', methods=['POST'])
+def upload_media():
+    """Store the raw request body (Content-Type is kept; X-Filename, URL-encoded, is optional). Same bytes, same id."""
+    if (request.content_length or 0) > media_store.max_bytes:
+        return jsonify({"error": f"attachments are limited to {MEDIA_MAX_MB} MB"}), 413
+    if request.content_length == 0:
+        return jsonify({"error": "empty upload"}), 400
+    try:
+        info = media_store.save(request.stream, request.mimetype, unquote(request.headers.get('X-Filename') or ''))
+    except MediaTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except EmptyMedia as e:
+        return jsonify({"error": str(e)}), 400
+    except OSError as e:
+        log.error("Media upload failed: %s", e)
+        return jsonify({"error": "media storage unavailable"}), 503
+    return jsonify(dict(info, type=media_type(info['mime_type']))), 201
+
+def media_response(path, mime_type, media_id, download_name=None):
+    # Range, If-None-Match and If-Range come from send_file; whole files go out through the
+    # server's file wrapper (sendfile under gunicorn)
+    resp = send_file(path, mimetype=mime_type, conditional=True, etag=media_id, max_age=MEDIA_MAX_AGE,
+                     as_attachment=download_name is not None, download_name=download_name)
+    resp.cache_control.immutable = True
+    # Uploaded content must not run as a page of this origin
+    resp.headers['X-Content-Type-Options'] = 'nosniff'
+    resp.headers['Content-Security-Policy'] = 'sandbox'
+    return resp
+
+@app.route('/media/<media_id>')
+def download_media(media_id):
+    info = media_store.info(media_id)
+    if info is None:
+        return jsonify({"error": "not found"}), 404
+    inline = media_type(info['mime_type']) != 'document'
+    return media_response(media_store.path(media_id), info['mime_type'], media_id,
+                          None if inline else (info.get('filename') or media_id))
+
+@app.route('/media/<media_id>/thumbnail')
+def media_thumbnail(media_id):
+    try:
+        size = int(request.args.get('size') or 320)
+    except ValueError:
+        return jsonify({"error": "size must be a number"}), 400
+    path = media_store.thumbnail(media_id, size)
+    if path is None:
+        return jsonify({"error": "no thumbnail"}), 404
+    return media_response(path, 'image/jpeg', f"{media_id}-{size}")
+
+@app.route('/archive/stats')
+def archive_stats():
+    if archiver is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(archiver.stats(), enabled=True))
+
+@app.route('/media/stats')
+def media_stats():
+    return jsonify(media_store.stats())
 
 @app.route('/messages', methods=['POST'])
 def send_message():
     data = request.json
-    if not data.get("wa_id") or not data.get("text"):
-        return jsonify({"error": "wa_id and text are required"}), 400
+    # Attachments are uploaded to /media first and referenced here by id
+    media = None
+    if data.get("media_id"):
+        media = media_store.info(data["media_id"])
+        if media is None:
+            return jsonify({"error": "unknown media_id"}), 400
+    if not data.get("wa_id") or not (data.get("text") or media):
+        return jsonify({"error": "wa_id and text or media_id are required"}), 400
 
     # Use client-provided id if present to avoid duplicates
     provided_id = data.get('client_id')
@@ -386,64 +546,171 @@ def send_message():
         "wa_id": data["wa_id"],
         "name": data.get("name", "You"),
         "timestamp": datetime.now().timestamp(),
-        "text": {"body": data["text"]},
-        "type": "text",
+        "text": {"body": data.get("text") or ''},
+        "type": media_type(media['mime_type']) if media else "text",
         "status": "sent",
         "wamid": unique_id
     }
+    if media:
+        new_message['media'] = media
 
     new_message_copy = new_message
 
-    # Try to save to MongoDB; else save to memory
-    if collection:
-        try:
-            collection.insert_one(new_message)
-            print(f"✅ Message saved to MongoDB: {new_message['id']}")
-        except Exception as e:
-            print(f"❌ DB insert failed: {e}")
-    else:
-        messages = IN_MEMORY_MESSAGES[new_message['wa_id']]
-        # dedupe in memory
-        if not any((m.get('id') == unique_id or m.get('wamid') == unique_id) for m in messages):
-            messages.append(new_message)
-        print(f"💾 Stored in memory: {new_message['id']}")
-
-    # Realtime notifications
+    # MongoDB while it is healthy, else the local store
     try:
-        event_json = json.dumps({"type": "new_message", "message": new_message_copy})
-    except TypeError:
-        event_json = json_util.dumps({"type": "new_message", "message": new_message_copy})
-    event_queue.put(event_json)
-    try:
-        socketio.emit('new_message', new_message_copy)
+        if storage.append_message(new_message):
+            bump_versions([new_message['wa_id']])
+            index_messages([new_message])
+            log.debug("Message saved: %s", new_message['id'])
+        else:
+            log.debug("Message already stored: %s", new_message['id'])
     except Exception as e:
-        print(f"❌ Socket.IO emit failed: {e}")
+        log.error("DB insert failed: %s", e, extra={"message_id": new_message['id']})
+
+    # Realtime notifications
+    emit_new_message(new_message_copy, agent_id=data.get('agent_id'))
 
     # simulate delivered/read updates shortly after send
-    try:
-        eventlet.spawn_n(simulate_delivery_and_read, new_message_copy['wa_id'], new_message_copy['id'])
-    except Exception as e:
-        print(f"❌ Could not schedule status simulation: {e}")
+    status_scheduler.schedule_lifecycle(new_message_copy['wa_id'], new_message_copy['id'])
 
     return jsonify({"message": "Message stored successfully", "id": unique_id}), 201
 
+@app.route('/webhook', methods=['POST'])
+def webhook():
+    """Receive a WhatsApp webhook delivery (same shape as the files in payloads/)."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "JSON body required"}), 400
+    # Accept the payload-file wrapper as well as the bare {"entry": [...]} body
+    if 'metaData' not in data:
+        data = {'metaData': data}
+
+    items = []
+    for wa_id, profile_name, value in iter_changes(data):
+        for msg in value.get('messages', []) or []:
+            doc = message_doc(msg, wa_id, profile_name)
+            if doc is not None:
+                items.append(('message', doc))
+        for status in value.get('statuses', []) or []:
+            message_id = status_message_id(status)
+            if message_id and status.get('status'):
+                items.append(('status', (status.get('recipient_id') or wa_id, message_id, status['status'])))
+
+    if not webhook_queue.offer(items):
+        # Full queue: the provider retries later
+        return jsonify({"error": "busy, retry later"}), 503
+    for kind, doc in items:
+        if kind == 'message':
+            emit_new_message(doc)
+    return jsonify({"received": len(items)}), 200
+
+@app.route('/webhook/stats')
+def webhook_stats():
+    return jsonify(webhook_queue.stats())
+
+@app.route('/sync')
+def sync():
+    """Messages and status transitions after ?since=<seq>; without since, just the current seq."""
+    try:
+        since = request.args.get('since')
+        limit = min(int(request.args.get('limit') or DEFAULT_SYNC_LIMIT), MAX_SYNC_LIMIT)
+        if limit <= 0:
+            raise ValueError("limit must be positive")
+        since = int(since) if since not in (None, '') else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        if since is None:
+            return jsonify({"seq": storage.current_seq()})
+        return jsonify(storage.changes_since(since, limit))
+    except Exception as e:
+        log.error("DB error on sync: %s", e)
+        return jsonify({"error": "sync unavailable"}), 503
+
 @app.route('/events')
 def events():
+    # ?wa_id=<id> (repeatable) limits the stream to those conversations
+    topics = request.args.getlist('wa_id') or None
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0) or None
+    except ValueError:
+        last_event_id = None
+    subscription = sse_broker.subscribe(topics, last_event_id)
+
     @stream_with_context
     def event_stream():
-        while True:
-            try:
-                # Wait for new events, with a timeout
-                event = event_queue.get(timeout=1) 
-                yield f"data: {event}\\n\\n"
-            except queue.Empty:
-                # Send a keep-alive comment if no events
-                yield ": ping\\n\\n"
-            time.sleep(0.5) # Small delay to prevent busy-waiting
-
-    return Response(event_stream(), mimetype="text/event-stream")
-
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                event = subscription.get(timeout=SSE_KEEPALIVE_SECONDS)
+                if event is None:
+                    # Send a keep-alive comment if no events
+                    yield ": ping\n\n"
+                else:
+                    yield event.encode()
+        finally:
+            subscription.close()
+
+    return Response(event_stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route('/memory/stats')
+def memory_stats():
+    return jsonify(local_store.stats())
+
+@app.route('/search')
+def search():
+    """Messages whose text contains every word of ``q`` (the last word as a prefix), newest first."""
+    q = (request.args.get('q') or '').strip()
+    if not q:
+        return jsonify({"error": "q is required"}), 400
+    try:
+        limit = parse_limit(request.args.get('limit') or '20')
+        before = parse_search_cursor(request.args.get('before'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    t0 = time.perf_counter()
+    page = search_index.search(q, limit=limit, before=before, wa_id=request.args.get('wa_id') or None)
+    page['took_ms'] = round((time.perf_counter() - t0) * 1000, 3)
+    return jsonify(page)
+
+@app.route('/search/stats')
+def search_stats():
+    return jsonify(search_index.stats())
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify({"conversations": versions.stats(), "static": static_assets.stats()})
+
+@app.route('/storage/stats')
+def storage_stats():
+    return jsonify(storage.stats())
+
+@app.route('/typing/stats')
+def typing_stats():
+    return jsonify(typing_tracker.stats())
+
+@app.route('/statuses/stats')
+def statuses_stats():
+    return jsonify(status_scheduler.stats())
+
+@app.route('/metrics')
+def metrics():
+    """This worker's metrics in the Prometheus text format."""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/events/stats')
+def events_stats():
+    stats = sse_broker.stats()
+    if event_bus is not None:
+        stats['bus'] = event_bus.stats()
+    return jsonify(stats)
+
+
+mark_startup('imported')
 
 if __name__ == '__main__':
     # Disable reloader to avoid Windows socket errors and ensure stable dev server
-    socketio.run(app, host='0.0.0.0', port=5000, debug=True, use_reloader=False)
+    # minimum_chunk_size=0: eventlet.wsgi otherwise holds back SSE frames smaller than 4 KiB
+    socketio.run(app, host='0.0.0.0', port=5000, debug=True, use_reloader=False, minimum_chunk_size=0)
@@ -0,0 +1,118 @@
+"""Leveled, structured logging written by a background OS thread.
+
+``setup_logging()`` installs one handler on the root logger. On the
+calling greenlet it only resolves the message and puts the record on a
+queue; a native thread (not a green one, even under eventlet's
+monkey-patching) formats and writes it, so a slow stdout never blocks
+request handling.
+
+Fields passed as ``extra={...}`` are kept: ``key=value`` after the
+message with LOG_FORMAT=text, or top-level keys with LOG_FORMAT=json.
+"""
+import sys
+import time
+import atexit
+import logging
+
+from eventlet import patcher
+
+import fast_json
+
+_threading = patcher.original('threading')
+_queue = patcher.original('queue')
+
+# Attributes every LogRecord has; anything else came in through ``extra``
+_STANDARD = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'taskName'}
+_STOP = object()
+# Libraries that log every command or packet at DEBUG
+CHATTY_LOGGERS = ('pymongo', 'engineio', 'socketio', 'urllib3')
+
+
+def _fields(record):
+    return {k: v for k, v in vars(record).items() if k not in _STANDARD}
+
+
+def format_text(record):
+    ts = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record.created))
+    line = f"{ts}.{int(record.msecs):03d} {record.levelname:<7} {record.name}: {record.msg}"
+    fields = _fields(record)
+    if fields:
+        line += ' ' + ' '.join(f"{k}={v}" for k, v in fields.items())
+    if record.exc_text:
+        line += '\n' + record.exc_text
+    return line
+
+
+def format_json(record):
+    entry = {
+        "ts": round(record.created, 3),
+        "level": record.levelname.lower(),
+        "logger": record.name,
+        "msg": record.msg,
+    }
+    entry.update(_fields(record))
+    if record.exc_text:
+        entry["exc"] = record.exc_text
+    return fast_json.dumps(entry)
+
+
+class BackgroundHandler(logging.Handler):
+    def __init__(self, stream=None, fmt='text'):
+        super().__init__()
+        self.stream = stream or sys.stdout
+        self.format_record = format_json if fmt == 'json' else format_text
+        self._queue = _queue.SimpleQueue()
+        self._thread = _threading.Thread(target=self._write_loop, name='log-writer', daemon=True)
+        self._thread.start()
+
+    def emit(self, record):
+        # Resolve %-args and the traceback now, while they are still valid
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self._queue.put(record)
+
+    def _write_loop(self):
+        while True:
+            record = self._queue.get()
+            if record is _STOP:
+                break
+            try:
+                self.stream.write(self.format_record(record) + '\n')
+                # Drain whatever queued up meanwhile before flushing once
+                while True:
+                    try:
+                        record = self._queue.get_nowait()
+                    except _queue.Empty:
+                        break
+                    if record is _STOP:
+                        self.stream.flush()
+                        return
+                    self.stream.write(self.format_record(record) + '\n')
+                self.stream.flush()
+            except Exception:
+                pass
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._thread.join(timeout=2.0)
+        super().close()
+
+
+_handler = None
+
+
+def setup_logging(level='INFO', fmt='text'):
+    """Route all logging through one BackgroundHandler. Safe to call more than once."""
+    global _handler
+    root = logging.getLogger()
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    for name in CHATTY_LOGGERS:
+        logging.getLogger(name).setLevel(max(root.level, logging.INFO))
+    if _handler is None:
+        _handler = BackgroundHandler(fmt=fmt)
+        root.addHandler(_handler)
+        atexit.register(_handler.close)
+    return _handler
@@ -0,0 +1,367 @@
+"""Cold tier: old messages in compressed, columnar, per-conversation segments.
+
+The ``Archiver`` runs in the background. It moves messages older than
+ARCHIVE_AFTER_DAYS out of the hot tier (MongoDB's ``processed_messages``,
+or the local store) into ARCHIVE_DIR. ``Storage.history_page`` reads
+through to the archive when a page goes past the oldest hot message.
+
+Layout of ARCHIVE_DIR:
+
+    archiver.lock              held by whichever worker is archiving
+    <wa_id>/index.json         the sparse timestamp index: one entry per segment,
+                               {file, first, last, rows}, first/last = [timestamp, wamid]
+    <wa_id>/00000001.seg       up to SEGMENT_ROWS messages in (timestamp, wamid) order
+
+A segment is ``MAGIC``, a u32 header length, a JSON header
+``{rows, columns: [[name, length], ...]}`` and then one zlib block per
+column. Timestamps are packed doubles; the other columns are JSON lists,
+so similar values compress together. A page read uses the index to pick
+the segments that can hold rows past its cursor and decodes only those.
+Segments are immutable; a small LRU keeps recently decoded ones.
+
+Archived messages are read-only (late status updates no longer reach
+them) and stop counting towards a chat's unread_count. The newest
+message of every chat stays in the hot tier.
+
+Usage:
+    python archive.py stats <dir>
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import fcntl
+import struct
+import logging
+from array import array
+from collections import OrderedDict
+from urllib.parse import quote
+
+import eventlet
+from eventlet import tpool
+
+from pagination import message_key
+
+log = logging.getLogger(__name__)
+
+MAGIC = b'WAS1'
+HEADER_LEN = struct.Struct('<I')
+SEGMENT_ROWS = 1000
+DECODED_CACHE_SEGMENTS = 64
+# Stored in their own columns; anything else a message carries goes in ``extra``
+_COLUMNS = ('wamid', 'id', 'from', 'name', 'type', 'status', 'text')
+_DROPPED = frozenset(('_id', 'seq', 'created_seq'))
+
+
+def _dir_name(wa_id):
+    name = quote(str(wa_id), safe='')
+    return '%2E' + name[1:] if name.startswith('.') else name
+
+
+def _ts(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def encode_segment(docs):
+    """Serialize messages (sorted by key) into one segment. Returns the bytes."""
+    timestamps = array('d', (_ts(d.get('timestamp')) for d in docs))
+    columns = [('timestamp', timestamps.tobytes())]
+    for name in _COLUMNS:
+        if name == 'id':
+            # Usually equal to wamid; stored only when it differs
+            values = [d.get('id') if d.get('id') != d.get('wamid') else None for d in docs]
+        elif name == 'text':
+            values = [(d.get('text') or {}).get('body', '') for d in docs]
+        else:
+            values = [d.get(name) for d in docs]
+        columns.append((name, json.dumps(values, separators=(',', ':'), default=str).encode()))
+    extra = [{k: v for k, v in d.items() if k not in _COLUMNS and k not in _DROPPED and k not in ('timestamp', 'wa_id')}
+             or None for d in docs]
+    columns.append(('extra', json.dumps(extra, separators=(',', ':'), default=str).encode()))
+    blocks = [(name, zlib.compress(data, 6)) for name, data in columns]
+    header = json.dumps({'rows': len(docs), 'columns': [[name, len(block)] for name, block in blocks]}).encode()
+    return b''.join([MAGIC, HEADER_LEN.pack(len(header)), header] + [block for _, block in blocks])
+
+
+def decode_segment(data, wa_id):
+    """The messages of one segment, in key order."""
+    if data[:4] != MAGIC:
+        raise ValueError("not an archive segment")
+    (header_len,) = HEADER_LEN.unpack_from(data, 4)
+    offset = 4 + HEADER_LEN.size
+    header = json.loads(data[offset:offset + header_len])
+    offset += header_len
+    columns = {}
+    for name, length in header['columns']:
+        raw = zlib.decompress(data[offset:offset + length])
+        offset += length
+        if name == 'timestamp':
+            columns[name] = array('d', raw)
+        else:
+            columns[name] = json.loads(raw)
+    docs = []
+    for i in range(header['rows']):
+        doc = dict(columns['extra'][i] or ())
+        wamid = columns['wamid'][i]
+        doc.update({
+            'id': columns['id'][i] or wamid,
+            'wamid': wamid,
+            'wa_id': wa_id,
+            'name': columns['name'][i],
+            'timestamp': columns['timestamp'][i],
+            'text': {'body': columns['text'][i]},
+            'type': columns['type'][i] or 'text',
+            'status': columns['status'][i] or 'sent',
+        })
+        if columns['from'][i] is not None:
+            doc['from'] = columns['from'][i]
+        docs.append(doc)
+    return docs
+
+
+class Archive:
+    """Reads and appends the segment files under ``root``. See the module docstring."""
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._indexes = {}                # wa_id -> ((inode, mtime_ns) of index.json, [entry, ...])
+        self._decoded = OrderedDict()     # segment path -> docs, least recently used first
+        self.segments_written = 0
+        self.rows_written = 0
+        self.bytes_written = 0
+        self.raw_bytes_written = 0
+        self.segment_reads = 0
+        self.cache_hits = 0
+
+    def _chat_dir(self, wa_id):
+        return os.path.join(self.root, _dir_name(wa_id))
+
+    def _entries(self, wa_id):
+        """Index entries of a chat with tuple keys; re-read when another worker rewrote the file."""
+        path = os.path.join(self._chat_dir(wa_id), 'index.json')
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self._indexes.pop(wa_id, None)
+            return []
+        # Every rewrite is a rename, so the inode changes even within one mtime tick
+        version = (st.st_ino, st.st_mtime_ns)
+        cached = self._indexes.get(wa_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        with open(path, encoding='utf-8') as f:
+            entries = json.load(f)['segments']
+        for e in entries:
+            e['first'], e['last'] = tuple(e['first']), tuple(e['last'])
+        self._indexes[wa_id] = (version, entries)
+        return entries
+
+    def _segment(self, wa_id, entry):
+        path = os.path.join(self._chat_dir(wa_id), entry['file'])
+        docs = self._decoded.get(path)
+        if docs is not None:
+            self._decoded.move_to_end(path)
+            self.cache_hits += 1
+            return docs
+        with open(path, 'rb') as f:
+            docs = decode_segment(f.read(), wa_id)
+        self.segment_reads += 1
+        self._decoded[path] = docs
+        if len(self._decoded) > DECODED_CACHE_SEGMENTS:
+            self._decoded.popitem(last=False)
+        return docs
+
+    # --- writes ------------------------------------------------------------
+
+    def append(self, wa_id, docs):
+        """Write ``docs`` of one chat as a new segment and add it to the index (both fsynced)."""
+        docs = sorted(docs, key=message_key)
+        chat_dir = self._chat_dir(wa_id)
+        os.makedirs(chat_dir, exist_ok=True)
+        entries = [dict(e) for e in self._entries(wa_id)]
+        number = max((int(e['file'].split('.')[0]) for e in entries), default=0) + 1
+        entry = {'file': f"{number:08d}.seg", 'first': list(message_key(docs[0])),
+                 'last': list(message_key(docs[-1])), 'rows': len(docs)}
+        data = encode_segment(docs)
+        # fsyncs off the hub, as in log_store.py
+        tpool.execute(_write_atomic, os.path.join(chat_dir, entry['file']), data)
+        for e in entries:
+            e['first'], e['last'] = list(e['first']), list(e['last'])
+        # The index rename is the commit point: a segment it does not list is never read
+        tpool.execute(_write_atomic, os.path.join(chat_dir, 'index.json'),
+                      json.dumps({'segments': entries + [entry]}).encode())
+        self.segments_written += 1
+        self.rows_written += len(docs)
+        self.bytes_written += len(data)
+        self.raw_bytes_written += sum(len(json.dumps(d, default=str)) for d in docs)
+
+    # --- reads -------------------------------------------------------------
+
+    def span(self, wa_id):
+        """``(oldest key, newest key)`` of the archived messages of a chat, or None."""
+        entries = self._entries(wa_id)
+        if not entries:
+            return None
+        return min(e['first'] for e in entries), max(e['last'] for e in entries)
+
+    def page_rows(self, wa_id, limit, before=None, after=None):
+        """Up to ``limit + 1`` archived messages past a cursor: oldest first after ``after``,
+        else newest first before ``before`` (or from the newest)."""
+        forward = after is not None
+        if forward:
+            candidates = sorted((e for e in self._entries(wa_id) if e['last'] > after), key=lambda e: e['first'])
+        else:
+            candidates = sorted((e for e in self._entries(wa_id) if before is None or e['first'] < before),
+                                key=lambda e: e['last'], reverse=True)
+        rows = {}
+        kept = []
+        for entry in candidates:
+            if len(kept) > limit:
+                # Segments may overlap; stop once this one cannot beat the rows already kept
+                bound = message_key(kept[limit])
+                if (entry['first'] > bound) if forward else (entry['last'] < bound):
+                    break
+            for doc in self._segment(wa_id, entry):
+                key = message_key(doc)
+                if (key > after) if forward else (before is None or key < before):
+                    rows.setdefault(key[1], doc)
+            kept = sorted(rows.values(), key=message_key, reverse=not forward)[:limit + 1]
+        return [dict(doc) for doc in kept]
+
+    def messages(self, wa_id):
+        """Every archived message of a chat, oldest first."""
+        rows = {}
+        for entry in self._entries(wa_id):
+            for doc in self._segment(wa_id, entry):
+                rows.setdefault(doc['wamid'], doc)
+        return [dict(doc) for doc in sorted(rows.values(), key=message_key)]
+
+    def stats(self):
+        return {
+            "segments_written": self.segments_written,
+            "rows_written": self.rows_written,
+            "bytes_written": self.bytes_written,
+            "compression_ratio": round(self.raw_bytes_written / self.bytes_written, 2) if self.bytes_written else None,
+            "segment_reads": self.segment_reads,
+            "cache_hits": self.cache_hits,
+            "cached_segments": len(self._decoded),
+        }
+
+    def totals(self):
+        """Conversations, segments, messages and bytes on disk; walks the whole directory."""
+        chats = segments = rows = size = 0
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name, 'index.json')
+            if not os.path.exists(path):
+                continue
+            with open(path, encoding='utf-8') as f:
+                entries = json.load(f)['segments']
+            chats += 1
+            segments += len(entries)
+            rows += sum(e['rows'] for e in entries)
+            size += sum(os.path.getsize(os.path.join(self.root, name, e['file'])) for e in entries)
+        return {"conversations": chats, "segments": segments, "messages": rows, "disk_bytes": size}
+
+
+def _write_atomic(path, data):
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class Archiver:
+    """Moves messages older than ``max_age`` seconds from the active hot tier into ``archive``.
+
+    The hot tier is ``storage.primary`` while MongoDB is in use, else
+    ``storage.local``; both implement ``archivable(wa_id, before, limit)``
+    and ``drop_archived(wa_id, docs)``. Messages are written to the
+    archive before they are dropped, so a crash in between leaves
+    duplicates (which reads skip), never a gap. ``on_moved(wa_ids)`` is
+    called after a run with the conversations it changed.
+    """
+
+    def __init__(self, archive, storage, max_age, interval=3600.0, on_moved=None):
+        self.archive = archive
+        self.storage = storage
+        self.max_age = max_age
+        self.interval = interval
+        self.on_moved = on_moved
+        self.runs = 0
+        self.skipped_runs = 0
+        self.moved = 0
+        self.last_run_seconds = 0.0
+        self.last_error = None
+        self._loop = None
+
+    def start(self):
+        if self._loop is None:
+            self._loop = eventlet.spawn(self._run_loop)
+
+    def _run_loop(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                self.last_error = str(e)
+                log.exception("Archiver run failed: %s", e)
+            eventlet.sleep(self.interval)
+
+    def run_once(self, now=None):
+        """Archive everything due. Returns the number of messages moved (0 if another worker holds the lock)."""
+        with open(os.path.join(self.archive.root, 'archiver.lock'), 'a') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self.skipped_runs += 1
+                return 0
+            t0 = time.perf_counter()
+            repo = self.storage.primary if self.storage.using_primary else self.storage.local
+            cutoff = (now if now is not None else time.time()) - self.max_age
+            moved = 0
+            touched = []
+            for chat in repo.conversations():
+                wa_id = chat['wa_id']
+                # Strictly older than the chat's newest message, which stays hot for /chats
+                before = min(cutoff, _ts(chat.get('last_timestamp')))
+                while True:
+                    docs = repo.archivable(wa_id, before, SEGMENT_ROWS)
+                    if not docs:
+                        break
+                    self.archive.append(wa_id, docs)
+                    repo.drop_archived(wa_id, docs)
+                    moved += len(docs)
+                    if not touched or touched[-1] != wa_id:
+                        touched.append(wa_id)
+                    # Let requests run between segments
+                    eventlet.sleep(0)
+                    if len(docs) < SEGMENT_ROWS:
+                        break
+            self.runs += 1
+            self.moved += moved
+            self.last_error = None
+            self.last_run_seconds = time.perf_counter() - t0
+            if moved:
+                log.info("Archived %d messages in %.2fs", moved, self.last_run_seconds, extra={"backend": repo.name})
+            if touched and self.on_moved is not None:
+                self.on_moved(touched)
+            return moved
+
+    def stats(self):
+        return dict(self.archive.stats(), runs=self.runs, skipped_runs=self.skipped_runs, moved=self.moved,
+                    max_age_days=round(self.max_age / 86400, 2), last_run_seconds=round(self.last_run_seconds, 3),
+                    last_error=self.last_error)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3 or sys.argv[1] != 'stats':
+        print("Usage: python archive.py stats <dir>")
+        sys.exit(1)
+    print(json.dumps(Archive(sys.argv[2]).totals(), indent=2))
@@ -0,0 +1,108 @@
+"""Archive tier: size on disk and history page latency, hot vs. archived.
+
+Fills --chats conversations of --messages-per-chat messages into a
+MemoryStore, archives all but the newest of each (see archive.py), and
+reports bytes per message in the segments against the JSON size of the
+same messages, then the latency of 50-message history pages read from
+the hot store and through the archive (first read of a segment and
+cached).
+
+Usage:
+    python benchmarks/bench_archive.py [--chats 20] [--messages-per-chat 20000]
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from archive import Archive, Archiver  # noqa: E402
+from changes import ChangeLog  # noqa: E402
+from memory_store import MemoryStore  # noqa: E402
+from pagination import paginate_list, merge_page  # noqa: E402
+from storage import LocalRepository  # noqa: E402
+
+WORDS = "hi ok thanks see you tomorrow meeting call me later sure sounds good where are you".split()
+
+
+class _Storage:
+    """Just enough of storage.Storage for the Archiver."""
+    using_primary = False
+
+    def __init__(self, local):
+        self.local = local
+
+
+def fill(store, chats, per_chat, seed=1):
+    rng = random.Random(seed)
+    start = time.time() - 400 * 86400
+    for c in range(chats):
+        wa_id = str(919000000000 + c)
+        for i in range(per_chat):
+            store.add({"id": f"wamid.{c}.{i}", "wa_id": wa_id, "name": f"Contact {c}", "from": wa_id,
+                       "timestamp": start + i * 600 + rng.random(), "type": "text",
+                       "text": {"body": ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 12)))},
+                       "status": rng.choice(('sent', 'delivered', 'read'))})
+    return [str(919000000000 + c) for c in range(chats)]
+
+
+def page_latency(read, rounds):
+    times = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        read()
+        times.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chats', type=int, default=20)
+    parser.add_argument('--messages-per-chat', type=int, default=20000)
+    parser.add_argument('--rounds', type=int, default=50)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='archive-bench-')
+    try:
+        store = MemoryStore(max_per_chat=args.messages_per_chat, budget_bytes=1 << 40)
+        wa_ids = fill(store, args.chats, args.messages_per_chat)
+        hot_bytes = store.stats()['approx_bytes']
+        json_bytes = sum(len(json.dumps(m)) for w in wa_ids for m in store.messages(w))
+        archive = Archive(os.path.join(root, 'archive'))
+        archiver = Archiver(archive, _Storage(LocalRepository(store, ChangeLog())), max_age=0)
+        t0 = time.perf_counter()
+        moved = archiver.run_once()
+        elapsed = time.perf_counter() - t0
+        totals = archive.totals()
+        print(f"archived {moved} messages in {elapsed:.2f}s ({moved / elapsed:.0f}/s), {totals['segments']} segments")
+        print(f"bytes/message: json {json_bytes / moved:.0f}, memory store {hot_bytes / moved:.0f}, "
+              f"archive {totals['disk_bytes'] / moved:.1f}; memory store now {store.stats()['approx_bytes']} bytes")
+
+        wa_id = wa_ids[0]
+        hot = MemoryStore(max_per_chat=args.messages_per_chat, budget_bytes=1 << 40)
+        fill(hot, 1, args.messages_per_chat)
+        history = hot.messages(wa_id)
+        middle = (history[len(history) // 2]['timestamp'], history[len(history) // 2]['wamid'])
+        hot_ms = page_latency(lambda: paginate_list(hot.messages(wa_id), 50, middle), args.rounds)
+        empty = {'messages': [], 'has_more_before': False, 'has_more_after': False}
+
+        def archived_page():
+            return merge_page(empty, archive.page_rows(wa_id, 50, before=middle), 50, middle)
+
+        archive._decoded.clear()
+        cold_ms = page_latency(lambda: (archive._decoded.clear(), archived_page()), args.rounds)
+        cached_ms = page_latency(archived_page, args.rounds)
+        print(f"page of 50 at the middle of {args.messages_per_chat}: hot {hot_ms:.2f} ms, "
+              f"archive {cold_ms:.2f} ms (segment decode), {cached_ms:.2f} ms (cached)")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
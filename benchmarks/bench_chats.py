@@ -0,0 +1,110 @@
+"""Benchmark /chats latency as the number of stored messages grows.
+
+Seeds a scratch database with N messages spread over a fixed number of
+conversations, then times GET /chats (served from chat_summaries) next to
+the old full-collection scan for comparison.
+
+Usage:
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/bench_chats.py [--sizes 1000,10000,100000,1000000]
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo import MongoClient  # noqa: E402
+from config import MONGO_URI  # noqa: E402
+from storage import MongoRepository  # noqa: E402
+
+BENCH_DB = 'whatsapp_bench'
+CONVERSATIONS = 50
+SEED_BATCH = 10000
+
+
+def seed(messages, summaries, n):
+    messages.drop()
+    summaries.collection.drop()
+    base = 1754400000
+    batch = []
+    for i in range(n):
+        wa_id = f"91{i % CONVERSATIONS:010d}"
+        batch.append({
+            "id": f"bench_{i}",
+            "wamid": f"bench_{i}",
+            "wa_id": wa_id,
+            "name": f"Contact {i % CONVERSATIONS}",
+            "timestamp": str(base + i),
+            "text": {"body": f"message {i}"},
+            "type": "text",
+            "status": "read" if i % 3 else "delivered",
+        })
+        if len(batch) >= SEED_BATCH:
+            messages.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        messages.insert_many(batch, ordered=False)
+    summaries.rebuild(messages)
+
+
+def full_scan(messages):
+    groups = {}
+    for doc in messages.find():
+        g = groups.setdefault(doc['wa_id'], {'last_timestamp': 0, 'unread_count': 0})
+        ts = float(doc.get('timestamp', 0))
+        if ts >= g['last_timestamp']:
+            g['last_timestamp'] = ts
+            g['last_message'] = doc['text']['body']
+        if doc.get('status') != 'read':
+            g['unread_count'] += 1
+    return groups
+
+
+def time_it(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--uri', default=os.environ.get('MONGO_URI', MONGO_URI))
+    parser.add_argument('--sizes', default='1000,10000,100000,1000000')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--skip-scan-above', type=int, default=100000,
+                        help='skip the legacy full-scan timing above this size')
+    args = parser.parse_args()
+    if not args.uri:
+        print("❌ Set MONGO_URI (or pass --uri) to a scratch MongoDB instance")
+        sys.exit(1)
+
+    os.environ['MONGO_URI'] = args.uri
+    import app
+
+    db = MongoClient(args.uri)[BENCH_DB]
+    repo = MongoRepository(db)
+    messages, summaries = repo.collection, repo.summaries
+    app.storage.primary = repo
+    app.storage.primary_ready = True
+    client = app.app.test_client()
+
+    print(f"{'messages':>10} {'/chats p50 ms':>14} {'full scan p50 ms':>17}")
+    for n in [int(x) for x in args.sizes.split(',')]:
+        seed(messages, summaries, n)
+        client.get('/chats')  # warm up
+        chats_ms = time_it(lambda: client.get('/chats'), args.repeat)
+        scan = '-'
+        if n <= args.skip_scan_above:
+            scan = f"{time_it(lambda: full_scan(messages), max(1, args.repeat // 5)):.2f}"
+        print(f"{n:>10} {chats_ms:>14.2f} {scan:>17}")
+
+    db.client.drop_database(BENCH_DB)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Serialization cost per message: history pages and broadcast events.
+
+History: a page of --page messages encoded with bson.json_util (the old
+path), the stdlib json module and fast_json (orjson when installed).
+Broadcast: one new_message event encoded separately for SSE and for the
+Socket.IO packet (the old path) versus once through fast_json.Encoded.
+
+Usage:
+    python benchmarks/bench_json.py [--page 50] [--rounds 2000]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import json_util  # noqa: E402
+import fast_json  # noqa: E402
+from fast_json import Encoded  # noqa: E402
+
+
+def message(i):
+    return {"id": f"wamid.HBgMOTE5OTY3NTc4NzIwFQIAEhggMTJBQzM0{i:08d}", "wamid": f"wamid.bench{i}",
+            "wa_id": "919937320320", "name": "Ravi Kumar", "from": "919937320320",
+            "timestamp": 1754400000.0 + i, "type": "text", "status": "read", "seq": 1000 + i,
+            "created_seq": 1000 + i, "text": {"body": f"Hi Ravi! Sure, I'd be happy to help with order #{i}. नमस्ते"}}
+
+
+def per_item_us(fn, rounds, items):
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - t0) / rounds / items * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--page', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=2000)
+    args = parser.parse_args()
+    page = {"messages": [message(i) for i in range(args.page)], "next_before": "1754400000.0:wamid.bench0",
+            "next_after": None, "has_more_before": True, "has_more_after": False}
+    msg = message(0)
+
+    print(f"encoder: {fast_json.BACKEND}")
+    print(f"{'history page':>28} {'us/message':>11}")
+    for name, fn in (('bson.json_util.dumps', lambda: json_util.dumps(page)),
+                     ('json.dumps', lambda: json.dumps(page)),
+                     ('fast_json.dumps', lambda: fast_json.dumps(page))):
+        print(f"{name:>28} {per_item_us(fn, args.rounds, args.page):>11.2f}")
+
+    def old_broadcast():
+        json.dumps({"type": "new_message", "message": msg})           # SSE
+        json.dumps(["new_message", msg], separators=(',', ':'))       # Socket.IO packet
+
+    def new_broadcast():
+        event = Encoded(msg)
+        fast_json.dumps({"type": "new_message", "message": event})
+        fast_json.dumps(["new_message", event], separators=(',', ':'))
+
+    rounds = args.rounds * 10
+    print(f"{'broadcast event':>28} {'us/event':>11}")
+    print(f"{'encode per transport':>28} {per_item_us(old_broadcast, rounds, 1):>11.2f}")
+    print(f"{'Encoded once':>28} {per_item_us(new_broadcast, rounds, 1):>11.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Write throughput and cold-start recovery of the local log store.
+
+Writes --records messages (10% of them followed by a status update) with
+each sync mode, using --writers concurrent greenlets so group commit can
+share fsyncs, then reopens a store of --recovery-records messages and
+reports recovery time scaled to one million records.
+
+Usage:
+    python benchmarks/bench_log_store.py [--records 100000] [--writers 1,64] [--recovery-records 1000000]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import eventlet  # noqa: E402
+from log_store import LogStore  # noqa: E402
+
+
+def message(i):
+    return {"id": f"wamid.bench{i}", "wa_id": str(919000000000 + i % 1000), "name": "Bench",
+            "timestamp": 1754400000 + i, "text": {"body": f"benchmark message {i}"},
+            "type": "text", "status": "sent"}
+
+
+def write(store, records, writers):
+    """Append ``records`` messages from ``writers`` greenlets. Returns records/sec."""
+    per = records // writers
+
+    def writer(w):
+        for i in range(w * per, (w + 1) * per):
+            store.add(message(i))
+            if i % 10 == 0:
+                store.set_status(f"wamid.bench{i}", 'delivered')
+
+    t0 = time.perf_counter()
+    pool = eventlet.GreenPool(writers)
+    for w in range(writers):
+        pool.spawn_n(writer, w)
+    pool.waitall()
+    store.commit()
+    return per * writers / (time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', type=int, default=100000)
+    parser.add_argument('--writers', default='1,64')
+    parser.add_argument('--recovery-records', type=int, default=1000000)
+    parser.add_argument('--dir', default=None, help='scratch directory (default: a temp dir)')
+    args = parser.parse_args()
+
+    root = args.dir or tempfile.mkdtemp(prefix='logstore-bench-')
+    try:
+        print(f"{'sync':>9} {'writers':>8} {'records/s':>11} {'commits':>8}")
+        for sync in ('none', 'interval', 'group'):
+            for writers in [int(x) for x in args.writers.split(',')]:
+                records = args.records if sync != 'group' or writers > 1 else min(args.records, 2000)
+                path = os.path.join(root, f"{sync}-{writers}")
+                store = LogStore(path, sync=sync)
+                rate = write(store, records, writers)
+                print(f"{sync:>9} {writers:>8} {rate:>11.0f} {store.commits:>8}")
+                store.close()
+                shutil.rmtree(path)
+
+        path = os.path.join(root, 'recovery')
+        store = LogStore(path, sync='none')
+        write(store, args.recovery_records, 1)
+        disk = store.stats()['disk_bytes']
+        store.close()
+        t0 = time.perf_counter()
+        store = LogStore(path)
+        elapsed = time.perf_counter() - t0
+        n = store.stats()['recovered_records']
+        print(f"recovery: {n} records ({disk / 1e6:.0f} MB, {store.stats()['segments']} segments) "
+              f"in {elapsed:.2f}s = {elapsed / n * 1e6:.2f}s per million records")
+        store.close()
+    finally:
+        if args.dir is None:
+            shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
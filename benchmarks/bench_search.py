@@ -0,0 +1,82 @@
+"""Build time and query latency of the in-process search index.
+
+Indexes --messages synthetic messages (Zipf-ish vocabulary, some Hindi
+words, spread over --chats conversations) and reports p50/p99 latency for
+single-word, prefix, multi-word and per-chat queries.
+
+Usage:
+    python benchmarks/bench_search.py [--messages 1000000] [--chats 5000] [--queries 200]
+"""
+import os
+import sys
+import time
+import random
+import itertools
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search_index import SearchIndex  # noqa: E402
+
+HINDI = ['नमस्ते', 'धन्यवाद', 'राहुल', 'प्रिया', 'ऑर्डर', 'कीमत']
+
+
+def corpus(n, chats, vocab, rng):
+    words = [f"word{i}" for i in range(vocab)] + HINDI
+    cum_weights = list(itertools.accumulate(1.0 / (i + 1) for i in range(len(words))))
+    for i in range(n):
+        body = ' '.join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(3, 15)))
+        yield {"id": f"wamid.bench{i}", "wa_id": str(919000000000 + i % chats), "name": "Bench",
+               "timestamp": 1754400000 + i, "text": {"body": body}}
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--chats', type=int, default=5000)
+    parser.add_argument('--vocab', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+    rng = random.Random(42)
+
+    index = SearchIndex()
+    index.build(corpus(args.messages, args.chats, args.vocab, rng))
+    stats = index.stats()
+    print(f"indexed {stats['messages']} messages, {stats['terms']} terms, {stats['postings']} postings "
+          f"in {stats['build_seconds']:.1f}s")
+
+    kinds = {
+        'common word': lambda: f"word{rng.randint(0, 20)}",
+        'rare word': lambda: f"word{rng.randint(10000, args.vocab - 1)}",
+        'prefix': lambda: f"word{rng.randint(1, 99)}",
+        'two words': lambda: f"word{rng.randint(0, 50)} word{rng.randint(0, 500)}",
+        'hindi prefix': lambda: rng.choice(HINDI)[:3],
+    }
+    print(f"{'query':>14} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, make in kinds.items():
+        samples = []
+        for _ in range(args.queries):
+            q = make()
+            t0 = time.perf_counter()
+            index.search(q)
+            samples.append((time.perf_counter() - t0) * 1000)
+        p50, p99 = percentiles(samples)
+        print(f"{name:>14} {p50:>8.2f} {p99:>8.2f}")
+    samples = []
+    for _ in range(args.queries):
+        wa_id = str(919000000000 + rng.randrange(args.chats))
+        t0 = time.perf_counter()
+        index.search(f"word{rng.randint(0, 50)}", wa_id=wa_id)
+        samples.append((time.perf_counter() - t0) * 1000)
+    p50, p99 = percentiles(samples)
+    print(f"{'in one chat':>14} {p50:>8.2f} {p99:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
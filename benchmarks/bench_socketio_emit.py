@@ -0,0 +1,70 @@
+"""Measure Socket.IO emit cost with 1k and 10k connected sockets.
+
+Registers N fake clients directly with the app's Socket.IO manager, each
+with one of --chats conversations open, and replaces the Engine.IO send
+with a frame counter. Compares a global broadcast (the old behaviour)
+with an emit addressed to one chat room.
+
+Usage:
+    python benchmarks/bench_socketio_emit.py [--sockets 1000,10000] [--chats 100]
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+MESSAGE = {"id": "bench", "wa_id": "0", "name": "You", "timestamp": 1754400000.0,
+           "text": {"body": "hello"}, "type": "text", "status": "sent", "wamid": "bench"}
+
+
+def connect_fake_clients(server, n, chats):
+    sids = []
+    for i in range(n):
+        sid = server.manager.connect(f"eio-{i}", '/')
+        server.enter_room(sid, app.chat_room(str(i % chats)), namespace='/')
+        sids.append(sid)
+    return sids
+
+
+def time_emits(emit, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        emit()
+    return (time.perf_counter() - t0) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sockets', default='1000,10000')
+    parser.add_argument('--chats', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    server = app.socketio.server
+    frames = [0]
+
+    def count_send(eio_sid, data):
+        frames[0] += 1
+    server.eio.send = count_send
+    server.eio.send_packet = count_send
+
+    print(f"{'sockets':>8} {'mode':>10} {'us/emit':>10} {'frames/emit':>12}")
+    for n in [int(x) for x in args.sockets.split(',')]:
+        sids = connect_fake_clients(server, n, args.chats)
+        for mode, emit in (
+            ('broadcast', lambda: app.socketio.emit('new_message', MESSAGE)),
+            ('room', lambda: app.socketio.emit('new_message', MESSAGE, to=app.chat_room('0'))),
+        ):
+            frames[0] = 0
+            us = time_emits(emit, args.repeat)
+            print(f"{n:>8} {mode:>10} {us:>10.1f} {frames[0] / args.repeat:>12.0f}")
+        for sid in sids:
+            server.manager.disconnect(sid, '/')
+
+
+if __name__ == '__main__':
+    main()
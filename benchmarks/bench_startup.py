@@ -0,0 +1,116 @@
+"""Cold start: time from launching a worker to its first answered requests.
+
+For each scenario, starts app.py in a fresh process on a synthetic corpus
+(see load_mixed.py) and polls until it gets a response:
+
+    first response   GET /test answered at all
+    first /chats     the conversation list served
+    ready            GET /ready returned 200 (MongoDB connected or given up on)
+
+Scenarios:
+    none         no MONGO_URI (in-memory backend)
+    refused      MONGO_URI pointing at a closed local port
+    blackhole    MONGO_URI pointing at an unroutable address (connect timeout)
+    mongo        MONGO_URI from the environment, when set
+
+Usage:
+    python benchmarks/bench_startup.py [--chats 200] [--messages-per-chat 500] [--runs 3]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_mixed import generate_corpus  # noqa: E402  (also monkey-patches eventlet)
+from eventlet.green.urllib import request as urlrequest  # noqa: E402
+from eventlet.green.urllib.error import HTTPError  # noqa: E402
+
+import eventlet  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = {
+    'none': '',
+    'refused': 'mongodb://127.0.0.1:1/?directConnection=true',
+    'blackhole': 'mongodb://10.255.255.1:27017/?directConnection=true',
+    'mongo': os.environ.get('MONGO_URI', ''),
+}
+
+
+def status(url):
+    try:
+        return urlrequest.urlopen(url, timeout=30).status
+    except HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+
+def cold_start(port, payloads_dir, mongo_uri, timeout=60):
+    env = dict(os.environ, PAYLOADS_DIR=payloads_dir, MONGO_URI=mongo_uri, MESSAGE_QUEUE='', LOG_LEVEL='WARNING')
+    code = ("import eventlet; eventlet.monkey_patch(); import app; "
+            f"app.socketio.run(app.app, host='127.0.0.1', port={port}, log_output=False)")
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-c', code], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f'http://127.0.0.1:{port}'
+    marks = {}
+    try:
+        while 'first_response' not in marks:
+            if status(base + '/test') is not None:
+                marks['first_response'] = time.perf_counter() - t0
+            elif time.perf_counter() - t0 > timeout:
+                raise RuntimeError("server did not start")
+            else:
+                eventlet.sleep(0.01)
+        if status(base + '/chats') == 200:
+            marks['first_chats'] = time.perf_counter() - t0
+        while time.perf_counter() - t0 < timeout:
+            code = status(base + '/ready')
+            if code in (200, 404):
+                # 404: a tree without /ready is ready once it answers
+                marks['ready'] = time.perf_counter() - t0
+                break
+            eventlet.sleep(0.01)
+    finally:
+        proc.terminate()
+        proc.wait()
+    return marks
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chats', type=int, default=200)
+    parser.add_argument('--messages-per-chat', type=int, default=500)
+    parser.add_argument('--scenarios', default='none,refused,blackhole,mongo')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--port', type=int, default=10080)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_startup_')
+    payloads_dir = os.path.join(workdir, 'payloads')
+    generate_corpus(payloads_dir, args.chats, args.messages_per_chat, 100, seed=1)
+    print(f"corpus: {args.chats * args.messages_per_chat} messages")
+    print(f"{'scenario':>10} {'first response s':>17} {'first /chats s':>15} {'ready s':>8}")
+    try:
+        for name in args.scenarios.split(','):
+            uri = SCENARIOS[name]
+            if name == 'mongo' and not uri:
+                continue
+            runs = [cold_start(args.port, payloads_dir, uri) for _ in range(args.runs)]
+
+            def median(key):
+                values = [r[key] for r in runs if key in r]
+                return f"{statistics.median(values):.2f}" if values else '-'
+            print(f"{name:>10} {median('first_response'):>17} {median('first_chats'):>15} {median('ready'):>8}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""Throughput with 1, 2 and 4 eventlet workers sharing the local event bus.
+
+For each worker count, starts the event bus hub and N app processes bound
+to the same port (SO_REUSEPORT, so the kernel spreads connections like a
+gunicorn master would), then:
+
+  * drives GET /chats over keep-alive connections from --loaders separate
+    processes for --seconds and reports requests/sec;
+  * opens SSE clients (landing on different workers), posts messages and
+    checks every client received every event through the bus.
+
+Scaling is bounded by the cores available; run it on a machine with at
+least as many cores as workers plus loaders.
+
+Usage:
+    python benchmarks/bench_workers.py [--workers 1,2,4] [--seconds 10] [--connections 64]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUS_PATH = '/tmp/whatsapp-bench-bus.sock'
+
+
+def http_get_loop(port, path, seconds, connections):
+    """Loader process: keep-alive GETs on ``connections`` sockets; prints the request count."""
+    import eventlet
+    eventlet.monkey_patch()
+    from eventlet.green import socket
+
+    done = [0]
+    deadline = time.time() + seconds
+    request = f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n".encode()
+
+    def worker():
+        sock = socket.create_connection(('127.0.0.1', port))
+        f = sock.makefile('rb')
+        while time.time() < deadline:
+            sock.sendall(request)
+            length = 0
+            while True:
+                line = f.readline()
+                if line in (b'\r\n', b''):
+                    break
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':')[1])
+            f.read(length)
+            done[0] += 1
+        sock.close()
+
+    pool = eventlet.GreenPool(connections)
+    for _ in range(connections):
+        pool.spawn_n(worker)
+    pool.waitall()
+    print(done[0])
+
+
+def start_workers(n, port):
+    env = dict(os.environ, MESSAGE_QUEUE=f'local://{BUS_PATH}')
+    env.setdefault('MONGO_URI', '')
+    hub = subprocess.Popen([sys.executable, os.path.join(ROOT, 'event_bus.py'), 'hub', BUS_PATH],
+                           cwd=ROOT, stdout=subprocess.DEVNULL)
+    time.sleep(0.5)
+    code = ("import eventlet; eventlet.monkey_patch(); import app; "
+            f"app.socketio.run(app.app, host='127.0.0.1', port={port}, log_output=False, minimum_chunk_size=0)")
+    procs = [subprocess.Popen([sys.executable, '-c', code], cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) for _ in range(n)]
+    wait_ready(port)
+    time.sleep(1.0)  # let every worker bind before measuring
+    return hub, procs
+
+
+def wait_ready(port):
+    import urllib.request
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/test', timeout=1).read()
+            return
+        except Exception:
+            time.sleep(0.2)
+    raise RuntimeError("workers did not start")
+
+
+def stop(hub, procs):
+    for p in procs + [hub]:
+        p.terminate()
+    for p in procs + [hub]:
+        p.wait()
+
+
+def measure_throughput(port, seconds, connections, loaders):
+    per = max(1, connections // loaders)
+    cmd = [sys.executable, os.path.abspath(__file__), '--_load', str(port), str(seconds), str(per)]
+    procs = [subprocess.Popen(cmd, stdout=subprocess.PIPE) for _ in range(loaders)]
+    total = sum(int(p.communicate()[0] or 0) for p in procs)
+    return total / seconds
+
+
+def check_cross_worker_delivery(port, clients, events):
+    """Every SSE client must see every message, whichever worker accepted the POST."""
+    import socket
+    import threading
+    import urllib.request
+
+    received = [set() for _ in range(clients)]
+    socks = []
+
+    def reader(i, sock):
+        for line in sock.makefile('rb'):
+            if line.startswith(b'data: '):
+                data = json.loads(line[6:])
+                marker = (data.get('message') or {}).get('id', '')
+                if marker.startswith('bench_workers_'):
+                    received[i].add(marker)
+
+    for i in range(clients):
+        sock = socket.create_connection(('127.0.0.1', port))
+        sock.sendall(b"GET /events HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n")
+        socks.append(sock)
+        threading.Thread(target=reader, args=(i, sock), daemon=True).start()
+    time.sleep(1.0)
+    for i in range(events):
+        body = json.dumps({"wa_id": "bench-workers", "text": "hi", "client_id": f"bench_workers_{i}"}).encode()
+        req = urllib.request.Request(f'http://127.0.0.1:{port}/messages', data=body,
+                                     headers={'Content-Type': 'application/json', 'Connection': 'close'})
+        urllib.request.urlopen(req, timeout=10).read()
+    time.sleep(2.0)
+    for sock in socks:
+        sock.close()
+    return sum(len(r) for r in received), clients * events
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--_load':
+        port, seconds, connections = sys.argv[2:5]
+        http_get_loop(int(port), '/chats', float(seconds), int(connections))
+        return
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', default='1,2,4')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--connections', type=int, default=64)
+    parser.add_argument('--loaders', type=int, default=2)
+    parser.add_argument('--sse-clients', type=int, default=20)
+    parser.add_argument('--port', type=int, default=10060)
+    args = parser.parse_args()
+
+    print(f"cores={os.cpu_count()}")
+    print(f"{'workers':>8} {'req/s':>10} {'sse deliveries':>16}")
+    for n in [int(x) for x in args.workers.split(',')]:
+        hub, procs = start_workers(n, args.port)
+        try:
+            rps = measure_throughput(args.port, args.seconds, args.connections, args.loaders)
+            got, expected = check_cross_worker_delivery(args.port, args.sse_clients, 10)
+            print(f"{n:>8} {rps:>10.0f} {f'{got}/{expected}':>16}")
+        finally:
+            stop(hub, procs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,427 @@
+"""Mixed-workload load test against a synthetic corpus, with JSON baselines.
+
+Generates --chats conversations of --messages-per-chat messages as webhook
+payload files (the schema of payloads/, --per-file messages per file),
+starts app.py on them in one eventlet process with the in-memory backend
+(or the log store with --local-dir), holds --sse SSE and --sockets
+Socket.IO subscribers, and runs --connections keep-alive HTTP clients for
+--seconds. Each client picks operations by the --mix weights:
+
+    chats    GET /chats
+    history  GET /chats/<wa_id>?limit=50
+    send     POST /messages (the subscribers time its delivery)
+    status   POST /webhook with delivered/read receipts for sent messages
+
+The corpus and each client's sequence of operations are seeded, so two
+runs with the same arguments issue the same requests. Results (p50/p99 latency in ms and
+requests/sec per operation, realtime delivery latency) are printed and,
+with --out, written as JSON. --compare checks a run against a saved
+baseline and exits 1 if a p99 grew or a throughput fell by more than
+--tolerance. Load and server share the machine, so only compare runs
+from the same host.
+
+Usage:
+    python benchmarks/load_mixed.py [--chats 200] [--messages-per-chat 500] [--seconds 20]
+        [--connections 32] [--mix chats=20,history=50,send=20,status=10] [--sse 50] [--sockets 50]
+        [--out baseline.json] [--compare baseline.json --tolerance 0.25]
+    python benchmarks/load_mixed.py --corpus-only /tmp/corpus --chats 1000   # just write the payload files
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+import eventlet
+eventlet.monkey_patch()
+
+from eventlet.green import socket  # noqa: E402
+from eventlet.green.urllib import request as urlrequest  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUSINESS_NUMBER = '918329446654'
+WORDS = ("hi hello thanks order delivery payment refund when where price available today tomorrow "
+         "please sure okay address invoice track status help product size colour return exchange").split()
+DEFAULT_MIX = 'chats=20,history=50,send=20,status=10'
+
+
+# ---- corpus -----------------------------------------------------------------
+
+def payload(wa_id, name, messages, n):
+    """One webhook delivery in the payloads/ schema."""
+    return {
+        "payload_type": "whatsapp_webhook",
+        "_id": f"load-{wa_id}-{n}",
+        "metaData": {
+            "entry": [{"changes": [{"field": "messages", "value": {
+                "contacts": [{"profile": {"name": name}, "wa_id": wa_id}],
+                "messages": messages,
+                "messaging_product": "whatsapp",
+                "metadata": {"display_phone_number": BUSINESS_NUMBER, "phone_number_id": "629305560276479"},
+            }}], "id": "30164062719905277"}],
+            "gs_app_id": "load-app",
+            "object": "whatsapp_business_account",
+        },
+        "executed": True,
+    }
+
+
+def generate_corpus(payloads_dir, chats, per_chat, per_file, seed):
+    """Write the payload files. Returns the wa_ids."""
+    rng = random.Random(seed)
+    os.makedirs(payloads_dir, exist_ok=True)
+    wa_ids = []
+    base = 1754400000
+    for c in range(chats):
+        wa_id = f"91{9000000000 + c}"
+        name = f"Load Contact {c}"
+        wa_ids.append(wa_id)
+        ts = base + rng.randrange(86400)
+        batch = []
+        for m in range(per_chat):
+            ts += rng.randrange(1, 600)
+            batch.append({
+                "from": wa_id if rng.random() < 0.5 else BUSINESS_NUMBER,
+                "id": f"wamid.load.{c}.{m}",
+                "timestamp": str(ts),
+                "text": {"body": ' '.join(rng.choices(WORDS, k=rng.randint(3, 16)))},
+                "type": "text",
+            })
+            if len(batch) == per_file or m == per_chat - 1:
+                path = os.path.join(payloads_dir, f"load_{c:06d}_{m // per_file:06d}.json")
+                with open(path, 'w', encoding='utf-8') as f:
+                    json.dump(payload(wa_id, name, batch, m // per_file), f)
+                batch = []
+    return wa_ids
+
+
+# ---- server -----------------------------------------------------------------
+
+def start_server(port, payloads_dir, local_dir, max_size):
+    env = dict(os.environ, PAYLOADS_DIR=payloads_dir, MONGO_URI='', MESSAGE_QUEUE='', LOG_LEVEL='WARNING')
+    if local_dir:
+        env['LOCAL_DATA_DIR'] = local_dir
+    code = ("import eventlet; eventlet.monkey_patch(); import app; "
+            f"app.socketio.run(app.app, host='127.0.0.1', port={port}, log_output=False, "
+            f"minimum_chunk_size=0, max_size={max_size})")
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-c', code], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            urlrequest.urlopen(f'http://127.0.0.1:{port}/test', timeout=1).read()
+            return proc, time.perf_counter() - t0
+        except Exception:
+            eventlet.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("server did not start")
+
+
+# ---- clients ----------------------------------------------------------------
+
+class HTTPConnection:
+    """Keep-alive HTTP/1.1 over one green socket; just enough for this app's responses."""
+
+    def __init__(self, port):
+        self.port = port
+        self._connect()
+
+    def _connect(self):
+        self.sock = socket.create_connection(('127.0.0.1', self.port), timeout=30)
+        self.f = self.sock.makefile('rb')
+
+    def request(self, method, path, body=None):
+        """Returns the status code; the body is read and discarded."""
+        head = f"{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+        if body is not None:
+            head += f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+        try:
+            self.sock.sendall(head.encode() + b"\r\n" + (body or b''))
+            status = int(self.f.readline().split()[1])
+            length = 0
+            chunked = False
+            while True:
+                line = self.f.readline()
+                if line in (b'\r\n', b''):
+                    break
+                name, _, value = line.partition(b':')
+                name = name.strip().lower()
+                if name == b'content-length':
+                    length = int(value)
+                elif name == b'transfer-encoding' and b'chunked' in value.lower():
+                    chunked = True
+            if chunked:
+                while True:
+                    size = int(self.f.readline().strip(), 16)
+                    self.f.read(size + 2)
+                    if size == 0:
+                        break
+            else:
+                self.f.read(length)
+            return status
+        except (OSError, ValueError, IndexError):
+            # Reconnect so one broken response does not end the client
+            self.sock.close()
+            self._connect()
+            return 0
+
+
+class Run:
+    """Shared state of one load run."""
+
+    def __init__(self, args, wa_ids):
+        self.args = args
+        self.wa_ids = wa_ids
+        self.latencies = {op: [] for op in OPERATIONS}
+        self.errors = {op: 0 for op in OPERATIONS}
+        self.sent_at = {}        # message id -> perf_counter at POST
+        self.sent_ids = []       # (wa_id, id) of messages this run sent
+        self.deliveries = {'sse': [], 'socketio': []}
+        self.subscribers = {'sse': 0, 'socketio': 0}
+        self.recording = False
+        self.seq = 0
+
+
+def op_chats(run, conn, rng):
+    return conn.request('GET', '/chats')
+
+
+def op_history(run, conn, rng):
+    return conn.request('GET', f'/chats/{rng.choice(run.wa_ids)}?limit=50')
+
+
+def op_send(run, conn, rng):
+    run.seq += 1
+    msg_id = f"load_{run.seq}_{rng.getrandbits(32):08x}"
+    wa_id = rng.choice(run.wa_ids)
+    body = json.dumps({"wa_id": wa_id, "text": ' '.join(rng.choices(WORDS, k=6)), "client_id": msg_id}).encode()
+    run.sent_at[msg_id] = time.perf_counter()
+    status = conn.request('POST', '/messages', body)
+    run.sent_ids.append((wa_id, msg_id))
+    return status
+
+
+def op_status(run, conn, rng):
+    if not run.sent_ids:
+        return op_send(run, conn, rng)
+    statuses = []
+    for _ in range(5):
+        wa_id, msg_id = rng.choice(run.sent_ids)
+        statuses.append({"id": msg_id, "recipient_id": wa_id, "status": rng.choice(('delivered', 'read')),
+                         "timestamp": str(int(time.time()))})
+    body = json.dumps({"entry": [{"changes": [{"field": "messages", "value": {"statuses": statuses}}]}]}).encode()
+    return conn.request('POST', '/webhook', body)
+
+
+OPERATIONS = {'chats': op_chats, 'history': op_history, 'send': op_send, 'status': op_status}
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        op, _, weight = part.partition('=')
+        if op not in OPERATIONS:
+            raise ValueError(f"unknown operation {op!r}; expected one of {', '.join(OPERATIONS)}")
+        mix[op] = float(weight)
+    return mix
+
+
+def http_client(run, n, deadline):
+    rng = random.Random(run.args.seed * 1000 + n)
+    ops, weights = zip(*parse_mix(run.args.mix).items())
+    conn = HTTPConnection(run.args.port)
+    while time.perf_counter() < deadline:
+        op = rng.choices(ops, weights)[0]
+        t0 = time.perf_counter()
+        status = OPERATIONS[op](run, conn, rng)
+        if run.recording:
+            if 200 <= status < 400:
+                run.latencies[op].append(time.perf_counter() - t0)
+            else:
+                run.errors[op] += 1
+
+
+def record_delivery(run, kind, msg_id):
+    sent = run.sent_at.get(msg_id)
+    if sent is not None and run.recording:
+        run.deliveries[kind].append(time.perf_counter() - sent)
+
+
+def sse_subscriber(run):
+    sock = socket.create_connection(('127.0.0.1', run.args.port), timeout=30)
+    sock.settimeout(None)
+    sock.sendall(b"GET /events HTTP/1.1\r\nHost: 127.0.0.1\r\nAccept: text/event-stream\r\n\r\n")
+    f = sock.makefile('rb')
+    while f.readline() not in (b'\r\n', b''):
+        pass
+    run.subscribers['sse'] += 1
+    try:
+        for line in f:
+            if line.startswith(b'data: {"type":"new_message"'):
+                record_delivery(run, 'sse', json.loads(line[6:])['message']['id'])
+    except OSError:
+        pass  # server stopped
+
+
+def socketio_subscriber(run, wa_ids):
+    """Raw Engine.IO v4 over a websocket: connect, watch ``wa_ids``, time new_message events."""
+    import simple_websocket
+    ws = simple_websocket.Client.connect(
+        f"ws://127.0.0.1:{run.args.port}/socket.io/?EIO=4&transport=websocket")
+    ws.receive()                # Engine.IO open
+    ws.send('40')               # Socket.IO connect to /
+    for wa_id in wa_ids[:1]:
+        ws.send('42' + json.dumps(['open_chat', {'wa_id': wa_id}]))
+    ws.send('42' + json.dumps(['watch_chats', {'wa_ids': wa_ids}]))
+    run.subscribers['socketio'] += 1
+    try:
+        while True:
+            packet = ws.receive()
+            if packet == '2':
+                ws.send('3')        # pong
+            elif isinstance(packet, str) and packet.startswith('42["new_message"'):
+                record_delivery(run, 'socketio', json.loads(packet[2:])[1]['id'])
+    except (simple_websocket.ConnectionClosed, OSError):
+        pass  # server stopped
+
+
+# ---- report -----------------------------------------------------------------
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def summarize(values, seconds):
+    ms = [v * 1000 for v in values]
+    return {"count": len(ms), "rps": round(len(ms) / seconds, 1),
+            "p50_ms": round(percentile(ms, 0.50), 3) if ms else None,
+            "p99_ms": round(percentile(ms, 0.99), 3) if ms else None}
+
+
+def compare(result, baseline, tolerance):
+    """Lines describing regressions of ``result`` against ``baseline``."""
+    problems = []
+    sections = [('operations', result['operations'], baseline.get('operations', {})),
+                ('realtime', result['realtime'], baseline.get('realtime', {}))]
+    for section, current, before in sections:
+        for name, now in current.items():
+            old = before.get(name)
+            if not old:
+                continue
+            if now.get('p99_ms') is not None and old.get('p99_ms'):
+                if now['p99_ms'] > old['p99_ms'] * (1 + tolerance):
+                    problems.append(f"{section}.{name} p99 {old['p99_ms']} -> {now['p99_ms']} ms")
+            if section == 'operations' and old.get('rps'):
+                if now['rps'] < old['rps'] / (1 + tolerance):
+                    problems.append(f"{section}.{name} throughput {old['rps']} -> {now['rps']} req/s")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chats', type=int, default=200)
+    parser.add_argument('--messages-per-chat', type=int, default=500)
+    parser.add_argument('--per-file', type=int, default=100, help='messages per payload file')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--connections', type=int, default=32)
+    parser.add_argument('--mix', default=DEFAULT_MIX)
+    parser.add_argument('--sse', type=int, default=50)
+    parser.add_argument('--sockets', type=int, default=50)
+    parser.add_argument('--port', type=int, default=10070)
+    parser.add_argument('--local-dir', help='use the durable log store in this (empty) directory')
+    parser.add_argument('--corpus-only', metavar='DIR', help='write the payload files to DIR and exit')
+    parser.add_argument('--out', help='write the results as JSON here')
+    parser.add_argument('--compare', help='baseline JSON from an earlier --out')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+    parse_mix(args.mix)
+
+    if args.corpus_only:
+        t0 = time.perf_counter()
+        generate_corpus(args.corpus_only, args.chats, args.messages_per_chat, args.per_file, args.seed)
+        print(f"wrote {args.chats * args.messages_per_chat} messages to {args.corpus_only} "
+              f"in {time.perf_counter() - t0:.1f}s")
+        return
+
+    workdir = tempfile.mkdtemp(prefix='load_mixed_')
+    payloads_dir = os.path.join(workdir, 'payloads')
+    t0 = time.perf_counter()
+    wa_ids = generate_corpus(payloads_dir, args.chats, args.messages_per_chat, args.per_file, args.seed)
+    corpus_s = time.perf_counter() - t0
+    server, startup_s = start_server(args.port, payloads_dir, args.local_dir,
+                                     args.connections + args.sse + args.sockets + 100)
+    run = Run(args, wa_ids)
+    try:
+        rng = random.Random(args.seed)
+        pool = eventlet.GreenPool()
+        for _ in range(args.sse):
+            pool.spawn_n(sse_subscriber, run)
+        for _ in range(args.sockets):
+            pool.spawn_n(socketio_subscriber, run, rng.sample(wa_ids, min(10, len(wa_ids))))
+        deadline = time.perf_counter() + 30
+        while sum(run.subscribers.values()) < args.sse + args.sockets and time.perf_counter() < deadline:
+            eventlet.sleep(0.05)
+
+        end = time.perf_counter() + args.warmup + args.seconds
+        clients = [eventlet.spawn(http_client, run, n, end) for n in range(args.connections)]
+        eventlet.sleep(args.warmup)
+        run.recording = True
+        started = time.perf_counter()
+        for client in clients:
+            client.wait()
+        measured = time.perf_counter() - started
+        # Deliveries still in flight
+        eventlet.sleep(1.0)
+        run.recording = False
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    result = {
+        "config": {k: v for k, v in vars(args).items() if k not in ('out', 'compare', 'corpus_only', 'port')},
+        "host": {"python": platform.python_version(), "cores": os.cpu_count(), "platform": platform.platform()},
+        "corpus": {"messages": args.chats * args.messages_per_chat, "generate_s": round(corpus_s, 2)},
+        "startup_s": round(startup_s, 2),
+        "subscribers": run.subscribers,
+        "operations": {op: dict(summarize(v, measured), errors=run.errors[op])
+                       for op, v in run.latencies.items() if v or run.errors[op]},
+        "realtime": {kind: summarize(v, measured) for kind, v in run.deliveries.items()},
+    }
+    result["total_rps"] = round(sum(o['rps'] for o in result['operations'].values()), 1)
+
+    print(f"corpus {result['corpus']['messages']} messages, server ready in {result['startup_s']}s, "
+          f"subscribers {run.subscribers}")
+    print(f"{'operation':>10} {'count':>8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for op, s in result['operations'].items():
+        print(f"{op:>10} {s['count']:>8} {s['rps']:>8} {s['p50_ms']!s:>8} {s['p99_ms']!s:>8} {s['errors']:>7}")
+    for kind, s in result['realtime'].items():
+        print(f"{kind + ' rx':>10} {s['count']:>8} {s['rps']:>8} {s['p50_ms']!s:>8} {s['p99_ms']!s:>8}")
+    print(f"total {result['total_rps']} req/s")
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(result, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            problems = compare(result, json.load(f), args.tolerance)
+        for line in problems:
+            print(f"❌ regression: {line}")
+        if problems:
+            sys.exit(1)
+        print(f"✅ within {args.tolerance:.0%} of {args.compare}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Hold N concurrent SSE clients on one eventlet worker and measure fan-out.
+
+Starts the app in one eventlet process (in-memory backend unless MONGO_URI
+is set), opens N raw /events connections from a single eventlet
+process, sends messages through POST /messages and reports how long each
+event took to reach every subscriber.
+
+Usage:
+    python benchmarks/load_sse.py [--clients 5000] [--events 20] [--port 10050]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import statistics
+import subprocess
+
+import eventlet
+eventlet.monkey_patch()
+
+from eventlet.green import socket  # noqa: E402
+from eventlet.green.urllib import request as urlrequest  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def raise_fd_limit(needed):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = min(hard, max(soft, needed))
+    resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+    return target
+
+
+def start_server(port, clients):
+    env = dict(os.environ)
+    env.setdefault('MONGO_URI', '')
+    # One process on the eventlet hub, same as a single gunicorn eventlet worker;
+    # max_size plays the role of gunicorn's worker_connections
+    code = ("import eventlet; eventlet.monkey_patch(); import app; "
+            f"app.socketio.run(app.app, host='127.0.0.1', port={port}, log_output=False, "
+            f"minimum_chunk_size=0, max_size={clients + 100})")
+    proc = subprocess.Popen([sys.executable, '-c', code], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            preexec_fn=lambda: raise_fd_limit(clients * 2 + 200))
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            urlrequest.urlopen(f'http://127.0.0.1:{port}/test', timeout=1).read()
+            return proc
+        except Exception:
+            eventlet.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("server did not start")
+
+
+def sse_client(port, received, connected, failed, marker_times):
+    try:
+        sock = socket.create_connection(('127.0.0.1', port), timeout=30)
+        sock.settimeout(None)
+        sock.sendall(b"GET /events HTTP/1.1\r\nHost: 127.0.0.1\r\nAccept: text/event-stream\r\n\r\n")
+        f = sock.makefile('rb')
+        while f.readline() not in (b'\r\n', b''):
+            pass
+    except OSError:
+        failed.append(1)
+        return
+    connected.append(1)
+    for line in f:
+        if not line.startswith(b'data: '):
+            continue
+        try:
+            data = json.loads(line[6:])
+        except ValueError:
+            continue
+        marker = (data.get('message') or {}).get('id', '')
+        if marker in marker_times:
+            received.setdefault(marker, []).append(time.perf_counter() - marker_times[marker])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=5000)
+    parser.add_argument('--events', type=int, default=20)
+    parser.add_argument('--port', type=int, default=10050)
+    parser.add_argument('--ramp', type=int, default=250, help='connections opened per wave')
+    args = parser.parse_args()
+
+    limit = raise_fd_limit(args.clients + 200)
+    if limit < args.clients + 100:
+        print(f"⚠️ File descriptor limit {limit} is below the requested client count")
+
+    server = start_server(args.port, args.clients)
+    received, connected, failed, marker_times = {}, [], [], {}
+    try:
+        pool = eventlet.GreenPool(args.clients + 10)
+        t0 = time.perf_counter()
+        # Ramp up in waves so the listen backlog does not overflow
+        for start in range(0, args.clients, args.ramp):
+            wave = min(args.ramp, args.clients - start)
+            for _ in range(wave):
+                pool.spawn_n(sse_client, args.port, received, connected, failed, marker_times)
+            while len(connected) + len(failed) < start + wave and time.perf_counter() - t0 < 300:
+                eventlet.sleep(0.05)
+        connect_s = time.perf_counter() - t0
+        print(f"connected {len(connected)}/{args.clients} SSE clients in {connect_s:.1f}s ({len(failed)} failed)")
+
+        for i in range(args.events):
+            marker = f"load_sse_{i}"
+            marker_times[marker] = time.perf_counter()
+            body = json.dumps({"wa_id": "load-test", "text": marker, "client_id": marker}).encode()
+            req = urlrequest.Request(f'http://127.0.0.1:{args.port}/messages', data=body,
+                                     headers={'Content-Type': 'application/json'})
+            urlrequest.urlopen(req, timeout=30).read()
+            eventlet.sleep(0.2)
+        eventlet.sleep(5)
+
+        latencies = [x * 1000 for v in received.values() for x in v]
+        expected = len(connected) * args.events
+        stats = json.loads(urlrequest.urlopen(f'http://127.0.0.1:{args.port}/events/stats', timeout=30).read())
+        print(f"deliveries {len(latencies)}/{expected}")
+        if latencies:
+            latencies.sort()
+            print(f"fan-out latency ms: p50={statistics.median(latencies):.1f} "
+                  f"p99={latencies[int(len(latencies) * 0.99) - 1]:.1f} max={latencies[-1]:.1f}")
+        print(f"broker: {stats}")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+import time
+import uuid
+import threading
+from bisect import bisect_right
+from collections import deque
+from contextlib import contextmanager
+from pymongo import ReturnDocument
+from ingest import MESSAGE_FIELDS
+
+DEFAULT_SYNC_LIMIT = 500
+MAX_SYNC_LIMIT = 2000
+
+
+class MongoSequence:
+    """Monotonic change sequence stored in a counters collection.
+
+    Writers reserve a block of numbers and stamp them on the documents they
+    write as ``seq`` (last change) and, for inserts, ``created_seq``.
+    Numbers reserved for writes that turn out to be no-ops are simply
+    skipped, so the sequence can have gaps.
+
+    Writes do not land in the order their numbers were handed out: with 7
+    and 8 reserved by two greenlets (or workers), 8 can commit first, and a
+    /sync reader that saw it would move past 7 for good. So each block is
+    also pushed onto ``inflight`` by the same update that reserves it, and
+    taken off when its writer is done (or has failed). ``committed`` is the
+    highest number below every block still in flight; /sync never reads past
+    it. A block whose writer died is given up on after ``stale_after``
+    seconds.
+    """
+
+    def __init__(self, counters, name='changes', stale_after=60.0):
+        self.counters = counters
+        self.name = name
+        self.stale_after = stale_after
+
+    @contextmanager
+    def reserve(self, n=1):
+        """Reserve ``n`` consecutive numbers for one write; yields the first."""
+        token = uuid.uuid4().hex
+        doc = self.counters.find_one_and_update(
+            {'_id': self.name},
+            {'$inc': {'seq': n}, '$push': {'inflight': {'token': token, 'n': n, 'at': time.time()}}},
+            projection={'seq': 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        try:
+            yield doc['seq'] - n + 1
+        finally:
+            self._release(token)
+
+    def _release(self, token):
+        # Usually ours is the oldest block: take it off the front in one round trip
+        doc = self.counters.find_one_and_update(
+            {'_id': self.name, 'inflight.0.token': token},
+            {'$pop': {'inflight': -1}},
+            projection={'inflight': {'$slice': 1}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc is None:
+            # An older block is still in flight; leave ours marked for whoever clears the front
+            self.counters.update_one({'_id': self.name, 'inflight.token': token}, {'$set': {'inflight.$.done': True}})
+            doc = self.counters.find_one({'_id': self.name}, {'inflight': {'$slice': 1}})
+        # Clear finished (or abandoned) blocks from the front so the list stays short
+        for _ in range(1000):
+            head = (doc or {}).get('inflight') or [None]
+            if head[0] is None or not self._settled(head[0], time.time()):
+                return
+            doc = self.counters.find_one_and_update(
+                {'_id': self.name, 'inflight.0.token': head[0]['token']},
+                {'$pop': {'inflight': -1}},
+                projection={'inflight': {'$slice': 1}},
+                return_document=ReturnDocument.AFTER,
+            ) or self.counters.find_one({'_id': self.name}, {'inflight': {'$slice': 1}})
+
+    def _settled(self, block, now):
+        return block.get('done') or block['at'] < now - self.stale_after
+
+    @property
+    def current(self):
+        """Highest number handed out, committed or not."""
+        doc = self.counters.find_one({'_id': self.name}, {'seq': 1})
+        return doc['seq'] if doc else 0
+
+    @property
+    def committed(self):
+        """Highest number at or below which every write has landed."""
+        doc = self.counters.find_one({'_id': self.name})
+        if not doc:
+            return 0
+        now = time.time()
+        pending = 0
+        for block in doc.get('inflight', ()):
+            # Blocks are in reservation order: everything from the oldest unfinished one up is unsafe
+            if pending or not self._settled(block, now):
+                pending += block['n']
+        return doc['seq'] - pending
+
+
+class ChangeLog:
+    """Bounded in-process change feed for the no-Mongo fallback.
+
+    Keeps the last ``maxlen`` changes as ``(seq, kind, payload)``. A client
+    whose ``since`` has already been evicted (or is ahead of us after a
+    restart) is told to reset and reload.
+    """
+
+    def __init__(self, maxlen=10000):
+        self._lock = threading.Lock()
+        self._entries = deque(maxlen=maxlen)
+        self._seq = 0
+
+    def allocate(self, n=1):
+        with self._lock:
+            first = self._seq + 1
+            self._seq += n
+            return first
+
+    @property
+    def current(self):
+        return self._seq
+
+    def append(self, seq, kind, payload):
+        with self._lock:
+            self._entries.append((seq, kind, payload))
+
+    def since(self, since, limit):
+        """Return ``(entries, reset)`` for changes after ``since``."""
+        with self._lock:
+            entries = list(self._entries)
+        if since > self._seq or (entries and since < entries[0][0] - 1):
+            return [], True
+        start = bisect_right([e[0] for e in entries], since)
+        return entries[start:start + limit + 1], False
+
+
+def status_change(doc):
+    return {'wa_id': doc.get('wa_id'), 'id': doc.get('wamid') or doc.get('id'), 'status': doc.get('status'), 'seq': doc.get('seq')}
+
+
+def mongo_changes_since(collection, since, limit, upto):
+    """New messages and status transitions with ``since < seq <= upto``, served by the seq index.
+
+    ``upto`` is the sequence's committed watermark, so a change that lands
+    late is never behind a cursor already handed out.
+    """
+    rows = list(collection.find({'seq': {'$gt': since, '$lte': upto}}, MESSAGE_FIELDS).sort('seq', 1).limit(limit + 1))
+    has_more = len(rows) > limit
+    if has_more and rows[limit - 1]['seq'] == rows[limit]['seq']:
+        # Messages marked read together share one seq; a page never splits them
+        boundary = rows[limit]['seq']
+        head = [r for r in rows[:limit] if r['seq'] != boundary]
+        rows = head or list(collection.find({'seq': boundary}, MESSAGE_FIELDS))
+    else:
+        rows = rows[:limit]
+    messages = [r for r in rows if r.get('created_seq', 0) > since]
+    statuses = [status_change(r) for r in rows if r.get('created_seq', 0) <= since]
+    return {
+        'seq': rows[-1]['seq'] if rows else since,
+        'messages': messages,
+        'statuses': statuses,
+        'has_more': has_more,
+        'reset': False,
+    }
+
+
+def memory_changes_since(change_log, since, limit):
+    entries, reset = change_log.since(since, limit)
+    if reset:
+        return {'seq': change_log.current, 'messages': [], 'statuses': [], 'has_more': False, 'reset': True}
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    return {
+        'seq': entries[-1][0] if entries else since,
+        'messages': [p for _, kind, p in entries if kind == 'message'],
+        'statuses': [p for _, kind, p in entries if kind == 'status'],
+        'has_more': has_more,
+        'reset': False,
+    }
@@ -0,0 +1,203 @@
+import sys
+from pymongo import DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+# Delivery order of message statuses; others (e.g. 'failed') are unordered
+STATUS_RANK = {'sent': 0, 'delivered': 1, 'read': 2}
+
+
+def is_forward(old_status, new_status):
+    """False for no-ops and for moving a message backwards, e.g. a late 'delivered' after 'read'."""
+    if old_status == new_status:
+        return False
+    if old_status in STATUS_RANK and new_status in STATUS_RANK:
+        return STATUS_RANK[new_status] > STATUS_RANK[old_status]
+    return True
+
+
+def is_inbound(msg):
+    """True for messages the contact sent; only those are ever unread or marked read."""
+    sender = msg.get('from')
+    return sender is not None and str(sender) == str(msg.get('wa_id'))
+
+
+def _status_filter(status):
+    if status in STATUS_RANK:
+        return {'$nin': [s for s, r in STATUS_RANK.items() if r >= STATUS_RANK[status]]}
+    return {'$ne': status}
+
+
+def _to_num(ts):
+    try:
+        return float(ts)
+    except Exception:
+        return 0.0
+
+
+class ChatSummaryStore:
+    """One document per conversation, kept up to date as messages are written.
+
+    Documents look like the rows /chats returns:
+    ``{_id: wa_id, name, last_message, last_timestamp, unread_count}``.
+    ``unread_count`` counts incoming messages (see ``is_inbound``) whose
+    status is not ``read``; the agent's own messages are read or not by the
+    contact, not the agent. ``rebuild()`` recomputes everything from the
+    messages collection if the summaries ever drift.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def record_message(self, msg):
+        wa_id = msg.get('wa_id')
+        if not wa_id:
+            return
+        ts = _to_num(msg.get('timestamp'))
+        unread = 1 if is_inbound(msg) and msg.get('status') != 'read' else 0
+        body = (msg.get('text') or {}).get('body', '')
+        try:
+            # Common case: the message is the newest in its chat (or the chat is new)
+            self.collection.update_one(
+                {'_id': wa_id, 'last_timestamp': {'$lte': ts}},
+                {
+                    '$set': {'last_message': body, 'last_timestamp': ts},
+                    '$inc': {'unread_count': unread},
+                    '$setOnInsert': {'name': msg.get('name', 'Unknown')},
+                },
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # Chat already has a newer message; only the counter changes
+            self.collection.update_one({'_id': wa_id}, {'$inc': {'unread_count': unread}})
+
+    def record_batch(self, messages, status_changes):
+        """Apply many new messages and ``(wa_id, old_status, new_status)`` changes of incoming messages in one round trip."""
+        deltas = {}
+        newest = {}
+        names = {}
+        for msg in messages:
+            wa_id = msg.get('wa_id')
+            if not wa_id:
+                continue
+            names.setdefault(wa_id, msg.get('name', 'Unknown'))
+            deltas[wa_id] = deltas.get(wa_id, 0) + (1 if is_inbound(msg) and msg.get('status') != 'read' else 0)
+            if wa_id not in newest or _to_num(msg.get('timestamp')) >= _to_num(newest[wa_id].get('timestamp')):
+                newest[wa_id] = msg
+        for wa_id, old_status, new_status in status_changes:
+            if not wa_id or old_status == new_status:
+                continue
+            if old_status != 'read' and new_status == 'read':
+                deltas[wa_id] = deltas.get(wa_id, 0) - 1
+            elif old_status == 'read' and new_status != 'read':
+                deltas[wa_id] = deltas.get(wa_id, 0) + 1
+        ops = []
+        for wa_id in set(deltas) | set(newest):
+            if wa_id in names:
+                ops.append(UpdateOne(
+                    {'_id': wa_id},
+                    {'$inc': {'unread_count': deltas.get(wa_id, 0)},
+                     '$setOnInsert': {'name': names[wa_id], 'last_message': '', 'last_timestamp': 0}},
+                    upsert=True,
+                ))
+            elif deltas.get(wa_id):
+                ops.append(UpdateOne({'_id': wa_id}, {'$inc': {'unread_count': deltas[wa_id]}}))
+            if wa_id in newest:
+                msg = newest[wa_id]
+                ts = _to_num(msg.get('timestamp'))
+                ops.append(UpdateOne(
+                    {'_id': wa_id, 'last_timestamp': {'$lte': ts}},
+                    {'$set': {'last_message': (msg.get('text') or {}).get('body', ''), 'last_timestamp': ts}},
+                ))
+        if ops:
+            # Ordered so each chat's upsert lands before its conditional last-message update
+            self.collection.bulk_write(ops, ordered=True)
+
+    def record_read(self, wa_id, up_to, marked):
+        """Take ``marked`` messages off the unread count and advance the read watermark. Returns the new summary."""
+        return self.collection.find_one_and_update(
+            {'_id': wa_id},
+            {'$inc': {'unread_count': -marked}, '$max': {'read_up_to': up_to}},
+            projection={'unread_count': 1, 'read_up_to': 1},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def list(self):
+        """Every summary, newest conversation first."""
+        fields = {'name': 1, 'last_message': 1, 'last_timestamp': 1, 'unread_count': 1}
+        return list(self.collection.find({}, fields).sort('last_timestamp', DESCENDING))
+
+    def rebuild(self, messages_collection):
+        """Recompute every summary from the messages collection in one streaming pass."""
+        groups = {}
+        cursor = messages_collection.find({}, {'_id': 0, 'wa_id': 1, 'from': 1, 'name': 1, 'timestamp': 1, 'text.body': 1, 'status': 1})
+        for doc in cursor:
+            wa_id = doc.get('wa_id')
+            if not wa_id:
+                continue
+            group = groups.setdefault(wa_id, {
+                '_id': wa_id,
+                'name': doc.get('name', 'Unknown'),
+                'last_message': '',
+                'last_timestamp': 0,
+                'unread_count': 0
+            })
+            ts = _to_num(doc.get('timestamp', 0))
+            if ts >= group['last_timestamp']:
+                group['last_message'] = (doc.get('text') or {}).get('body', '')
+                group['last_timestamp'] = ts
+            if is_inbound(doc) and doc.get('status') != 'read':
+                group['unread_count'] += 1
+        self.collection.delete_many({'_id': {'$nin': list(groups)}})
+        if groups:
+            # $set rather than a replace, so read watermarks survive
+            self.collection.bulk_write([UpdateOne({'_id': wa_id}, {'$set': {k: v for k, v in g.items() if k != '_id'}}, upsert=True)
+                                        for wa_id, g in groups.items()], ordered=False)
+        return len(groups)
+
+
+def update_statuses(messages_collection, summaries, latest, sequence=None):
+    """Apply ``{message_id: status}`` with one read, one bulk write and one summary write.
+
+    Only forward transitions are written. Returns ``[{wa_id, id, status, seq}]``
+    for the messages that changed.
+    """
+    if not latest:
+        return []
+    before = {}
+    for doc in messages_collection.find({'wamid': {'$in': list(latest)}}, {'_id': 0, 'wamid': 1, 'wa_id': 1, 'from': 1, 'status': 1}):
+        before[doc['wamid']] = doc
+    todo = [(mid, s) for mid, s in latest.items() if mid in before and is_forward(before[mid].get('status'), s)]
+    if not todo:
+        return []
+    if sequence is None:
+        return _apply_statuses(messages_collection, summaries, before, todo, None)
+    with sequence.reserve(len(todo)) as first:
+        return _apply_statuses(messages_collection, summaries, before, todo, first)
+
+
+def _apply_statuses(messages_collection, summaries, before, todo, first):
+    ops = []
+    applied = []
+    for i, (mid, s) in enumerate(todo):
+        changes = {'status': s} if first is None else {'status': s, 'seq': first + i}
+        ops.append(UpdateOne({'wamid': mid, 'status': _status_filter(s)}, {'$set': changes}))
+        applied.append({'wa_id': before[mid].get('wa_id'), 'id': mid, 'status': s, 'seq': changes.get('seq')})
+    messages_collection.bulk_write(ops, ordered=False)
+    if summaries is not None:
+        summaries.record_batch([], [(before[mid].get('wa_id'), before[mid].get('status'), s)
+                                    for mid, s in todo if is_inbound(before[mid])])
+    return applied
+
+
+if __name__ == '__main__':
+    # Usage: python chat_summary.py rebuild
+    from pymongo import MongoClient
+    from config import MONGO_URI
+
+    if sys.argv[1:] != ['rebuild']:
+        print("Usage: python chat_summary.py rebuild")
+        sys.exit(1)
+    client = MongoClient(MONGO_URI)
+    db = client['whatsapp']
+    count = ChatSummaryStore(db['chat_summaries']).rebuild(db['processed_messages'])
+    print(f"✅ Rebuilt {count} chat summaries")
@@ -3,3 +3,39 @@ import os
 
 # Read from environment. Set this on your hosting platform.
 MONGO_URI = os.environ.get("MONGO_URI", "")
+# Connections per worker, and how long to wait for MongoDB before failing over to the local store
+MONGO_POOL_SIZE = int(os.environ.get("MONGO_POOL_SIZE", "20"))
+MONGO_TIMEOUT_MS = int(os.environ.get("MONGO_TIMEOUT_MS", "2000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get("MONGO_SOCKET_TIMEOUT_MS", "5000"))
+
+# Inter-worker bus for realtime events: local:///tmp/whatsapp-bus.sock or redis://...
+# Leave empty for a single worker.
+MESSAGE_QUEUE = os.environ.get("MESSAGE_QUEUE", "")
+
+# In-memory fallback store (no MONGO_URI): messages kept per chat, and the
+# total size after which the least recently used chats are dropped
+MEMORY_MAX_PER_CHAT = int(os.environ.get("MEMORY_MAX_PER_CHAT", "5000"))
+MEMORY_BUDGET_MB = int(os.environ.get("MEMORY_BUDGET_MB", "64"))
+
+# Directory for the durable local log store used instead of the in-memory
+# fallback when MongoDB is unavailable (single worker only). LOCAL_SYNC is
+# group (writers wait for a shared fsync), interval or none.
+LOCAL_DATA_DIR = os.environ.get("LOCAL_DATA_DIR", "")
+LOCAL_SYNC = os.environ.get("LOCAL_SYNC", "group")
+
+# Webhook payload files served alongside the database (and ingested into an empty one)
+PAYLOADS_DIR = os.environ.get("PAYLOADS_DIR", "payloads")
+
+# DEBUG, INFO, WARNING or ERROR; LOG_FORMAT is text or json (one object per line)
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+
+# Uploaded attachments (content-addressed, see media_store.py) and the largest accepted upload
+MEDIA_DIR = os.environ.get("MEDIA_DIR", "media")
+MEDIA_MAX_MB = int(os.environ.get("MEDIA_MAX_MB", "16"))
+
+# Cold tier (see archive.py): messages older than ARCHIVE_AFTER_DAYS are moved out of
+# MongoDB or the local store into ARCHIVE_DIR every ARCHIVE_INTERVAL_SECONDS. Empty disables it.
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", "")
+ARCHIVE_AFTER_DAYS = float(os.environ.get("ARCHIVE_AFTER_DAYS", "30"))
+ARCHIVE_INTERVAL_SECONDS = float(os.environ.get("ARCHIVE_INTERVAL_SECONDS", "3600"))
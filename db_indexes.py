@@ -0,0 +1,178 @@
+import sys
+import logging
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from pagination import mongo_page_query, DEFAULT_PAGE_SIZE
+
+log = logging.getLogger(__name__)
+
+MESSAGES = 'processed_messages'
+SUMMARIES = 'chat_summaries'
+
+# Statuses that count towards a chat's unread_count (for incoming messages)
+UNREAD_STATUSES = ['sent', 'delivered']
+
+MESSAGE_INDEXES = [
+    # Every message lookup by id goes through wamid (send_message sets wamid == id)
+    IndexModel([('wamid', ASCENDING)], name='wamid_unique', unique=True,
+               partialFilterExpression={'wamid': {'$exists': True}}),
+    # History: {wa_id}.sort(timestamp) and (timestamp, wamid) page cursors
+    IndexModel([('wa_id', ASCENDING), ('timestamp', ASCENDING), ('wamid', ASCENDING)], name='wa_id_timestamp_wamid'),
+    # /sync: changes after a sequence number
+    IndexModel([('seq', ASCENDING)], name='seq'),
+    # Unread messages per chat; $in in a partial filter needs MongoDB 6.0+
+    IndexModel([('wa_id', ASCENDING), ('status', ASCENDING), ('timestamp', ASCENDING)], name='unread_by_chat',
+               partialFilterExpression={'status': {'$in': UNREAD_STATUSES}}),
+]
+
+SUMMARY_INDEXES = [
+    # /chats lists conversations newest first
+    IndexModel([('last_timestamp', DESCENDING)], name='last_timestamp'),
+]
+
+
+def ensure_indexes(collection, indexes=MESSAGE_INDEXES):
+    """Create indexes (processed_messages' by default). Safe to call on every startup."""
+    created = []
+    for index in indexes:
+        try:
+            created.extend(collection.create_indexes([index]))
+        except OperationFailure as e:
+            log.error("Could not create index %s: %s", index.document['name'], e)
+    return created
+
+
+def hot_queries(sample_wa_id='0', sample_wamid='0'):
+    """``(description, collection, filter, sort, limit)`` for the queries the app runs on every request or write."""
+    page_query, page_sort, _ = mongo_page_query(sample_wa_id, before=(0.0, sample_wamid))
+    return [
+        ("history by wa_id sorted by timestamp",
+         MESSAGES, {'wa_id': sample_wa_id}, [('timestamp', ASCENDING)], None),
+        ("history page before a cursor",
+         MESSAGES, page_query, page_sort, DEFAULT_PAGE_SIZE + 1),
+        ("message by wamid",
+         MESSAGES, {'wamid': sample_wamid}, None, None),
+        ("messages by wamid batch",
+         MESSAGES, {'wamid': {'$in': [sample_wamid]}}, None, None),
+        ("changes since a sequence number",
+         MESSAGES, {'seq': {'$gt': 0, '$lte': 1}}, [('seq', ASCENDING)], DEFAULT_PAGE_SIZE + 1),
+        ("unread messages by wa_id",
+         MESSAGES, {'wa_id': sample_wa_id, 'status': {'$in': UNREAD_STATUSES}}, None, None),
+        ("mark read up to a timestamp",
+         MESSAGES, {'wa_id': sample_wa_id, 'from': sample_wa_id, 'status': {'$in': UNREAD_STATUSES},
+                    'timestamp': {'$lte': 0.0}}, None, None),
+        ("chat list newest first",
+         SUMMARIES, {}, [('last_timestamp', DESCENDING)], None),
+    ]
+
+
+def _stages(plan):
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from _stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _stages(item)
+
+
+def check_query_plans(db):
+    """Explain every hot query and raise RuntimeError if any winning plan is a COLLSCAN."""
+    failures = []
+    for description, name, query, sort, limit in hot_queries():
+        cursor = db[name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        winning = cursor.explain().get('queryPlanner', {}).get('winningPlan', {})
+        if 'COLLSCAN' in set(_stages(winning)):
+            failures.append(description)
+    if failures:
+        raise RuntimeError(f"Hot queries fall back to COLLSCAN: {', '.join(failures)}")
+
+
+def _predicates(query):
+    """Fields an index scan could be bounded on: top-level ones, plus any every ``$or`` branch shares."""
+    fields = {k: v for k, v in query.items() if not k.startswith('$')}
+    branches = query.get('$or')
+    if branches:
+        shared = set.intersection(*(set(b) for b in branches))
+        fields.update({k: branches[0][k] for k in shared if k not in fields})
+    return {k for k, v in fields.items() if _bounds(v)}
+
+
+def _bounds(condition):
+    if not isinstance(condition, dict):
+        return True
+    # Negations alone can't bound a scan
+    return any(op not in ('$ne', '$nin', '$not') and not (op == '$exists' and not v) for op, v in condition.items())
+
+
+def _implies(query, partial):
+    for field, condition in (partial or {}).items():
+        value = query.get(field)
+        if value is None:
+            return False
+        if condition == {'$exists': True}:
+            continue
+        if isinstance(condition, dict) and '$in' in condition:
+            values = value['$in'] if isinstance(value, dict) and '$in' in value else [value]
+            if not set(values) <= set(condition['$in']):
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+def _serves(key, partial, query, sort):
+    if not _implies(query, partial):
+        return False
+    if key[0][0] in _predicates(query):
+        return True
+    if not sort:
+        return False
+    sort = [(f, int(d)) for f, d in sort]
+    flipped = [(f, -d) for f, d in sort]
+    return key[:len(sort)] in (sort, flipped)
+
+
+def unindexed_queries(db):
+    """Hot queries that none of the indexes on their collection can serve.
+
+    Works from ``index_information()`` alone, so it also runs against a test
+    double: a query is served when an index's leading field bounds it (and
+    the query implies the index's partial filter) or when its sort matches
+    an index prefix. ``check_query_plans`` asks a real server instead.
+    """
+    indexes = {}
+    missing = []
+    for description, name, query, sort, _ in hot_queries():
+        if name not in indexes:
+            indexes[name] = [([(f, int(d)) for f, d in info['key']], info.get('partialFilterExpression'))
+                             for index_name, info in db[name].index_information().items() if index_name != '_id_']
+        if not any(_serves(key, partial, query, sort) for key, partial in indexes[name]):
+            missing.append(description)
+    return missing
+
+if __name__ == '__main__':
+    # Usage: python db_indexes.py [ensure|check]
+    from pymongo import MongoClient
+    from config import MONGO_URI
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'check'
+    db = MongoClient(MONGO_URI)['whatsapp']
+    if command == 'ensure':
+        created = ensure_indexes(db[MESSAGES]) + ensure_indexes(db[SUMMARIES], SUMMARY_INDEXES)
+        print(f"✅ Indexes: {created}")
+    elif command == 'check':
+        try:
+            check_query_plans(db)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        print("✅ All hot queries are index-backed")
+    else:
+        print("Usage: python db_indexes.py [ensure|check]")
+        sys.exit(1)
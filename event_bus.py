@@ -0,0 +1,273 @@
+"""Inter-process event bus so several gunicorn workers share realtime events.
+
+Socket.IO emits and SSE events published in one worker must reach sockets
+and streams held by the others. The bus carries JSON messages on named
+channels to every subscribed process (including the publisher):
+
+    local:///tmp/whatsapp-bus.sock   in-repo hub over a Unix socket, no services needed
+    redis://host:6379/0              Redis pub/sub (needs the ``redis`` package)
+
+Run the local hub by hand with ``python event_bus.py hub /tmp/whatsapp-bus.sock``;
+gunicorn.conf.py starts it automatically when it runs more than one worker.
+"""
+import os
+import sys
+import logging
+import queue
+import socket
+import threading
+import socketserver
+
+import eventlet
+from eventlet.queue import LightQueue
+import socketio
+
+import fast_json
+
+log = logging.getLogger(__name__)
+
+DEFAULT_LOCAL_PATH = '/tmp/whatsapp-bus.sock'
+HUB_CLIENT_BUFFER = 10000
+RECONNECT_DELAY = 1.0
+
+
+def _frame(channel, data):
+    return (fast_json.dumps({'c': channel, 'd': data}) + '\n').encode()
+
+
+class LocalBus:
+    """Client for the local hub: newline-delimited JSON frames over a Unix socket.
+
+    One connection per process, owned by a reader greenlet that reconnects
+    if the hub restarts. Messages published while disconnected are dropped
+    (and counted); clients recover through /sync like after any other gap.
+    """
+
+    def __init__(self, path=DEFAULT_LOCAL_PATH):
+        self.path = path
+        self._handlers = {}
+        self._sock = None
+        self._lock = eventlet.semaphore.Semaphore()
+        self._reader = None
+        self.published = 0
+        self.received = 0
+        self.dropped = 0
+
+    def subscribe(self, channel, callback):
+        self._handlers.setdefault(channel, []).append(callback)
+        if self._reader is None:
+            self._reader = eventlet.spawn(self._read_loop)
+
+    def publish(self, channel, data):
+        frame = _frame(channel, data)
+        with self._lock:
+            try:
+                if self._sock is None:
+                    self._connect()
+                self._sock.sendall(frame)
+                self.published += 1
+            except OSError as e:
+                self.dropped += 1
+                self._sock = None
+                log.warning("Event bus publish failed (%s); message dropped", e)
+
+    def _connect(self):
+        from eventlet.green import socket as green_socket
+        sock = green_socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        self._sock = sock
+        return sock
+
+    def _read_loop(self):
+        while True:
+            try:
+                with self._lock:
+                    sock = self._sock or self._connect()
+                for line in sock.makefile('rb'):
+                    self._dispatch(line)
+            except OSError as e:
+                log.warning("Event bus connection lost (%s); reconnecting", e)
+            with self._lock:
+                self._sock = None
+            eventlet.sleep(RECONNECT_DELAY)
+
+    def _dispatch(self, line):
+        try:
+            msg = fast_json.loads(line)
+        except ValueError:
+            return
+        self.received += 1
+        for callback in self._handlers.get(msg.get('c'), []):
+            try:
+                callback(msg.get('d'))
+            except Exception as e:
+                log.exception("Event bus handler for %s failed: %s", msg.get('c'), e)
+
+    def stats(self):
+        return {'backend': 'local', 'published': self.published,
+                'received': self.received, 'dropped': self.dropped}
+
+
+class RedisBus:
+    """Redis pub/sub: one Redis channel per bus channel."""
+
+    def __init__(self, url, prefix='whatsapp:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("MESSAGE_QUEUE=redis://... needs the 'redis' package (pip install redis)")
+        self.prefix = prefix
+        self._redis = redis.Redis.from_url(url)
+        self._pubsub = None
+        self._handlers = {}
+        self.published = 0
+        self.received = 0
+        self.dropped = 0
+
+    def subscribe(self, channel, callback):
+        self._handlers.setdefault(channel, []).append(callback)
+        if self._pubsub is None:
+            self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            self._pubsub.subscribe(self.prefix + channel)
+            eventlet.spawn(self._read_loop)
+        else:
+            self._pubsub.subscribe(self.prefix + channel)
+
+    def publish(self, channel, data):
+        try:
+            self._redis.publish(self.prefix + channel, fast_json.dumps(data))
+            self.published += 1
+        except Exception as e:
+            self.dropped += 1
+            log.warning("Event bus publish failed (%s); message dropped", e)
+
+    def _read_loop(self):
+        while True:
+            try:
+                for msg in self._pubsub.listen():
+                    channel = msg['channel'].decode()[len(self.prefix):]
+                    self.received += 1
+                    for callback in self._handlers.get(channel, []):
+                        callback(fast_json.loads(msg['data']))
+            except Exception as e:
+                log.warning("Event bus connection lost (%s); reconnecting", e)
+                eventlet.sleep(RECONNECT_DELAY)
+
+    def stats(self):
+        return {'backend': 'redis', 'published': self.published,
+                'received': self.received, 'dropped': self.dropped}
+
+
+def make_bus(url):
+    """Bus for a MESSAGE_QUEUE url, or None to keep everything in this process."""
+    if not url:
+        return None
+    path = hub_path(url)
+    if path:
+        return LocalBus(path)
+    if url.startswith(('redis://', 'rediss://')):
+        return RedisBus(url)
+    raise ValueError(f"Unsupported MESSAGE_QUEUE {url!r}; use local:///path.sock or redis://")
+
+
+class BusManager(socketio.PubSubManager):
+    """Socket.IO client manager that relays emits between workers over an event bus."""
+
+    name = 'event-bus'
+
+    def __init__(self, bus, channel='socketio', write_only=False, logger=None):
+        self.bus = bus
+        self._inbox = LightQueue()
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+
+    def initialize(self):
+        if not self.write_only:
+            self.bus.subscribe(self.channel, self._inbox.put)
+        super().initialize()
+
+    def _publish(self, data):
+        self.bus.publish(self.channel, data)
+
+    def _listen(self):
+        while True:
+            yield self._inbox.get()
+
+
+# --- Local hub -----------------------------------------------------------
+
+class _HubHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        hub = self.server
+        outbox = queue.Queue(HUB_CLIENT_BUFFER)
+        writer = threading.Thread(target=self._write_loop, args=(outbox,), daemon=True)
+        writer.start()
+        with hub.lock:
+            hub.clients.add(outbox)
+        try:
+            for line in self.rfile:
+                hub.relayed += 1
+                with hub.lock:
+                    clients = list(hub.clients)
+                for client in clients:
+                    try:
+                        client.put_nowait(line)
+                    except queue.Full:
+                        # A stuck worker must not stall the others
+                        hub.dropped += 1
+        finally:
+            with hub.lock:
+                hub.clients.discard(outbox)
+            outbox.put(None)
+
+    def _write_loop(self, outbox):
+        while True:
+            line = outbox.get()
+            if line is None:
+                return
+            try:
+                self.wfile.write(line)
+            except (OSError, ValueError):
+                return
+
+
+class LocalHub(socketserver.ThreadingUnixStreamServer):
+    """Relays every frame it receives to every connected worker."""
+
+    daemon_threads = True
+
+    def __init__(self, path):
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, _HubHandler)
+        self.path = path
+        self.lock = threading.Lock()
+        self.clients = set()
+        self.relayed = 0
+        self.dropped = 0
+
+
+def run_hub(path=DEFAULT_LOCAL_PATH):
+    hub = LocalHub(path)
+    print(f"🔀 Event bus hub listening on {path}")
+    try:
+        hub.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        hub.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def hub_path(url):
+    """Socket path if ``url`` is a local:// bus, else None."""
+    if url and url.startswith(('local://', 'unix://')):
+        return url.split('://', 1)[1] or DEFAULT_LOCAL_PATH
+    return None
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'hub':
+        print("Usage: python event_bus.py hub [socket_path]")
+        sys.exit(1)
+    run_hub(sys.argv[2] if len(sys.argv) > 2 else DEFAULT_LOCAL_PATH)
@@ -0,0 +1,123 @@
+"""One JSON encoder for HTTP responses, Socket.IO packets, SSE and the event bus.
+
+Uses orjson (listed in requirements.txt), or the stdlib ``json`` module if
+it cannot be imported, e.g. on a platform without a wheel; both produce compact output and encode BSON types (ObjectId, datetime) the
+way ``bson.json_util`` does. The module itself can be passed as the
+``json`` option of python-socketio, which calls ``dumps(obj, separators=...)``
+and ``loads(s)``.
+
+``Encoded`` wraps a value that is sent several times (one new message goes
+to SSE, to Socket.IO and over the bus): it is serialized on first use and
+the text is spliced into every envelope that contains it afterwards.
+"""
+import json
+
+from bson import json_util
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:  # required, but a missing wheel should not take the app down
+    orjson = None
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+
+class Encoded:
+    """A value plus its JSON text, computed once."""
+
+    __slots__ = ('value', '_json')
+
+    def __init__(self, value):
+        self.value = value
+        self._json = None
+
+    @property
+    def json(self):
+        if self._json is None:
+            self._json = _dumps(self.value)
+        return self._json
+
+
+class _Splice(Exception):
+    """Raised from the ``default`` hook when an ``Encoded`` is found, to switch to the splicing encoder."""
+
+
+def _default(obj):
+    if isinstance(obj, Encoded):
+        raise _Splice()
+    try:
+        return json_util.default(obj)
+    except TypeError:
+        return str(obj)
+
+
+if orjson is not None:
+    # Datetimes go through _default so they match json_util's {"$date": ...}
+    _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def _dumps(obj):
+        try:
+            return orjson.dumps(obj, default=_default, option=_OPTIONS).decode()
+        except orjson.JSONEncodeError as e:
+            if isinstance(e.__cause__, _Splice):
+                raise e.__cause__
+            # Integers past 64 bits and other values orjson refuses
+            return json.dumps(obj, default=_default, separators=(',', ':'), ensure_ascii=False)
+
+    def loads(s):
+        return orjson.loads(s)
+else:
+    def _dumps(obj):
+        return json.dumps(obj, default=_default, separators=(',', ':'), ensure_ascii=False)
+
+    def loads(s):
+        return json.loads(s)
+
+
+def _splice(obj):
+    if isinstance(obj, Encoded):
+        return obj.json
+    if isinstance(obj, dict):
+        return '{' + ','.join(f'{_dumps(str(k))}:{_splice(v)}' for k, v in obj.items()) + '}'
+    if isinstance(obj, (list, tuple)):
+        return '[' + ','.join(_splice(v) for v in obj) + ']'
+    return _dumps(obj)
+
+
+def _has_encoded(obj, depth=3):
+    """Cheap look for an ``Encoded`` near the top of a small envelope, where they are put."""
+    if isinstance(obj, Encoded):
+        return True
+    if depth == 0 or not isinstance(obj, (dict, list, tuple)) or len(obj) > 8:
+        return False
+    return any(_has_encoded(v, depth - 1) for v in (obj.values() if isinstance(obj, dict) else obj))
+
+
+def dumps(obj, **kwargs):
+    """Compact JSON text of ``obj``. Keyword arguments (``separators`` etc.) are accepted and ignored."""
+    if isinstance(obj, Encoded):
+        return obj.json
+    if _has_encoded(obj):
+        return _splice(obj)
+    try:
+        return _dumps(obj)
+    except _Splice:
+        # Nested deeper than _has_encoded looks
+        return _splice(obj)
+
+
+class FastJSONProvider(JSONProvider):
+    """Flask JSON provider so ``jsonify`` and ``request.get_json`` use the same encoder."""
+
+    mimetype = 'application/json'
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj)
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype=self.mimetype)
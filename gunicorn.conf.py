@@ -1,3 +1,34 @@
-workers = 1
+import os
+import sys
+import subprocess
+
+# Socket.IO and SSE state is per worker; with more than one worker the
+# load balancer must use sticky sessions (or clients the websocket transport
+# only) and realtime events go through MESSAGE_QUEUE (see event_bus.py).
+workers = int(os.environ.get("WEB_CONCURRENCY", "1"))
 worker_class = "eventlet"
 bind = "0.0.0.0:10000"
+# Each open SSE stream holds a connection; the eventlet default of 1000 is too low
+worker_connections = 10000
+
+if workers > 1:
+    # Workers inherit this; default to the in-repo hub so no extra service is needed
+    os.environ.setdefault("MESSAGE_QUEUE", "local:///tmp/whatsapp-bus.sock")
+
+_hub = None
+
+
+def on_starting(server):
+    global _hub
+    from event_bus import hub_path
+    path = hub_path(os.environ.get("MESSAGE_QUEUE", ""))
+    if path:
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "event_bus.py")
+        _hub = subprocess.Popen([sys.executable, script, "hub", path])
+    if workers > 1 and not os.environ.get("MONGO_URI"):
+        server.log.warning("Running %d workers without MONGO_URI: in-memory messages are per worker", workers)
+
+
+def on_exit(server):
+    if _hub is not None:
+        _hub.terminate()
@@ -0,0 +1,208 @@
+"""Conditional GET for the chat endpoints and precompressed static assets.
+
+``ConversationVersions`` keeps a counter per conversation plus one for the
+chat list. Every write bumps them, so an ETag can be built from counters
+alone and a matching ``If-None-Match`` answered with 304 before storage is
+touched. Counters live in process memory: the ETag carries a per-process
+epoch, so a restarted or different worker never mistakes another's tags.
+
+``StaticAssets`` loads the frontend once, gzip- (and brotli-, when the
+``brotli`` module is installed) compresses the text files, and rewrites
+``/Frontened/...`` references to ``?v=<content hash>`` so versioned URLs
+can be cached for a year. Unversioned URLs (index.html, bookmarks)
+revalidate with an ETag.
+"""
+import os
+import re
+import gzip
+import time
+import uuid
+import hashlib
+import mimetypes
+import threading
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # optional: pip install brotli
+    brotli = None
+
+COMPRESSIBLE = ('.html', '.css', '.js', '.svg', '.json', '.txt')
+# Files smaller than this go out as they are
+MIN_COMPRESS_BYTES = 256
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+
+class ConversationVersions:
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.list_version = 0
+        self._chats = {}  # wa_id -> version
+        self.hits = 0
+        self.misses = 0
+
+    def bump(self, wa_ids):
+        for wa_id in wa_ids:
+            self._chats[wa_id] = self._chats.get(wa_id, 0) + 1
+        self.list_version += 1
+
+    def chat_etag(self, wa_id, *context):
+        return '-'.join(map(str, (self.epoch, self._chats.get(wa_id, 0)) + context))
+
+    def list_etag(self, *context):
+        return '-'.join(map(str, (self.epoch, self.list_version) + context))
+
+    def not_modified(self, etag):
+        """A 304 for ``etag`` if the request already has it, else None."""
+        if request.if_none_match.contains(etag):
+            self.hits += 1
+            resp = Response(status=304)
+            resp.set_etag(etag)
+            resp.headers['Cache-Control'] = REVALIDATE
+            return resp
+        self.misses += 1
+        return None
+
+    @staticmethod
+    def tag(resp, etag):
+        resp.set_etag(etag)
+        # Browsers revalidate on every fetch and reuse their copy on 304
+        resp.headers['Cache-Control'] = REVALIDATE
+        return resp
+
+    def stats(self):
+        return {"epoch": self.epoch, "conversations": len(self._chats), "list_version": self.list_version,
+                "not_modified": self.hits, "full_responses": self.misses}
+
+
+class _Asset:
+    __slots__ = ('body', 'gzip', 'br', 'etag', 'mimetype', 'mtime')
+
+
+class StaticAssets:
+    def __init__(self, root, url_prefix='/Frontened', check_interval=2.0):
+        self.root = root
+        self.url_prefix = url_prefix
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._assets = {}
+        self._last_check = 0.0
+        self._ref_re = re.compile(re.escape(url_prefix) + r'/([\w./-]+)')
+        self.load()
+
+    def _scan(self):
+        files = {}
+        for dirpath, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(dirpath, name)
+                rel = os.path.relpath(path, self.root).replace(os.sep, '/')
+                files[rel] = path
+        return files
+
+    def load(self):
+        """Read, version and compress every file under ``root``."""
+        raw = {}
+        mtimes = {}
+        for rel, path in self._scan().items():
+            with open(path, 'rb') as f:
+                raw[rel] = f.read()
+            mtimes[rel] = os.stat(path).st_mtime
+        hashes = {}
+        bodies = {}
+        # Files are versioned after the files they reference (html -> css -> svg), so
+        # a changed icon changes the stylesheet's hash and, through it, the page's
+        pending = set(raw)
+        while pending:
+            progressed = False
+            for rel in sorted(pending):
+                body = raw[rel]
+                refs = set()
+                if rel.endswith(COMPRESSIBLE):
+                    refs = {m for m in self._ref_re.findall(body.decode('utf-8', 'replace')) if m in raw and m != rel}
+                if refs & pending:
+                    continue
+                if refs:
+                    body = self._ref_re.sub(
+                        lambda m: f"{m.group(0)}?v={hashes[m.group(1)]}" if m.group(1) in hashes else m.group(0),
+                        body.decode('utf-8')).encode('utf-8')
+                bodies[rel] = body
+                hashes[rel] = hashlib.sha1(body).hexdigest()[:12]
+                pending.discard(rel)
+                progressed = True
+            if not progressed:
+                # Reference cycle: serve the rest unrewritten
+                for rel in pending:
+                    bodies[rel] = raw[rel]
+                    hashes[rel] = hashlib.sha1(raw[rel]).hexdigest()[:12]
+                break
+        assets = {}
+        for rel, body in bodies.items():
+            asset = _Asset()
+            asset.body = body
+            asset.etag = hashes[rel]
+            asset.mtime = mtimes[rel]
+            asset.mimetype = mimetypes.guess_type(rel)[0] or 'application/octet-stream'
+            compress = rel.endswith(COMPRESSIBLE) and len(body) >= MIN_COMPRESS_BYTES
+            asset.gzip = gzip.compress(body, 9, mtime=0) if compress else None
+            asset.br = brotli.compress(body) if compress and brotli is not None else None
+            assets[rel] = asset
+        with self._lock:
+            self._assets = assets
+            self._last_check = time.monotonic()
+        return len(assets)
+
+    def _maybe_reload(self):
+        if time.monotonic() - self._last_check < self.check_interval:
+            return
+        self._last_check = time.monotonic()
+        files = self._scan()
+        changed = set(files) != set(self._assets)
+        if not changed:
+            for rel, path in files.items():
+                try:
+                    if os.stat(path).st_mtime != self._assets[rel].mtime:
+                        changed = True
+                        break
+                except OSError:
+                    changed = True
+                    break
+        if changed:
+            self.load()
+
+    def response(self, rel):
+        """Serve ``rel`` with the best encoding the client accepts. None if there is no such file."""
+        self._maybe_reload()
+        asset = self._assets.get(rel)
+        if asset is None:
+            return None
+        accept = request.accept_encodings
+        if asset.br is not None and accept['br']:
+            body, encoding = asset.br, 'br'
+        elif asset.gzip is not None and accept['gzip']:
+            body, encoding = asset.gzip, 'gzip'
+        else:
+            body, encoding = asset.body, None
+        # One ETag per encoding, as the bytes differ
+        etag = asset.etag + ('-' + encoding if encoding else '')
+        versioned = request.args.get('v') == asset.etag
+        if request.if_none_match.contains(etag):
+            resp = Response(status=304)
+        else:
+            resp = Response(body, mimetype=asset.mimetype)
+            if encoding:
+                resp.headers['Content-Encoding'] = encoding
+        resp.set_etag(etag)
+        resp.headers['Cache-Control'] = IMMUTABLE if versioned else REVALIDATE
+        if asset.gzip is not None:
+            resp.headers['Vary'] = 'Accept-Encoding'
+        return resp
+
+    def stats(self):
+        return {
+            "files": len(self._assets),
+            "bytes": sum(len(a.body) for a in self._assets.values()),
+            "gzip_bytes": sum(len(a.gzip or a.body) for a in self._assets.values()),
+            "brotli": brotli is not None,
+        }
@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import logging
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from chat_summary import update_statuses
+from media_store import MEDIA_TYPES
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+class IngestStats:
+    def __init__(self):
+        self.files = 0
+        self.messages = 0
+        self.inserted = 0
+        self.statuses = 0
+        self.status_matched = 0
+        self.round_trips = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def docs_per_sec(self):
+        return (self.messages + self.statuses) / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (f"files={self.files} messages={self.messages} inserted={self.inserted} "
+                f"statuses={self.statuses} matched={self.status_matched} "
+                f"round_trips={self.round_trips} elapsed={self.elapsed:.3f}s "
+                f"docs/sec={self.docs_per_sec:.0f}")
+
+
+def _to_num(ts):
+    try:
+        return float(ts)
+    except Exception:
+        return 0.0
+
+
+def normalize_timestamps(collection, batch_size=DEFAULT_BATCH_SIZE):
+    """Convert string timestamps left by older ingests to numbers. Returns the number of documents fixed."""
+    fixed = 0
+    ops = []
+    for doc in collection.find({'timestamp': {'$type': 'string'}}, {'_id': 1, 'timestamp': 1}):
+        ops.append(UpdateOne({'_id': doc['_id']}, {'$set': {'timestamp': _to_num(doc['timestamp'])}}))
+        if len(ops) >= batch_size:
+            fixed += collection.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        fixed += collection.bulk_write(ops, ordered=False).modified_count
+    return fixed
+
+
+def iter_changes(data):
+    """Yield ``(wa_id, profile_name, value)`` for every change of every entry in a payload."""
+    for ent in (data.get('metaData', {}).get('entry', []) or []):
+        for change in (ent.get('changes', []) or []):
+            value = change.get('value', {}) or {}
+            contacts = (value.get('contacts') or [{}])
+            first_contact = contacts[0] if contacts else {}
+            wa_id = first_contact.get('wa_id') or 'unknown'
+            profile_name = (first_contact.get('profile') or {}).get('name') or 'Unknown'
+            yield wa_id, profile_name, value
+
+
+def iter_payload_files(payloads_dir):
+    """Yield ``(filename, data)`` for each parseable JSON file, in filename order."""
+    for filename in sorted(os.listdir(payloads_dir)):
+        if not filename.endswith('.json'):
+            continue
+        filepath = os.path.join(payloads_dir, filename)
+        with open(filepath, 'r', encoding='utf-8') as f:
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError:
+                log.warning("Failed to parse %s", filename)
+                continue
+        yield filename, data
+
+
+# Projection for messages returned by the API: no _id, nothing the client does not read
+MESSAGE_FIELDS = {'_id': 0, 'id': 1, 'wamid': 1, 'wa_id': 1, 'name': 1, 'from': 1, 'timestamp': 1,
+                  'type': 1, 'text': 1, 'media': 1, 'provider_media': 1, 'status': 1, 'seq': 1, 'created_seq': 1}
+
+
+def message_doc(msg, wa_id, profile_name):
+    """Stored form of one webhook message, or None if it has no id."""
+    msg_id = msg.get('id')
+    if not msg_id:
+        return None
+    doc = dict(msg)
+    doc['wa_id'] = wa_id
+    doc['name'] = profile_name
+    doc['status'] = doc.get('status') or 'sent'
+    doc['wamid'] = msg_id
+    # Numeric like send_message's, so range queries and page cursors see one type
+    doc['timestamp'] = _to_num(doc.get('timestamp'))
+    kind = doc.get('type')
+    if kind in MEDIA_TYPES and isinstance(doc.get(kind), dict):
+        # The provider's media id is not one of ours (/media/<id> would 404), so it is kept apart
+        # from ``media``, which only ever references a file in the media store
+        media = doc.pop(kind)
+        doc['provider_media'] = {k: media[k] for k in ('id', 'mime_type', 'filename') if media.get(k)}
+        doc.setdefault('text', {'body': media.get('caption') or ''})
+    return doc
+
+
+def status_message_id(status):
+    return status.get('id') or status.get('meta_msg_id') or (status.get('meta') or {}).get('meta_msg_id')
+
+
+class Ingestor:
+    """Batches webhook messages and statuses into unordered bulk upserts keyed on wamid.
+
+    Messages are written with ``$setOnInsert`` so re-ingesting the same
+    payloads is a no-op. Pending messages are always flushed before pending
+    statuses so a status never races ahead of the message it refers to.
+    """
+
+    def __init__(self, collection, summaries=None, batch_size=DEFAULT_BATCH_SIZE, sequence=None):
+        self.collection = collection
+        self.summaries = summaries
+        self.sequence = sequence
+        self.batch_size = batch_size
+        self.stats = IngestStats()
+        self._messages = []
+        self._statuses = []
+
+    def add_payload(self, data):
+        for wa_id, profile_name, value in iter_changes(data):
+            for msg in value.get('messages', []) or []:
+                self.add_message(msg, wa_id, profile_name)
+            for status in value.get('statuses', []) or []:
+                meta_id = status_message_id(status)
+                if meta_id and status.get('status'):
+                    self.add_status(meta_id, status['status'])
+
+    def add_message(self, msg, wa_id, profile_name):
+        doc = message_doc(msg, wa_id, profile_name)
+        if doc is not None:
+            self.add_document(doc)
+
+    def add_document(self, doc):
+        """Queue an already-normalized message document (see ``message_doc``)."""
+        self._messages.append(doc)
+        self.stats.messages += 1
+        if len(self._messages) + len(self._statuses) >= self.batch_size:
+            self.flush()
+
+    def add_status(self, message_id, status):
+        self._statuses.append((message_id, status))
+        self.stats.statuses += 1
+        if len(self._messages) + len(self._statuses) >= self.batch_size:
+            self.flush()
+
+    def _bulk(self, ops):
+        self.stats.round_trips += 1
+        try:
+            return self.collection.bulk_write(ops, ordered=False).bulk_api_result
+        except BulkWriteError as e:
+            # Duplicate-key races on wamid are harmless for idempotent upserts
+            log.warning("Bulk write reported %d errors", len(e.details.get('writeErrors', [])))
+            return e.details
+
+    def _flush_messages(self):
+        docs, self._messages = self._messages, []
+        if not docs:
+            return
+        # Later duplicates within a batch would only be no-op upserts
+        by_wamid = {}
+        for doc in docs:
+            by_wamid.setdefault(doc['wamid'], doc)
+        docs = list(by_wamid.values())
+        if self.sequence is None:
+            result = self._write_messages(docs)
+        else:
+            # One block of change numbers per batch (reserve + release); skipped numbers for duplicates are fine
+            self.stats.round_trips += 2
+            with self.sequence.reserve(len(docs)) as first:
+                for i, doc in enumerate(docs):
+                    doc['seq'] = doc['created_seq'] = first + i
+                result = self._write_messages(docs)
+        upserted = result.get('upserted', [])
+        self.stats.inserted += len(upserted)
+        if self.summaries is not None and upserted:
+            self.stats.round_trips += 1
+            self.summaries.record_batch([docs[u['index']] for u in upserted], [])
+
+    def _write_messages(self, docs):
+        return self._bulk([UpdateOne({'wamid': d['wamid']}, {'$setOnInsert': d}, upsert=True) for d in docs])
+
+    def _flush_statuses(self):
+        pending, self._statuses = self._statuses, []
+        if not pending:
+            return
+        # Last status per message wins within a batch
+        latest = {}
+        for message_id, status in pending:
+            latest[message_id] = status
+        # find + seq block and its release + bulk update + summary update
+        self.stats.round_trips += 2 + 2 * (self.sequence is not None) + (self.summaries is not None)
+        applied = update_statuses(self.collection, self.summaries, latest, sequence=self.sequence)
+        self.stats.status_matched += len(applied)
+
+    def flush(self):
+        self._flush_messages()
+        self._flush_statuses()
+
+    def finish(self):
+        self.flush()
+        self.stats.elapsed = time.perf_counter() - self.stats.started
+        return self.stats
+
+
+def ingest_directory(collection, payloads_dir, summaries=None, batch_size=DEFAULT_BATCH_SIZE, sequence=None):
+    """Ingest every payload file in ``payloads_dir``. Returns an IngestStats."""
+    ingestor = Ingestor(collection, summaries=summaries, batch_size=batch_size, sequence=sequence)
+    for filename, data in iter_payload_files(payloads_dir):
+        ingestor.stats.files += 1
+        ingestor.add_payload(data)
+    return ingestor.finish()
@@ -0,0 +1,689 @@
+"""Durable local message store: a segmented append-only log.
+
+Used instead of MemoryStore when LOCAL_DATA_DIR is set and MongoDB is not
+available, so sent messages and statuses survive restarts on a single
+node with no database service. It has the same interface as MemoryStore
+(add / get / set_status / messages / last / conversations / stats).
+
+Layout of LOCAL_DATA_DIR:
+
+    manifest.json        live segment numbers in log order, written atomically
+    seg-00000001.log     records: <body_len u32><crc32 u32><kind u8><body>
+
+A message body is ``wamid US wa_id US name US status US timestamp US
+direction RS json``, direction being ``in`` for the contact's messages and
+``out`` for the agent's (records written before the timestamp or the
+direction was added have four or five key fields and are read the same
+way, with the missing ones taken from the JSON), a status
+body is ``wamid US status`` and a drop (message moved to the archive, see
+archive.py) is ``wamid US wa_id`` (US/RS are the 0x1f/0x1e separators),
+so recovery rebuilds the indexes from the key fields without decoding JSON.
+
+In memory there is a wamid -> (location, status) index for O(1) dedupe and
+status updates, and per wa_id one ``array('Q')`` of record locations in
+(timestamp, wamid) order with an ``array('d')`` of their timestamps, so a
+history page is a bisect plus ``limit + 1`` record reads.
+Sealed segments are memory-mapped for reads. Writers share fsyncs (group
+commit), and ``compact()`` rewrites sealed segments with the current
+status folded into each message so status records stop taking space.
+
+Usage:
+    python log_store.py stats <dir>
+    python log_store.py compact <dir>
+"""
+import os
+import sys
+import json
+import mmap
+import zlib
+import time
+import struct
+import logging
+from array import array
+from bisect import bisect_left, bisect_right
+
+import eventlet
+from eventlet import tpool
+from eventlet.event import Event
+
+from chat_summary import is_inbound
+from memory_store import _to_num
+
+log = logging.getLogger(__name__)
+
+HEADER = struct.Struct('<IIB')
+KIND_MESSAGE = 1
+KIND_STATUS = 2
+KIND_DROP = 3
+US = b'\x1f'
+RS = b'\x1e'
+
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+DEFAULT_COMMIT_INTERVAL = 0.005
+SYNC_MODES = ('group', 'interval', 'none')
+
+# Status codes packed into the low bits of the index value; 3 = see _other_status
+STATUS_CODES = {'sent': 0, 'delivered': 1, 'read': 2}
+STATUS_NAMES = ['sent', 'delivered', 'read']
+OTHER_STATUS = 3
+
+
+def _pack(file_no, offset):
+    return (file_no << 32) | offset
+
+
+def _inbound(body):
+    """Whether a message record body is one of the contact's messages (only those can be unread)."""
+    split = body.index(RS)
+    keys = body[:split].split(US)
+    if len(keys) == 6:
+        return keys[5] == b'in'
+    doc = json.loads(body[split + 1:])
+    doc['wa_id'] = keys[1].decode()
+    return is_inbound(doc)
+
+
+class LogRecordRef:
+    """What ``get()`` returns: enough of a message to update its status."""
+
+    __slots__ = ('id', 'wa_id', 'status', 'inbound', 'seq', 'created_seq')
+
+    def __init__(self, id, wa_id, status, inbound):
+        self.id = id
+        self.wa_id = wa_id
+        self.status = status
+        self.inbound = inbound
+        self.seq = None
+        self.created_seq = None
+
+    def status_change(self):
+        return {'wa_id': self.wa_id, 'id': self.id, 'status': self.status, 'seq': self.seq}
+
+
+class LogStore:
+    """Append-only message log with in-memory indexes. See the module docstring."""
+
+    def __init__(self, path, segment_bytes=DEFAULT_SEGMENT_BYTES, sync='group',
+                 commit_interval=DEFAULT_COMMIT_INTERVAL):
+        if sync not in SYNC_MODES:
+            raise ValueError(f"sync must be one of {SYNC_MODES}")
+        self.path = path
+        self.segment_bytes = segment_bytes
+        self.sync = sync
+        self.commit_interval = commit_interval
+        os.makedirs(path, exist_ok=True)
+
+        self._index = {}          # wamid -> location << 2 | status code
+        self._other_status = {}   # wamid -> status outside STATUS_CODES
+        self._chats = {}          # wa_id -> array('Q') of message locations, in (timestamp, wamid) order
+        self._stamps = {}         # wa_id -> array('d') of the timestamps of those messages
+        self._names = {}          # wa_id -> latest profile name
+        self._unread = {}         # wa_id -> incoming messages not read; counted on first use, then maintained
+        self._maps = {}           # sealed file_no -> mmap
+        self._segments = []       # live file numbers in log order; the last one is active
+        self._next_file = 1
+        self._active = None
+        self._active_no = None
+        self._active_size = 0
+        self._unflushed = False
+
+        self._waiters = []
+        self._kick = Event()
+        self._committer = None
+        self.appended = 0
+        self.commits = 0
+        self.recovered = 0
+        self.recovery_seconds = 0.0
+        self.truncated_bytes = 0
+
+        self._recover()
+
+    # --- files -------------------------------------------------------------
+
+    def _file(self, file_no):
+        return os.path.join(self.path, f"seg-{file_no:08d}.log")
+
+    def _write_manifest(self):
+        tmp = os.path.join(self.path, 'manifest.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'segments': self._segments, 'next': self._next_file}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(self.path, 'manifest.json'))
+        dir_fd = os.open(self.path, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    def _open_active(self, file_no):
+        self._active = open(self._file(file_no), 'a+b')
+        self._active_no = file_no
+        self._active_size = self._active.tell()
+
+    def _map(self, file_no):
+        with open(self._file(file_no), 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _roll(self):
+        """Seal the active segment and start a new one."""
+        self._flush_and_sync()
+        self._active.close()
+        sealed = self._active_no
+        self._maps[sealed] = self._map(sealed)
+        file_no = self._next_file
+        self._next_file += 1
+        self._segments.append(file_no)
+        self._write_manifest()
+        self._open_active(file_no)
+
+    # --- recovery ----------------------------------------------------------
+
+    def _recover(self):
+        t0 = time.perf_counter()
+        manifest = os.path.join(self.path, 'manifest.json')
+        if os.path.exists(manifest):
+            with open(manifest) as f:
+                state = json.load(f)
+            self._segments = state['segments']
+            self._next_file = state['next']
+        else:
+            self._segments = [1]
+            self._next_file = 2
+            open(self._file(1), 'ab').close()
+            self._write_manifest()
+        # Files not in the manifest are leftovers of an interrupted compaction
+        live = {os.path.basename(self._file(n)) for n in self._segments}
+        for name in os.listdir(self.path):
+            if name.startswith('seg-') and name not in live:
+                os.unlink(os.path.join(self.path, name))
+
+        for file_no in self._segments:
+            data = self._map(file_no)
+            if data is None:
+                continue
+            # Mapped while replaying: ordering messages with equal timestamps reads their ids
+            self._maps[file_no] = data
+            valid = self._replay(file_no, data)
+            if file_no == self._segments[-1]:
+                del self._maps[file_no]
+                if valid < len(data):
+                    # Torn write at the tail of the active segment
+                    self.truncated_bytes = len(data) - valid
+                    data.close()
+                    os.truncate(self._file(file_no), valid)
+                    log.warning("Log store: truncated %d bytes of partial record in %s", self.truncated_bytes, self._file(file_no))
+                else:
+                    data.close()
+            elif valid < len(data):
+                log.error("Log store: corrupt record in sealed segment %s at %d", self._file(file_no), valid)
+        self._open_active(self._segments[-1])
+        self.recovery_seconds = time.perf_counter() - t0
+
+    def _replay(self, file_no, data):
+        """Index every intact record of one segment. Returns the offset after the last one."""
+        offset = 0
+        end = len(data)
+        view = memoryview(data)
+        header_size = HEADER.size
+        unpack = HEADER.unpack_from
+        crc32 = zlib.crc32
+        index_message = self._index_message
+        index_status = self._index_status
+        # Drops are applied in batches (one pass over a chat per batch), but always before
+        # a later record of the same message, e.g. a webhook redelivered after archiving
+        dropped = []
+        pending = set()
+        try:
+            while offset + header_size <= end:
+                body_len, crc, kind = unpack(data, offset)
+                start = offset + header_size
+                stop = start + body_len
+                if stop > end or crc32(view[start:stop]) != crc:
+                    break
+                if kind == KIND_MESSAGE:
+                    # Only the key prefix is decoded; the JSON is read on demand
+                    split = data.find(RS, start, stop)
+                    keys = data[start:split].decode().split('\x1f')
+                    if len(keys) == 4:
+                        keys.append(json.loads(data[split + 1:stop]).get('timestamp'))
+                    wamid, wa_id, name, status, ts = keys[:5]
+                    if wamid in pending:
+                        self._apply_drops(dropped)
+                        dropped = []
+                        pending.clear()
+                    index_message(wamid, wa_id, name, status, _to_num(ts), _pack(file_no, offset))
+                elif kind == KIND_STATUS:
+                    wamid, status = data[start:stop].decode().split('\x1f')
+                    index_status(wamid, status)
+                elif kind == KIND_DROP:
+                    wamid, wa_id = data[start:stop].decode().split('\x1f')
+                    dropped.append((wamid, wa_id))
+                    pending.add(wamid)
+                self.recovered += 1
+                offset = stop
+        finally:
+            view.release()
+        self._apply_drops(dropped)
+        return offset
+
+    def _apply_drops(self, dropped):
+        for wa_id, wamids in _by_chat(dropped).items():
+            self._unindex(wa_id, wamids)
+
+    # --- index -------------------------------------------------------------
+
+    def _index_message(self, wamid, wa_id, name, status, ts, loc):
+        wa_id = sys.intern(wa_id)
+        chat = self._chats.get(wa_id)
+        if chat is None:
+            chat = self._chats[wa_id] = array('Q')
+            self._stamps[wa_id] = array('d')
+        stamps = self._stamps[wa_id]
+        if not stamps or stamps[-1] < ts:
+            chat.append(loc)
+            stamps.append(ts)
+        else:
+            # Late delivery, or a tie with the newest message
+            pos = self._position(wa_id, (ts, wamid), right=True)
+            chat.insert(pos, loc)
+            stamps.insert(pos, ts)
+        self._names[wa_id] = name
+        code = STATUS_CODES.get(status, OTHER_STATUS)
+        if code == OTHER_STATUS:
+            self._other_status[wamid] = status
+        self._index[wamid] = (loc << 2) | code
+
+    def _index_status(self, wamid, status):
+        value = self._index.get(wamid)
+        if value is None:
+            return
+        code = STATUS_CODES.get(status, OTHER_STATUS)
+        if code == OTHER_STATUS:
+            self._other_status[wamid] = status
+        else:
+            self._other_status.pop(wamid, None)
+        self._index[wamid] = (value & ~3) | code
+
+    def _unindex(self, wa_id, wamids):
+        """Forget dropped messages; one pass over the chat's locations per batch."""
+        gone = set()
+        for wamid in wamids:
+            value = self._index.pop(wamid, None)
+            if value is None:
+                continue
+            gone.add(value >> 2)
+            if wa_id in self._unread and self._status_of(wamid, value) != 'read' \
+                    and _inbound(self._read_body(value >> 2)):
+                self._unread[wa_id] -= 1
+            self._other_status.pop(wamid, None)
+        chat = self._chats.get(wa_id)
+        if gone and chat is not None:
+            kept = [i for i, loc in enumerate(chat) if loc not in gone]
+            if kept:
+                stamps = self._stamps[wa_id]
+                self._chats[wa_id] = array('Q', (chat[i] for i in kept))
+                self._stamps[wa_id] = array('d', (stamps[i] for i in kept))
+            else:
+                del self._chats[wa_id]
+                del self._stamps[wa_id]
+
+    def _position(self, wa_id, key, right=False):
+        """Index of the first message of a chat after ``key`` (right) or at or after it (left)."""
+        chat = self._chats[wa_id]
+        stamps = self._stamps[wa_id]
+        ts, wamid = key
+        lo = bisect_left(stamps, ts)
+        hi = bisect_right(stamps, ts)
+        if hi > lo:
+            # Equal timestamps are ordered by wamid; only a few of those records are read
+            find = bisect_right if right else bisect_left
+            lo += find(range(lo, hi), wamid, key=lambda i: self._wamid_at(chat[i]))
+        return lo
+
+    def _status_of(self, wamid, value):
+        code = value & 3
+        return self._other_status.get(wamid, 'sent') if code == OTHER_STATUS else STATUS_NAMES[code]
+
+    # --- writes ------------------------------------------------------------
+
+    def _append(self, kind, body):
+        if self._active_size >= self.segment_bytes:
+            self._roll()
+        offset = self._active_size
+        self._active.write(HEADER.pack(len(body), zlib.crc32(body), kind))
+        self._active.write(body)
+        self._active_size += HEADER.size + len(body)
+        self._unflushed = True
+        self.appended += 1
+        return _pack(self._active_no, offset)
+
+    def _flush_and_sync(self):
+        self._active.flush()
+        self._unflushed = False
+        if self.sync != 'none':
+            os.fsync(self._active.fileno())
+
+    def commit(self):
+        """Flush and fsync everything appended so far, then release the writers waiting on it."""
+        waiters, self._waiters = self._waiters, []
+        try:
+            self._active.flush()
+            self._unflushed = False
+            if self.sync != 'none':
+                # Off the hub so other greenlets keep appending to the next group meanwhile
+                tpool.execute(os.fsync, self._active.fileno())
+        except Exception as e:
+            # Their writes are not known to be durable: fail them rather than leave them waiting
+            for ev in waiters:
+                ev.send_exception(e)
+            raise
+        self.commits += 1
+        for ev in waiters:
+            ev.send()
+
+    def _commit_loop(self):
+        while True:
+            self._kick.wait()
+            self._kick = Event()
+            eventlet.sleep(self.commit_interval)
+            try:
+                self.commit()
+            except Exception as e:
+                log.exception("Log store commit failed: %s", e)
+
+    def wait_durable(self):
+        """Schedule a commit and, in group mode, block this greenlet until it has been fsynced."""
+        if self.sync == 'none':
+            return
+        if self._committer is None:
+            self._committer = eventlet.spawn(self._commit_loop)
+        if not self._kick.ready():
+            self._kick.send()
+        if self.sync == 'group':
+            ev = Event()
+            self._waiters.append(ev)
+            ev.wait()
+
+    def add(self, msg, wait=True):
+        """Append a message dict. Returns a LogRecordRef, or None if the id is already stored.
+
+        With ``wait=False`` the caller batches several writes and calls
+        ``wait_durable()`` once at the end.
+        """
+        wamid = msg.get('id') or msg.get('wamid')
+        if not wamid or wamid in self._index:
+            return None
+        wa_id = str(msg['wa_id'])
+        name = str(msg.get('name') or 'Unknown').replace('\x1f', ' ').replace('\x1e', ' ')
+        status = msg.get('status') or 'sent'
+        if any(sep in s for s in (wamid, wa_id, status) for sep in ('\x1f', '\x1e')):
+            raise ValueError("message id, wa_id and status cannot contain control separators")
+        doc = {k: v for k, v in msg.items() if k not in ('_id', 'seq', 'created_seq')}
+        ts = _to_num(msg.get('timestamp'))
+        inbound = is_inbound(msg)
+        keys = (wamid, wa_id, name, status, repr(ts), 'in' if inbound else 'out')
+        body = US.join(x.encode() for x in keys) + RS + json.dumps(doc, default=str).encode()
+        loc = self._append(KIND_MESSAGE, body)
+        self._index_message(wamid, wa_id, name, status, ts, loc)
+        if inbound and status != 'read' and wa_id in self._unread:
+            self._unread[wa_id] += 1
+        if wait:
+            self.wait_durable()
+        return LogRecordRef(wamid, sys.intern(wa_id), status, inbound)
+
+    def get(self, message_id):
+        value = self._index.get(message_id)
+        if value is None:
+            return None
+        body = self._read_body(value >> 2)
+        wa_id = body[:body.index(RS)].split(US)[1].decode()
+        return LogRecordRef(message_id, sys.intern(wa_id), self._status_of(message_id, value), _inbound(body))
+
+    def set_status(self, message_id, status, wait=True):
+        ref = self.get(message_id)
+        if ref is None:
+            return None
+        self._append(KIND_STATUS, US.join((message_id.encode(), status.encode())))
+        self._index_status(message_id, status)
+        if ref.inbound and ref.wa_id in self._unread and (ref.status == 'read') != (status == 'read'):
+            self._unread[ref.wa_id] += 1 if ref.status == 'read' else -1
+        ref.status = status
+        if wait:
+            self.wait_durable()
+        return ref
+
+    def _wamid_at(self, loc):
+        body = self._read_body(loc)
+        return body[:body.index(US)].decode()
+
+    def _status_at(self, loc):
+        """``(wamid, current status, incoming)`` of the message record at ``loc``."""
+        body = self._read_body(loc)
+        wamid = body[:body.index(US)].decode()
+        return wamid, self._status_of(wamid, self._index[wamid]), _inbound(body)
+
+    def unread(self, wa_id):
+        count = self._unread.get(wa_id)
+        if count is None:
+            # Recovery does not read message bodies, so each chat is counted once, here
+            count = 0
+            for loc in self._chats.get(wa_id, ()):
+                _, status, inbound = self._status_at(loc)
+                count += inbound and status != 'read'
+            self._unread[wa_id] = count
+        return count
+
+    def mark_read(self, wa_id, up_to):
+        """Set every incoming message at or before timestamp ``up_to`` to read. Returns the changed records.
+
+        Status records are appended without waiting; call ``wait_durable()`` afterwards.
+        """
+        remaining = self.unread(wa_id)
+        changed = []
+        chat = self._chats.get(wa_id) or ()
+        stamps = self._stamps.get(wa_id)
+        for i in reversed(range(len(chat))):
+            if not remaining:
+                break
+            wamid, status, inbound = self._status_at(chat[i])
+            if not inbound or status == 'read':
+                continue
+            remaining -= 1
+            if stamps[i] <= up_to:
+                changed.append(self.set_status(wamid, 'read', wait=False))
+        return changed
+
+    def archivable(self, wa_id, before, limit):
+        """Up to ``limit`` of the oldest messages with timestamp before ``before``."""
+        chat = self._chats.get(wa_id)
+        if not chat:
+            return []
+        end = min(bisect_left(self._stamps[wa_id], before), limit)
+        return [self._message(loc) for loc in chat[:end]]
+
+    def drop(self, wa_id, ids, wait=True):
+        """Remove messages (moved to the archive); ``compact()`` reclaims their space."""
+        ids = [i for i in ids if i in self._index]
+        for wamid in ids:
+            self._append(KIND_DROP, US.join((wamid.encode(), wa_id.encode())))
+        self._unindex(wa_id, ids)
+        if wait:
+            self.wait_durable()
+
+    # --- reads -------------------------------------------------------------
+
+    def _read_body(self, loc):
+        file_no, offset = loc >> 32, loc & 0xFFFFFFFF
+        data = self._maps.get(file_no)
+        if data is None:
+            # Active segment: make buffered appends visible, then read through the fd
+            if self._unflushed:
+                self._active.flush()
+                self._unflushed = False
+            header = os.pread(self._active.fileno(), HEADER.size, offset)
+            body_len = HEADER.unpack(header)[0]
+            body = os.pread(self._active.fileno(), body_len, offset + HEADER.size)
+        else:
+            body_len = HEADER.unpack_from(data, offset)[0]
+            start = offset + HEADER.size
+            body = data[start:start + body_len]
+        return body
+
+    def _message(self, loc):
+        body = self._read_body(loc)
+        doc = json.loads(body[body.index(RS) + 1:])
+        wamid = doc.get('id') or doc.get('wamid')
+        value = self._index.get(wamid)
+        if value is not None:
+            doc['status'] = self._status_of(wamid, value)
+        doc['timestamp'] = _to_num(doc.get('timestamp'))
+        return doc
+
+    def messages(self, wa_id):
+        return [self._message(loc) for loc in self._chats.get(wa_id) or ()]
+
+    def page_rows(self, wa_id, limit, before=None, after=None):
+        """Up to ``limit + 1`` messages past a cursor: oldest first after ``after``,
+        else newest first before ``before`` (or from the newest)."""
+        chat = self._chats.get(wa_id)
+        if not chat:
+            return []
+        if after is not None:
+            start = self._position(wa_id, after, right=True)
+            return [self._message(loc) for loc in chat[start:start + limit + 1]]
+        end = self._position(wa_id, before) if before is not None else len(chat)
+        return [self._message(loc) for loc in reversed(chat[max(0, end - limit - 1):end])]
+
+    def last(self, wa_id):
+        # Chats are kept in timestamp order, through drops and compaction, so the newest is the end
+        chat = self._chats.get(wa_id)
+        return self._message(chat[-1]) if chat else None
+
+    def conversations(self):
+        return [(wa_id, self._names.get(wa_id, 'Unknown')) for wa_id in self._chats]
+
+    # --- compaction --------------------------------------------------------
+
+    def compact(self):
+        """Rewrite sealed segments as message records with their current status; drop status records.
+
+        Returns the number of bytes reclaimed.
+        """
+        sealed = self._segments[:-1]
+        if not sealed:
+            return 0
+        before = sum(os.path.getsize(self._file(n)) for n in sealed)
+        moved = {}
+        outputs = []
+        out = None
+        out_no = None
+        out_size = 0
+        for file_no in sealed:
+            data = self._maps[file_no]
+            offset = 0
+            end = len(data) if data is not None else 0
+            while offset + HEADER.size <= end:
+                body_len, crc, kind = HEADER.unpack_from(data, offset)
+                start = offset + HEADER.size
+                body = data[start:start + body_len]
+                old_loc = _pack(file_no, offset)
+                offset = start + body_len
+                if kind != KIND_MESSAGE:
+                    continue
+                keys, doc = body.split(RS, 1)
+                keys = keys.split(US)
+                wamid, wa_id, name = keys[:3]
+                value = self._index.get(wamid.decode())
+                if value is None or value >> 2 != old_loc:
+                    continue
+                status = self._status_of(wamid.decode(), value).encode()
+                ts = keys[4] if len(keys) >= 5 else repr(_to_num(json.loads(doc).get('timestamp'))).encode()
+                direction = b'in' if _inbound(body) else b'out'
+                body = US.join((wamid, wa_id, name, status, ts, direction)) + RS + doc
+                if out is None or out_size >= self.segment_bytes:
+                    if out is not None:
+                        out.flush()
+                        os.fsync(out.fileno())
+                        out.close()
+                    out_no = self._next_file
+                    self._next_file += 1
+                    outputs.append(out_no)
+                    out = open(self._file(out_no), 'wb')
+                    out_size = 0
+                moved[old_loc] = _pack(out_no, out_size)
+                out.write(HEADER.pack(len(body), zlib.crc32(body), KIND_MESSAGE))
+                out.write(body)
+                out_size += HEADER.size + len(body)
+        if out is not None:
+            out.flush()
+            os.fsync(out.fileno())
+            out.close()
+
+        # Switch over: the manifest rename is the commit point
+        self._segments = outputs + self._segments[-1:]
+        self._write_manifest()
+        for file_no in sealed:
+            data = self._maps.pop(file_no, None)
+            if data is not None:
+                data.close()
+            os.unlink(self._file(file_no))
+        for file_no in outputs:
+            self._maps[file_no] = self._map(file_no)
+        for wamid, value in self._index.items():
+            new_loc = moved.get(value >> 2)
+            if new_loc is not None:
+                self._index[wamid] = (new_loc << 2) | (value & 3)
+        for chat in self._chats.values():
+            for i, loc in enumerate(chat):
+                new_loc = moved.get(loc)
+                if new_loc is not None:
+                    chat[i] = new_loc
+        after = sum(os.path.getsize(self._file(n)) for n in outputs)
+        return before - after
+
+    # --- misc --------------------------------------------------------------
+
+    def close(self):
+        if self._committer is not None:
+            self._committer.kill()
+            self._committer = None
+        self.commit()
+        self._active.close()
+        for data in self._maps.values():
+            if data is not None:
+                data.close()
+        self._maps.clear()
+
+    def stats(self):
+        return {
+            "conversations": len(self._chats),
+            "messages": len(self._index),
+            "segments": len(self._segments),
+            "disk_bytes": sum(os.path.getsize(self._file(n)) for n in self._segments),
+            "appended": self.appended,
+            "commits": self.commits,
+            "sync": self.sync,
+            "recovered_records": self.recovered,
+            "recovery_seconds": round(self.recovery_seconds, 3),
+        }
+
+
+def _by_chat(pairs):
+    chats = {}
+    for wamid, wa_id in pairs:
+        chats.setdefault(wa_id, []).append(wamid)
+    return chats
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3 or sys.argv[1] not in ('stats', 'compact'):
+        print("Usage: python log_store.py [stats|compact] <dir>")
+        sys.exit(1)
+    store = LogStore(sys.argv[2])
+    if sys.argv[1] == 'compact':
+        print(f"✅ Compacted, reclaimed {store.compact()} bytes")
+    print(json.dumps(store.stats(), indent=2))
+    store.close()
@@ -0,0 +1,161 @@
+"""Content-addressed attachment storage on local disk.
+
+An upload is read from the request stream ``CHUNK_SIZE`` bytes at a time,
+hashed and written to a temporary file as it arrives, so no request body
+is ever held in memory; the finished file is renamed to
+``objects/<sha256[:2]>/<sha256>``. The SHA-256 is the media id, so the
+same bytes uploaded twice are stored once. A JSON sidecar next to the
+object keeps the MIME type, size and original filename.
+
+Messages reference attachments by id (``{"type": "image", "media": {...}}``)
+and never embed them. Objects are immutable, which lets downloads be
+served with Range support and long-lived caching (see ``/media/<id>`` in
+app.py).
+
+Thumbnails of images are made on first request with Pillow (listed in
+requirements.txt) in a native thread and cached under ``thumbs/``. If
+Pillow cannot be imported, uploads and downloads still work and images
+are shown without thumbnails.
+"""
+import os
+import re
+import json
+import uuid
+import hashlib
+import logging
+
+from eventlet import tpool
+
+try:
+    from PIL import Image
+except ImportError:  # required for thumbnails only; see the module docstring
+    Image = None
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+# Longest edge of a thumbnail; other sizes are not offered so the cache stays bounded
+THUMBNAIL_SIZES = (96, 320)
+MEDIA_ID = re.compile(r'^[0-9a-f]{64}$')
+MEDIA_TYPES = ('image', 'audio', 'video', 'document')
+
+
+class MediaTooLarge(Exception):
+    pass
+
+
+class EmptyMedia(Exception):
+    pass
+
+
+def media_type(mime_type):
+    """Message type for a MIME type: image, audio, video or document."""
+    kind = (mime_type or '').split('/', 1)[0]
+    return kind if kind in ('image', 'audio', 'video') else 'document'
+
+
+class MediaStore:
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.uploads = 0
+        self.deduplicated = 0
+        self.bytes_written = 0
+        self.rejected = 0
+        self.thumbnails_made = 0
+        self.thumbnail_hits = 0
+        for sub in ('objects', 'thumbs', 'tmp'):
+            os.makedirs(os.path.join(root, sub), exist_ok=True)
+
+    def path(self, media_id):
+        return os.path.join(self.root, 'objects', media_id[:2], media_id)
+
+    def _meta_path(self, media_id):
+        return self.path(media_id) + '.json'
+
+    def save(self, stream, mime_type, filename=None):
+        """Store everything read from ``stream``. Returns the media info dict; raises MediaTooLarge or EmptyMedia."""
+        tmp = os.path.join(self.root, 'tmp', uuid.uuid4().hex)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp, 'wb') as f:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        self.rejected += 1
+                        raise MediaTooLarge(f"attachments are limited to {self.max_bytes} bytes")
+                    digest.update(chunk)
+                    f.write(chunk)
+            if not size:
+                # Nothing is kept: the temporary file goes in the finally below
+                raise EmptyMedia("empty upload")
+            media_id = digest.hexdigest()
+            path = self.path(media_id)
+            self.uploads += 1
+            if os.path.exists(path):
+                self.deduplicated += 1
+                return self.info(media_id)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            info = {"id": media_id, "mime_type": mime_type or 'application/octet-stream',
+                    "size": size, "filename": os.path.basename(filename or '') or None}
+            # Sidecar first: an object without one would look like a half-written upload
+            with open(self._meta_path(media_id), 'w', encoding='utf-8') as f:
+                json.dump(info, f)
+            os.replace(tmp, path)
+            self.bytes_written += size
+            log.debug("Stored media %s (%d bytes)", media_id, size)
+            return info
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def info(self, media_id):
+        """``{id, mime_type, size, filename}`` for a stored object, or None."""
+        if not MEDIA_ID.match(media_id or '') or not os.path.exists(self.path(media_id)):
+            return None
+        try:
+            with open(self._meta_path(media_id), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def thumbnail(self, media_id, size):
+        """Path of a JPEG thumbnail of an image, made on first use; None when there cannot be one."""
+        info = self.info(media_id)
+        if Image is None or info is None or media_type(info['mime_type']) != 'image' or size not in THUMBNAIL_SIZES:
+            return None
+        path = os.path.join(self.root, 'thumbs', f"{media_id}_{size}.jpg")
+        if os.path.exists(path):
+            self.thumbnail_hits += 1
+            return path
+        try:
+            # Decoding and resizing are CPU-bound; keep them off the event loop
+            tpool.execute(_make_thumbnail, self.path(media_id), path, size)
+        except Exception as e:
+            log.warning("Thumbnail of %s failed: %s", media_id, e)
+            return None
+        self.thumbnails_made += 1
+        return path
+
+    def stats(self):
+        return {
+            "uploads": self.uploads,
+            "deduplicated": self.deduplicated,
+            "bytes_written": self.bytes_written,
+            "rejected_too_large": self.rejected,
+            "thumbnails_made": self.thumbnails_made,
+            "thumbnail_hits": self.thumbnail_hits,
+        }
+
+
+def _make_thumbnail(source, target, size):
+    with Image.open(source) as img:
+        img.draft('RGB', (size, size))  # JPEG: decode at a reduced scale
+        img.thumbnail((size, size))
+        tmp = f"{target}.{uuid.uuid4().hex}.tmp"
+        img.convert('RGB').save(tmp, 'JPEG', quality=80)
+    os.replace(tmp, target)
@@ -0,0 +1,241 @@
+import sys
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, deque
+
+from chat_summary import is_inbound
+
+DEFAULT_MAX_PER_CHAT = 5000
+DEFAULT_BUDGET_BYTES = 64 * 1024 * 1024
+
+# Fields kept in slots; anything else a webhook message carries goes in ``extra``
+_CORE_FIELDS = frozenset(('id', 'wamid', 'wa_id', 'name', 'timestamp', 'text', 'type', 'status', 'seq', 'created_seq', '_id'))
+# Rough per-message cost of the wamid index entry and the ring buffer slot
+_INDEX_OVERHEAD = 120
+
+
+def _to_num(ts):
+    try:
+        return float(ts)
+    except Exception:
+        return 0.0
+
+
+def _key(record):
+    # Same order as pagination.message_key
+    return (record.timestamp, record.id)
+
+
+class MessageRecord:
+    """One stored message. wa_id, name, type and status are interned strings."""
+
+    __slots__ = ('id', 'wa_id', 'name', 'timestamp', 'body', 'type', 'status', 'inbound', 'seq', 'created_seq', 'extra', 'size')
+
+    def __init__(self, msg):
+        self.id = msg.get('id') or msg.get('wamid')
+        self.wa_id = sys.intern(str(msg['wa_id']))
+        self.name = sys.intern(str(msg.get('name') or 'Unknown'))
+        self.timestamp = _to_num(msg.get('timestamp'))
+        self.body = (msg.get('text') or {}).get('body', '')
+        self.type = sys.intern(str(msg.get('type') or 'text'))
+        self.status = sys.intern(str(msg.get('status') or 'sent'))
+        self.inbound = is_inbound(msg)
+        self.seq = msg.get('seq')
+        self.created_seq = msg.get('created_seq')
+        extra = {k: v for k, v in msg.items() if k not in _CORE_FIELDS}
+        self.extra = extra or None
+        self.size = (sys.getsizeof(self) + sys.getsizeof(self.id) + sys.getsizeof(self.body)
+                     + (sys.getsizeof(extra) if extra else 0) + _INDEX_OVERHEAD)
+
+    def to_dict(self):
+        msg = dict(self.extra) if self.extra else {}
+        msg.update({
+            "id": self.id,
+            "wa_id": self.wa_id,
+            "name": self.name,
+            "timestamp": self.timestamp,
+            "text": {"body": self.body},
+            "type": self.type,
+            "status": self.status,
+            "wamid": self.id,
+        })
+        if self.seq is not None:
+            msg['seq'] = self.seq
+            msg['created_seq'] = self.created_seq
+        return msg
+
+    def status_change(self):
+        return {'wa_id': self.wa_id, 'id': self.id, 'status': self.status, 'seq': self.seq}
+
+
+class MemoryStore:
+    """Bounded message store for the no-Mongo fallback.
+
+    Each conversation is a ring buffer of at most ``max_per_chat`` records
+    in (timestamp, id) order, and a wamid index makes dedupe and status updates
+    O(1). Conversations are kept in LRU order; when the estimated size of
+    all records passes ``budget_bytes`` the least recently used
+    conversations are dropped whole.
+    """
+
+    def __init__(self, max_per_chat=DEFAULT_MAX_PER_CHAT, budget_bytes=DEFAULT_BUDGET_BYTES):
+        self.max_per_chat = max_per_chat
+        self.budget_bytes = budget_bytes
+        self._chats = OrderedDict()  # wa_id -> deque[MessageRecord], least recently used first
+        self._index = {}             # message id -> MessageRecord
+        self._unread = {}            # wa_id -> stored incoming messages whose status is not 'read'
+        self.bytes = 0
+        self.evicted_chats = 0
+        self.evicted_messages = 0
+
+    def add(self, msg, wait=True):
+        """Store a message dict. Returns its record, or None if the id is already stored."""
+        record = MessageRecord(msg)
+        if not record.id or record.id in self._index:
+            return None
+        ring = self._chats.get(record.wa_id)
+        if ring is None:
+            ring = self._chats[record.wa_id] = deque(maxlen=self.max_per_chat)
+        else:
+            self._chats.move_to_end(record.wa_id)
+        if len(ring) == self.max_per_chat:
+            self._forget(ring.popleft())
+            self.evicted_messages += 1
+        if not ring or _key(ring[-1]) <= _key(record):
+            ring.append(record)
+        else:
+            # Late arrival: walk back from the newest end to keep (timestamp, id) order
+            pos = len(ring)
+            while pos > 0 and _key(ring[pos - 1]) > _key(record):
+                pos -= 1
+            ring.insert(pos, record)
+        self._index[record.id] = record
+        self.bytes += record.size
+        if record.inbound and record.status != 'read':
+            self._unread[record.wa_id] = self._unread.get(record.wa_id, 0) + 1
+        self._enforce_budget(keep=record.wa_id)
+        return record
+
+    def get(self, message_id):
+        return self._index.get(message_id)
+
+    def set_status(self, message_id, status, wait=True):
+        record = self._index.get(message_id)
+        if record is None:
+            return None
+        if record.inbound and (record.status == 'read') != (status == 'read'):
+            self._count_unread(record.wa_id, 1 if record.status == 'read' else -1)
+        record.status = sys.intern(status)
+        return record
+
+    def _count_unread(self, wa_id, delta):
+        count = self._unread.get(wa_id, 0) + delta
+        if count:
+            self._unread[wa_id] = count
+        else:
+            self._unread.pop(wa_id, None)
+
+    def unread(self, wa_id):
+        return self._unread.get(wa_id, 0)
+
+    def mark_read(self, wa_id, up_to):
+        """Set every incoming message at or before timestamp ``up_to`` to read. Returns the changed records."""
+        ring = self._chats.get(wa_id)
+        remaining = self._unread.get(wa_id, 0)
+        changed = []
+        if not ring or not remaining:
+            return changed
+        # Newest first, stopping once every unread message has been seen
+        for record in reversed(ring):
+            if not record.inbound or record.status == 'read':
+                continue
+            remaining -= 1
+            if record.timestamp <= up_to:
+                changed.append(self.set_status(record.id, 'read'))
+            if not remaining:
+                break
+        return changed
+
+    def archivable(self, wa_id, before, limit):
+        """Up to ``limit`` of the oldest messages with timestamp before ``before``."""
+        docs = []
+        for record in self._chats.get(wa_id) or ():
+            if record.timestamp >= before or len(docs) == limit:
+                break
+            docs.append(record.to_dict())
+        return docs
+
+    def drop(self, wa_id, ids):
+        """Remove messages (moved to the archive) from a chat."""
+        ring = self._chats.get(wa_id)
+        if not ring:
+            return
+        ids = set(ids)
+        kept = deque(maxlen=self.max_per_chat)
+        for record in ring:
+            if record.id in ids:
+                self._forget(record)
+            else:
+                kept.append(record)
+        if kept:
+            self._chats[wa_id] = kept
+        else:
+            del self._chats[wa_id]
+
+    def wait_durable(self):
+        """Nothing to wait for; here for interface parity with LogStore."""
+
+    def messages(self, wa_id):
+        ring = self._chats.get(wa_id)
+        if ring is None:
+            return []
+        self._chats.move_to_end(wa_id)
+        return [r.to_dict() for r in ring]
+
+    def page_rows(self, wa_id, limit, before=None, after=None):
+        """Up to ``limit + 1`` messages past a cursor: oldest first after ``after``,
+        else newest first before ``before`` (or from the newest)."""
+        ring = self._chats.get(wa_id)
+        if not ring:
+            return []
+        self._chats.move_to_end(wa_id)
+        if after is not None:
+            start = bisect_right(ring, after, key=_key)
+            return [ring[i].to_dict() for i in range(start, min(start + limit + 1, len(ring)))]
+        end = bisect_left(ring, before, key=_key) if before is not None else len(ring)
+        return [ring[i].to_dict() for i in range(end - 1, max(0, end - limit - 1) - 1, -1)]
+
+    def last(self, wa_id):
+        ring = self._chats.get(wa_id)
+        return ring[-1].to_dict() if ring else None
+
+    def conversations(self):
+        """``(wa_id, name)`` for every stored conversation, most recently used first."""
+        return [(wa_id, ring[-1].name) for wa_id, ring in reversed(self._chats.items()) if ring]
+
+    def _forget(self, record):
+        self._index.pop(record.id, None)
+        self.bytes -= record.size
+        if record.inbound and record.status != 'read':
+            self._count_unread(record.wa_id, -1)
+
+    def _enforce_budget(self, keep):
+        while self.bytes > self.budget_bytes and len(self._chats) > 1:
+            wa_id = next(iter(self._chats))
+            if wa_id == keep:
+                self._chats.move_to_end(wa_id)
+                continue
+            for record in self._chats.pop(wa_id):
+                self._forget(record)
+                self.evicted_messages += 1
+            self.evicted_chats += 1
+
+    def stats(self):
+        return {
+            "conversations": len(self._chats),
+            "messages": len(self._index),
+            "approx_bytes": self.bytes,
+            "budget_bytes": self.budget_bytes,
+            "max_per_chat": self.max_per_chat,
+            "evicted_conversations": self.evicted_chats,
+            "evicted_messages": self.evicted_messages,
+        }
@@ -0,0 +1,232 @@
+"""Prometheus text-format metrics without a client library.
+
+Histograms and counters are updated on the hot path with a dict lookup and
+a few additions. Everything that already keeps its own counters (queues,
+brokers, stores) is read at scrape time through ``add_stats`` instead of
+being mirrored. Metrics are per process: with several workers, scrape
+each one or accept that a scrape through the load balancer sees one
+worker.
+"""
+import time
+from bisect import bisect_left
+
+from pymongo import monitoring
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PREFIX = 'whatsapp_'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _num(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = PREFIX + name
+        self.help = help
+        self.label_names = labels
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{_labels(self.label_names, labels)} {_num(value)}"
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = PREFIX + name
+        self.help = help
+        self.label_names = labels
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [per-bucket counts..., +Inf count, sum]
+
+    def observe(self, value, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def samples(self):
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                le = 'le="%s"' % _num(bound)
+                yield f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.label_names, labels)} {_num(series[-1])}"
+            yield f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}"
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 't0')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.t0, *self.labels)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._stats = []  # (prefix, fn, counter keys)
+        self.scrape_errors = 0
+
+    def counter(self, name, help, labels=()):
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_stats(self, prefix, fn, counters=()):
+        """Export the numeric values of ``fn()`` (a stats dict) as ``<prefix>_<key>`` gauges.
+
+        Keys in ``counters`` only ever grow and are exported as ``<prefix>_<key>_total`` counters.
+        Nested dicts are skipped.
+        """
+        self._stats.append((prefix, fn, frozenset(counters)))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        for prefix, fn, counters in self._stats:
+            try:
+                stats = fn()
+            except Exception:
+                self.scrape_errors += 1
+                continue
+            for key, value in stats.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                if key in counters:
+                    name, kind = f"{PREFIX}{prefix}_{key}_total", 'counter'
+                else:
+                    name, kind = f"{PREFIX}{prefix}_{key}", 'gauge'
+                lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name} {_num(value)}")
+        lines.append(f"# TYPE {PREFIX}metrics_scrape_errors_total counter")
+        lines.append(f"{PREFIX}metrics_scrape_errors_total {self.scrape_errors}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HTTP_LATENCY = REGISTRY.histogram(
+    'http_request_duration_seconds', 'Time to produce the response (first byte for streams)',
+    labels=('method', 'route', 'status'))
+MONGO_COMMANDS = REGISTRY.histogram(
+    'mongo_command_duration_seconds', 'MongoDB commands as timed by the driver', labels=('command',))
+MONGO_FAILURES = REGISTRY.counter(
+    'mongo_command_failures_total', 'MongoDB commands that failed', labels=('command',))
+STORAGE_OPS = REGISTRY.histogram(
+    'storage_operation_duration_seconds', 'Storage operations as <backend>.<operation>', labels=('op',))
+STORAGE_ERRORS = REGISTRY.counter(
+    'storage_operation_errors_total', 'Storage operations that raised', labels=('op',))
+PAYLOAD_SCANS = REGISTRY.histogram(
+    'payload_scan_duration_seconds', 'Payload directory scans (parsing only changed files)')
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Pass to MongoClient(event_listeners=[...]) to time every command."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_COMMANDS.observe(event.duration_micros / 1e6, event.command_name)
+
+    def failed(self, event):
+        MONGO_COMMANDS.observe(event.duration_micros / 1e6, event.command_name)
+        MONGO_FAILURES.inc(event.command_name)
+
+
+class GreenletCounter:
+    """Greenlets started through eventlet (spawn, spawn_n, GreenPool) that have not finished.
+
+    ``install()`` wraps the function each new greenlet runs, so the count is
+    kept as they start and exit and reading it costs nothing; counting with
+    ``gc.get_objects()`` walked the whole heap on every scrape.
+    """
+
+    def __init__(self):
+        self.running = 0
+        self.started = 0
+        self._installed = False
+
+    def install(self):
+        if self._installed:
+            return
+        from eventlet import greenthread
+        main = greenthread.GreenThread.main
+        spawn_n = greenthread._spawn_n
+
+        def counted_main(gt, function, args, kwargs):
+            return main(gt, self._wrap(function), args, kwargs)
+
+        def counted_spawn_n(seconds, func, args, kwargs):
+            return spawn_n(seconds, self._wrap(func), args, kwargs)
+
+        greenthread.GreenThread.main = counted_main
+        greenthread._spawn_n = counted_spawn_n
+        self._installed = True
+
+    def _wrap(self, func):
+        def run(*args, **kwargs):
+            self.started += 1
+            self.running += 1
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.running -= 1
+        return run
+
+
+GREENLETS = GreenletCounter()
+
+
+def greenlet_stats():
+    """Live greenlets (see GreenletCounter) and hub timers."""
+    from eventlet import hubs
+    hub = hubs.get_hub()
+    return {
+        "greenlets": GREENLETS.running,
+        "greenlets_started": GREENLETS.started,
+        "hub_timers": len(hub.timers) + len(getattr(hub, 'next_timers', ())),
+    }
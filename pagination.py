@@ -0,0 +1,119 @@
+from bisect import bisect_left, bisect_right
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def _to_num(ts):
+    try:
+        return float(ts)
+    except Exception:
+        return 0.0
+
+
+def message_key(msg):
+    """Sort key for history pages: (timestamp, wamid), matching the wa_id_timestamp_wamid index."""
+    return (_to_num(msg.get('timestamp')), msg.get('wamid') or msg.get('id') or '')
+
+
+def encode_cursor(key):
+    ts, wamid = key
+    return f"{ts!r}:{wamid}"
+
+
+def decode_cursor(cursor):
+    """Parse a ``"<timestamp>:<wamid>"`` cursor. Raises ValueError if malformed."""
+    ts, sep, wamid = (cursor or '').partition(':')
+    if not sep:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return float(ts), wamid
+
+
+def parse_limit(value):
+    if value is None or value == '':
+        return DEFAULT_PAGE_SIZE
+    limit = int(value)
+    if limit <= 0:
+        raise ValueError("limit must be positive")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def mongo_page_query(wa_id, before=None, after=None):
+    """Filter and sort for one page, served by the (wa_id, timestamp, wamid) index.
+
+    Returns ``(filter, sort, newest_first)``; with ``after`` the page walks
+    forward from the cursor, otherwise backwards from ``before`` (or from
+    the newest message).
+    """
+    query = {'wa_id': wa_id}
+    if after is not None:
+        ts, wamid = after
+        query['$or'] = [{'timestamp': {'$gt': ts}}, {'timestamp': ts, 'wamid': {'$gt': wamid}}]
+        return query, [('timestamp', 1), ('wamid', 1)], False
+    if before is not None:
+        ts, wamid = before
+        query['$or'] = [{'timestamp': {'$lt': ts}}, {'timestamp': ts, 'wamid': {'$lt': wamid}}]
+    return query, [('timestamp', -1), ('wamid', -1)], True
+
+
+def build_page(messages, limit, newest_first, before=None, after=None):
+    """Shape ``limit + 1`` fetched rows into the response body.
+
+    ``messages`` are in fetch order; the page is always returned oldest
+    first. ``next_before`` is null once the oldest message has been reached;
+    ``next_after`` is the cursor to poll for newer messages.
+    """
+    has_more = len(messages) > limit
+    page = messages[:limit]
+    if newest_first:
+        page.reverse()
+    if after is not None:
+        more_before, more_after = True, has_more
+    else:
+        more_before, more_after = has_more, before is not None
+    return {
+        'messages': page,
+        'next_before': encode_cursor(message_key(page[0])) if page and more_before else None,
+        'next_after': encode_cursor(message_key(page[-1])) if page else (encode_cursor(after) if after else None),
+        'has_more_before': bool(page) and more_before,
+        'has_more_after': more_after,
+    }
+
+
+def list_page_rows(messages, limit, before=None, after=None):
+    """Up to ``limit + 1`` rows of an in-memory history past a cursor, in fetch order (see build_page)."""
+    ordered = sorted(messages, key=message_key)
+    keys = [message_key(m) for m in ordered]
+    if after is not None:
+        start = bisect_right(keys, after)
+        return ordered[start:start + limit + 1]
+    end = bisect_left(keys, before) if before is not None else len(ordered)
+    rows = ordered[max(0, end - limit - 1):end]
+    rows.reverse()
+    return rows
+
+
+def paginate_list(messages, limit, before=None, after=None):
+    """Page through an in-memory history (payload/memory fallback) with the same cursors."""
+    rows = list_page_rows(messages, limit, before, after)
+    return build_page(rows, limit, after is None, before, after)
+
+
+def merge_page(page, rows, limit, before=None, after=None):
+    """Fill a page from one tier with ``rows`` past the same cursor from another (the archive).
+
+    ``rows`` are up to ``limit + 1`` messages in any order. The page's
+    messages win over rows with the same wamid.
+    """
+    newest_first = after is None
+    seen = {message_key(m)[1] for m in page['messages']}
+    merged = page['messages'] + [m for m in rows if message_key(m)[1] not in seen]
+    merged.sort(key=message_key, reverse=newest_first)
+    result = build_page(merged[:limit + 1], limit, newest_first, before, after)
+    # The page's own tier may have had more rows than it returned
+    if newest_first and page['has_more_before'] and not result['has_more_before']:
+        result['has_more_before'] = True
+        result['next_before'] = encode_cursor(message_key(result['messages'][0]))
+    elif not newest_first and page['has_more_after']:
+        result['has_more_after'] = True
+    return result
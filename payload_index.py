@@ -0,0 +1,170 @@
+import os
+import json
+import time
+import logging
+import threading
+
+from metrics import PAYLOAD_SCANS
+
+log = logging.getLogger(__name__)
+
+
+def _to_num(ts):
+    try:
+        return float(ts)
+    except Exception:
+        return 0.0
+
+
+def _parse_payload(data):
+    """Pull contacts and messages out of one webhook payload document.
+
+    Returns ``(contacts, messages)`` where contacts is a list of
+    ``(wa_id, name)`` pairs and messages are normalized copies tagged with
+    the wa_id/name of the first contact in their change.
+    """
+    contacts = []
+    messages = []
+    if not isinstance(data, dict):
+        return contacts, messages
+    meta = data.get('metaData')
+    if not isinstance(meta, dict) or not isinstance(meta.get('entry'), list):
+        return contacts, messages
+    for ent in meta['entry']:
+        if not isinstance(ent, dict) or not isinstance(ent.get('changes'), list):
+            continue
+        for change in ent['changes']:
+            if not isinstance(change, dict) or not isinstance(change.get('value'), dict):
+                continue
+            value = change['value']
+            change_contacts = value.get('contacts') if isinstance(value.get('contacts'), list) else []
+            for contact_info in change_contacts:
+                if isinstance(contact_info, dict):
+                    name = (contact_info.get('profile') or {}).get('name')
+                    if contact_info.get('wa_id') and name:
+                        contacts.append((contact_info['wa_id'], name))
+            first_contact = change_contacts[0] if change_contacts and isinstance(change_contacts[0], dict) else {}
+            wa_id = first_contact.get('wa_id')
+            if not wa_id:
+                continue
+            name = (first_contact.get('profile') or {}).get('name') or 'Unknown'
+            for msg in (value.get('messages') or []):
+                if not isinstance(msg, dict):
+                    continue
+                m = dict(msg)
+                m['wa_id'] = wa_id
+                m['name'] = name
+                m['wamid'] = msg.get('id')
+                m['status'] = m.get('status') or 'sent'
+                messages.append(m)
+    return contacts, messages
+
+
+class PayloadIndex:
+    """In-process index over the webhook JSON files in the payloads directory.
+
+    Files are parsed once and cached with their mtime/size. ``refresh()``
+    re-parses only files that are new or changed and drops removed ones, so
+    request handlers can read contacts and per-contact message lists without
+    touching the disk. Full directory scans are throttled to once per
+    ``refresh_interval`` seconds unless the directory itself changed.
+    """
+
+    def __init__(self, payloads_dir, refresh_interval=2.0):
+        self.payloads_dir = payloads_dir
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._files = {}  # filename -> (mtime, size, contacts, messages)
+        self._contacts = {}  # wa_id -> {'wa_id', 'name'}
+        self._messages = {}  # wa_id -> list[message] sorted by timestamp
+        self._dir_mtime = None
+        self._last_scan = 0.0
+        # Bumped on every rebuild, for cache validators
+        self.generation = 0
+
+    def _dir_changed(self):
+        try:
+            mtime = os.stat(self.payloads_dir).st_mtime
+        except OSError:
+            mtime = None
+        return mtime != self._dir_mtime, mtime
+
+    def refresh(self, force=False):
+        """Pick up added, modified or removed payload files. Returns True if the index changed."""
+        dir_changed, dir_mtime = self._dir_changed()
+        if not force and not dir_changed and time.monotonic() - self._last_scan < self.refresh_interval:
+            return False
+        t0 = time.perf_counter()
+        with self._lock:
+            self._dir_mtime = dir_mtime
+            self._last_scan = time.monotonic()
+            changed = False
+            seen = set()
+            try:
+                entries = sorted(
+                    (e for e in os.scandir(self.payloads_dir) if e.name.endswith('.json') and e.is_file()),
+                    key=lambda e: e.name,
+                )
+            except OSError as e:
+                log.warning("Failed to scan payloads directory %s: %s", self.payloads_dir, e)
+                entries = []
+            for entry in entries:
+                seen.add(entry.name)
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                cached = self._files.get(entry.name)
+                if cached and cached[0] == st.st_mtime and cached[1] == st.st_size:
+                    continue
+                try:
+                    with open(entry.path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                except json.JSONDecodeError:
+                    log.warning("Error decoding JSON from %s", entry.name)
+                    data = None
+                except Exception as e:
+                    log.warning("An unexpected error occurred while processing %s: %s", entry.name, e)
+                    data = None
+                contacts, messages = _parse_payload(data)
+                self._files[entry.name] = (st.st_mtime, st.st_size, contacts, messages)
+                changed = True
+            for name in list(self._files):
+                if name not in seen:
+                    del self._files[name]
+                    changed = True
+            if changed:
+                self._rebuild()
+            PAYLOAD_SCANS.observe(time.perf_counter() - t0)
+            return changed
+
+    def _rebuild(self):
+        contacts = {}
+        messages = {}
+        seen_ids = set()
+        for filename in sorted(self._files):
+            _, _, file_contacts, file_messages = self._files[filename]
+            for wa_id, name in file_contacts:
+                if wa_id not in contacts:
+                    contacts[wa_id] = {'wa_id': wa_id, 'name': name}
+            for m in file_messages:
+                msg_id = m.get('id')
+                if msg_id:
+                    if msg_id in seen_ids:
+                        continue
+                    seen_ids.add(msg_id)
+                messages.setdefault(m['wa_id'], []).append(m)
+        for lst in messages.values():
+            lst.sort(key=lambda m: _to_num(m.get('timestamp')))
+        self._contacts = contacts
+        self._messages = messages
+        self.generation += 1
+        log.info("Payload index rebuilt: %d files, %d contacts, %d messages", len(self._files), len(contacts), len(seen_ids))
+
+    def contacts(self):
+        self.refresh()
+        return list(self._contacts.values())
+
+    def messages(self, wa_id):
+        self.refresh()
+        return list(self._messages.get(wa_id, []))
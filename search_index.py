@@ -0,0 +1,287 @@
+import re
+import sys
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from heapq import merge
+
+import eventlet
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_TOKEN_LENGTH = 64
+# A short prefix like "a" can match thousands of terms; at most this many posting lists are
+# expanded. A prefix with more never drives a query and is matched against message text instead
+MAX_PREFIX_TERMS = 64
+# Candidates examined per query before returning a partial page with a cursor to continue from
+MAX_SCAN = 200000
+
+
+def _mark_class():
+    """Character class of every combining mark (Mn/Mc/Me) in the BMP.
+
+    ``\\w`` alone splits Indic words at vowel signs and viramas
+    ("राहुल" -> "र", "ह", "ल"), so marks are added to the word characters.
+    """
+    ranges = []
+    start = prev = None
+    for cp in range(0x300, 0x10000):
+        if unicodedata.category(chr(cp))[0] == 'M':
+            if start is None:
+                start = cp
+            elif cp != prev + 1:
+                ranges.append((start, prev))
+                start = cp
+            prev = cp
+    ranges.append((start, prev))
+    return ''.join(f'\\u{a:04x}-\\u{b:04x}' if a != b else f'\\u{a:04x}' for a, b in ranges)
+
+
+# Letters, digits and combining marks, plus ZWJ/ZWNJ which join Indic conjuncts
+_TOKEN_RE = re.compile(f"(?:[^\\W_]|[{_mark_class()}\\u200c\\u200d])+")
+
+
+def tokenize(text):
+    """Lowercased word tokens of ``text``, NFKC-normalized so compatibility forms match."""
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKC', text).casefold()
+    tokens = []
+    for token in _TOKEN_RE.findall(text):
+        token = token.replace('\u200c', '').replace('\u200d', '')
+        if token and len(token) <= MAX_TOKEN_LENGTH:
+            tokens.append(token)
+    return tokens
+
+
+def _contains(postings, doc):
+    i = bisect_left(postings, doc)
+    return i < len(postings) and postings[i] == doc
+
+
+def _walk_back(postings, below):
+    for i in range(bisect_left(postings, below) - 1, -1, -1):
+        yield postings[i]
+
+
+def _descending(postings_lists, below):
+    """Doc ids under ``below`` from one or more ascending posting arrays, newest first, no repeats."""
+    if len(postings_lists) == 1:
+        yield from _walk_back(postings_lists[0], below)
+        return
+    runs = [_walk_back(p, below) for p in postings_lists]
+    last = None
+    for doc in merge(*runs, reverse=True):
+        if doc != last:
+            yield doc
+            last = doc
+
+
+class SearchIndex:
+    """Incrementally maintained inverted index over message text.
+
+    Each indexed message gets a doc number in arrival order; the bulk
+    ``build()`` sorts by timestamp first, so doc order is newest-last and
+    results come back newest first by walking posting lists backwards.
+    Every term maps to an ascending ``array('I')`` of doc numbers and every
+    conversation has one too, so a ``wa_id`` filter is just another posting
+    list to intersect. All query terms must match; the last one also
+    matches as a prefix, for search-as-you-type.
+    """
+
+    def __init__(self):
+        self._postings = {}   # term -> array('I') of doc numbers
+        self._terms = []      # sorted vocabulary, for prefix lookups
+        self._chats = {}      # wa_id -> array('I') of doc numbers
+        self._doc_by_id = {}  # message id -> doc number
+        self._ids = []
+        self._wa_ids = []
+        self._names = []
+        self._bodies = []
+        self._timestamps = array('d')
+        self._building = False
+        self._pending = []
+        self.queries = 0
+        self.build_seconds = 0.0
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, msg):
+        """Index one message dict. Returns False if it has no text or its id is already indexed."""
+        if self._building:
+            # Indexed after the bulk load so doc order stays chronological
+            self._pending.append(msg)
+            return True
+        return self._add(msg, self._add_term)
+
+    def _add(self, msg, add_term):
+        message_id = msg.get('id') or msg.get('wamid')
+        body = (msg.get('text') or {}).get('body') or ''
+        if not message_id or message_id in self._doc_by_id:
+            return False
+        terms = set(tokenize(body))
+        if not terms:
+            return False
+        doc = len(self._ids)
+        wa_id = sys.intern(str(msg.get('wa_id')))
+        self._doc_by_id[message_id] = doc
+        self._ids.append(message_id)
+        self._wa_ids.append(wa_id)
+        self._names.append(msg.get('name'))
+        self._bodies.append(body)
+        try:
+            self._timestamps.append(float(msg.get('timestamp') or 0))
+        except (TypeError, ValueError):
+            self._timestamps.append(0.0)
+        for term in terms:
+            add_term(term, doc)
+        chat = self._chats.get(wa_id)
+        if chat is None:
+            chat = self._chats[wa_id] = array('I')
+        chat.append(doc)
+        return True
+
+    def _add_term(self, term, doc):
+        postings = self._postings.get(term)
+        if postings is None:
+            postings = self._postings[term] = array('I')
+            insort(self._terms, term)
+        postings.append(doc)
+
+    def _add_term_bulk(self, term, doc):
+        postings = self._postings.get(term)
+        if postings is None:
+            postings = self._postings[term] = array('I')
+        postings.append(doc)
+
+    def build(self, messages):
+        """Index an iterable of message dicts (e.g. everything in storage at startup).
+
+        Yields to other greenlets while reading, and queues ``add()`` calls
+        made meanwhile until the bulk load is in.
+        """
+        t0 = time.perf_counter()
+        self._building = True
+        try:
+            batch = []
+            for i, msg in enumerate(messages):
+                batch.append(msg)
+                if i % 5000 == 4999:
+                    eventlet.sleep(0)
+            batch.sort(key=lambda m: _to_num(m.get('timestamp')))
+            for msg in batch:
+                self._add(msg, self._add_term_bulk)
+            self._terms = sorted(self._postings)
+        finally:
+            self._building = False
+            pending, self._pending = self._pending, []
+            for msg in pending:
+                self._add(msg, self._add_term)
+        self.build_seconds = time.perf_counter() - t0
+        return len(self)
+
+    def _term_lists(self, term, prefix):
+        """``(posting lists, complete)``; a prefix matching more than MAX_PREFIX_TERMS terms is not complete."""
+        if not prefix:
+            postings = self._postings.get(term)
+            return ([postings] if postings is not None else []), True
+        start = bisect_left(self._terms, term)
+        end = bisect_right(self._terms, term + '\U0010ffff', start, min(len(self._terms), start + MAX_PREFIX_TERMS))
+        complete = end == len(self._terms) or not self._terms[end].startswith(term)
+        return [self._postings[t] for t in self._terms[start:end]], complete
+
+    def search(self, query, limit=DEFAULT_SEARCH_LIMIT, before=None, wa_id=None):
+        """Messages matching every term of ``query``, newest first.
+
+        ``before`` is the ``next_before`` cursor of the previous page.
+        Returns ``{'results': [...], 'next_before': cursor or None}``. A
+        page can come back short (even empty) with a cursor when
+        ``MAX_SCAN`` candidates were examined without filling it.
+        """
+        self.queries += 1
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return {'results': [], 'next_before': None}
+        last = len(terms) - 1
+        # (posting lists, prefix or None, complete) per term, plus the conversation when filtering by one
+        groups = []
+        for i, t in enumerate(terms):
+            lists, complete = self._term_lists(t, prefix=(i == last))
+            groups.append((lists, t if i == last else None, complete))
+        if wa_id is not None:
+            chat = self._chats.get(wa_id)
+            groups.append(([chat] if chat is not None else [], None, True))
+        if not all(lists for lists, _, _ in groups):
+            return {'results': [], 'next_before': None}
+
+        # Walk the rarest group and probe the others. A truncated prefix group would miss
+        # matches as the driver, so it is only probed (by its full prefix, see _matches)
+        below = len(self._ids) if before is None else before
+        drivers = sorted((g for g in groups if g[2]), key=lambda g: sum(len(p) for p in g[0]))
+        if drivers:
+            candidates = _descending(drivers[0][0], below)
+            others = [(lists, prefix) for lists, prefix, _ in groups if lists is not drivers[0][0]]
+        else:
+            # Just a short prefix: every message is a candidate, newest first
+            candidates = range(below - 1, -1, -1)
+            others = [(lists, prefix) for lists, prefix, _ in groups]
+        docs = []
+        cursor = None
+        for scanned, doc in enumerate(candidates, 1):
+            if all(self._matches(doc, lists, prefix) for lists, prefix in others):
+                docs.append(doc)
+                if len(docs) > limit:
+                    docs.pop()
+                    cursor = docs[-1]
+                    break
+            if scanned >= MAX_SCAN:
+                cursor = doc
+                break
+        return {
+            'results': [self._result(doc) for doc in docs],
+            'next_before': str(cursor) if cursor is not None else None,
+        }
+
+    def _matches(self, doc, lists, prefix):
+        if prefix is not None and len(lists) > 8:
+            # Cheaper than a bisect per expanded term, and not limited to MAX_PREFIX_TERMS
+            return any(t.startswith(prefix) for t in tokenize(self._bodies[doc]))
+        return any(_contains(p, doc) for p in lists)
+
+    def _result(self, doc):
+        return {
+            'id': self._ids[doc],
+            'wa_id': self._wa_ids[doc],
+            'name': self._names[doc],
+            'timestamp': self._timestamps[doc],
+            'text': {'body': self._bodies[doc]},
+        }
+
+    def stats(self):
+        return {
+            'messages': len(self._ids),
+            'terms': len(self._postings),
+            'postings': sum(len(p) for p in self._postings.values()),
+            'conversations': len(self._chats),
+            'building': self._building,
+            'build_seconds': round(self.build_seconds, 3),
+            'queries': self.queries,
+        }
+
+
+def _to_num(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def parse_search_cursor(value):
+    """``next_before`` cursor -> doc number. Raises ValueError if malformed."""
+    if value is None or value == '':
+        return None
+    doc = int(value)
+    if doc < 0:
+        raise ValueError(f"Invalid cursor: {value!r}")
+    return doc
@@ -0,0 +1,116 @@
+import json
+import itertools
+from collections import deque
+from eventlet.queue import LightQueue, Empty
+
+DEFAULT_BUFFER_SIZE = 256
+DEFAULT_REPLAY_SIZE = 1000
+
+
+class Event:
+    __slots__ = ('id', 'topic', 'data')
+
+    def __init__(self, id, topic, data):
+        self.id = id
+        self.topic = topic
+        self.data = data
+
+    def encode(self):
+        return f"id: {self.id}\ndata: {self.data}\n\n"
+
+
+class Subscription:
+    """One SSE client: a bounded ring buffer that drops its oldest events when full."""
+
+    def __init__(self, broker, topics, buffer_size):
+        self.broker = broker
+        self.topics = set(topics) if topics else None
+        self.queue = LightQueue(buffer_size)
+        self.delivered = 0
+        self.dropped = 0
+
+    def wants(self, event):
+        return self.topics is None or event.topic is None or event.topic in self.topics
+
+    def offer(self, event):
+        if not self.wants(event):
+            return
+        if self.queue.full():
+            # Slow consumer: make room by discarding the oldest pending event
+            try:
+                self.queue.get_nowait()
+                self.dropped += 1
+                self.broker.dropped += 1
+            except Empty:
+                pass
+        self.queue.put_nowait(event)
+
+    def get(self, timeout):
+        """Next event, or None after ``timeout`` seconds without one."""
+        try:
+            event = self.queue.get(timeout=timeout)
+        except Empty:
+            return None
+        self.delivered += 1
+        self.broker.delivered += 1
+        return event
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class SSEBroker:
+    """Publish/subscribe fan-out for /events.
+
+    Every published event goes to every subscriber whose topic filter
+    (a set of wa_ids, or None for everything) matches. Recent events are
+    kept in a replay buffer so a reconnecting client can resume from its
+    ``Last-Event-ID``; if that id has already been evicted the client gets
+    a ``reset`` event and should reload.
+    """
+
+    def __init__(self, buffer_size=DEFAULT_BUFFER_SIZE, replay_size=DEFAULT_REPLAY_SIZE):
+        self.buffer_size = buffer_size
+        self._ids = itertools.count(1)
+        self._replay = deque(maxlen=replay_size)
+        self._subscribers = set()
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def publish(self, data, topic=None):
+        """Fan ``data`` (an already-encoded JSON string) out to matching subscribers. Returns the event id."""
+        event = Event(next(self._ids), topic, data)
+        self._replay.append(event)
+        self.published += 1
+        for sub in list(self._subscribers):
+            sub.offer(event)
+        return event.id
+
+    def subscribe(self, topics=None, last_event_id=None):
+        sub = Subscription(self, topics, self.buffer_size)
+        if last_event_id is not None:
+            newest = self._replay[-1].id if self._replay else 0
+            oldest = self._replay[0].id if self._replay else newest + 1
+            # Evicted from the replay buffer, or from before a server restart
+            if last_event_id < oldest - 1 or last_event_id > newest:
+                sub.offer(Event(last_event_id, None, json.dumps({"type": "reset"})))
+            else:
+                for event in self._replay:
+                    if event.id > last_event_id:
+                        sub.offer(event)
+        self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        self._subscribers.discard(sub)
+
+    def stats(self):
+        depths = [s.queue.qsize() for s in self._subscribers]
+        return {
+            "subscribers": len(depths),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "max_queue_depth": max(depths) if depths else 0,
+        }
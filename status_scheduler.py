@@ -0,0 +1,116 @@
+import heapq
+import itertools
+import time
+import logging
+
+import eventlet
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TICK = 0.1
+# Simulated receipts for messages sent from the UI: (status, seconds after send)
+SIMULATED_LIFECYCLE = (('delivered', 1.0), ('read', 2.0))
+
+
+class StatusScheduler:
+    """One greenlet that applies due status transitions in batches.
+
+    Transitions sit in a heap ordered by due time. Every ``tick`` the
+    greenlet pops everything that is due and hands the whole batch to
+    ``apply_batch(transitions)``, a list of ``(wa_id, message_id, status)``,
+    so a burst of sends costs one bulk write and one emit per chat instead
+    of a sleeping greenlet and two round trips per message.
+
+    A real receipt for a message cancels its pending simulated transitions.
+    """
+
+    def __init__(self, apply_batch, tick=DEFAULT_TICK):
+        self.apply_batch = apply_batch
+        self.tick = tick
+        self._heap = []
+        self._order = itertools.count()
+        # message_id -> generation; heap entries from an older generation are stale
+        self._generation = {}
+        self._queued = {}
+        self._runner = None
+        self.scheduled = 0
+        self.applied = 0
+        self.cancelled = 0
+        self.batches = 0
+        self.errors = 0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+
+    def schedule(self, wa_id, message_id, status, delay=0.0):
+        gen = self._generation.get(message_id, 0)
+        heapq.heappush(self._heap, (time.monotonic() + delay, next(self._order), gen, wa_id, message_id, status))
+        self._queued[message_id] = self._queued.get(message_id, 0) + 1
+        self.scheduled += 1
+        self._ensure_running()
+
+    def schedule_lifecycle(self, wa_id, message_id, steps=SIMULATED_LIFECYCLE):
+        for status, delay in steps:
+            self.schedule(wa_id, message_id, status, delay)
+
+    def receipt(self, wa_id, message_id, status):
+        """A real status from the webhook: drop simulated ones and apply on the next tick."""
+        self._generation[message_id] = self._generation.get(message_id, 0) + 1
+        self.schedule(wa_id, message_id, status)
+
+    def _ensure_running(self):
+        if self._runner is None:
+            self._runner = eventlet.spawn(self._run)
+
+    def _run(self):
+        while True:
+            eventlet.sleep(self.tick)
+            try:
+                self.run_due()
+            except Exception as e:
+                self.errors += 1
+                log.exception("Status batch failed: %s", e)
+
+    def run_due(self, now=None):
+        """Pop and apply every transition due by ``now``. Returns the batch size."""
+        now = time.monotonic() if now is None else now
+        batch = []
+        lag = 0.0
+        while self._heap and self._heap[0][0] <= now:
+            due, _, gen, wa_id, message_id, status = heapq.heappop(self._heap)
+            current = self._generation.get(message_id, 0)
+            self._done(message_id)
+            if gen != current:
+                self.cancelled += 1
+                continue
+            lag = max(lag, now - due)
+            batch.append((wa_id, message_id, status))
+        if not batch:
+            return 0
+        self.last_lag_ms = lag * 1000
+        self.max_lag_ms = max(self.max_lag_ms, self.last_lag_ms)
+        self.batches += 1
+        self.applied += len(batch)
+        self.apply_batch(batch)
+        return len(batch)
+
+    def _done(self, message_id):
+        # Generations only matter while a message still has queued entries
+        left = self._queued[message_id] - 1
+        if left:
+            self._queued[message_id] = left
+        else:
+            del self._queued[message_id]
+            self._generation.pop(message_id, None)
+
+    def stats(self):
+        return {
+            "pending": len(self._heap),
+            "scheduled": self.scheduled,
+            "applied": self.applied,
+            "cancelled": self.cancelled,
+            "batches": self.batches,
+            "avg_batch": round(self.applied / self.batches, 1) if self.batches else 0,
+            "errors": self.errors,
+            "last_lag_ms": round(self.last_lag_ms, 1),
+            "max_lag_ms": round(self.max_lag_ms, 1),
+        }
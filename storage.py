@@ -0,0 +1,631 @@
+"""Storage backends behind one interface, with failover from MongoDB to a local store.
+
+Routes talk to a ``Storage``. It sends every operation to the Mongo
+repository while that backend's circuit breaker is closed. After repeated
+connection failures or timeouts the breaker opens and operations go to the
+local repository (MemoryStore or LogStore). Writes made during the outage
+are journaled and replayed into Mongo once it answers again. The first
+connection (and the bootstrap ingest into an empty database) runs the same
+way in the background, so a worker serves requests before Mongo answers.
+Payload files fill in contacts and history that neither backend has.
+
+Each repository implements:
+
+    append_message(msg) -> bool          False if the id was already stored
+    append_messages(docs)                bulk, for the webhook write-behind
+    update_statuses({id: status}) -> [{wa_id, id, status, seq}]
+    mark_read(wa_id, up_to) -> {marked, unread_count, read_up_to}
+    conversations() -> [{wa_id, name, last_message, last_timestamp, unread_count}]
+    history(wa_id) -> [message, ...]     oldest first
+    history_page(wa_id, limit, before, after) -> page dict
+    archivable(wa_id, before, limit) -> [message, ...]   oldest messages older than ``before``
+    drop_archived(wa_id, docs)           after the archiver has written them out
+    current_seq() / changes_since(since, limit)
+    iter_messages() -> every stored message, for rebuilding the search index
+"""
+import time
+import logging
+from contextlib import contextmanager
+
+import eventlet
+from pymongo import MongoClient
+from pymongo.errors import ConnectionFailure, DuplicateKeyError, ExecutionTimeout
+
+from chat_summary import ChatSummaryStore, update_statuses, is_forward, is_inbound
+from changes import MongoSequence, mongo_changes_since, memory_changes_since
+from db_indexes import ensure_indexes, SUMMARY_INDEXES, UNREAD_STATUSES
+from ingest import Ingestor, ingest_directory, normalize_timestamps, MESSAGE_FIELDS
+from pagination import mongo_page_query, build_page, paginate_list, list_page_rows, merge_page, message_key
+from metrics import MongoCommandMetrics, STORAGE_OPS, STORAGE_ERRORS
+
+log = logging.getLogger(__name__)
+
+# Errors that mean "the database is unreachable or too slow", as opposed to a bad request
+UNAVAILABLE_ERRORS = (ConnectionFailure, ExecutionTimeout)
+
+
+def make_mongo_client(uri, pool_size=20, timeout_ms=2000, socket_timeout_ms=5000):
+    """MongoClient sized for one eventlet worker, failing fast instead of the 30 s defaults."""
+    return MongoClient(
+        uri,
+        # Greenlets beyond this wait for a socket rather than opening more connections
+        maxPoolSize=pool_size,
+        waitQueueTimeoutMS=timeout_ms,
+        serverSelectionTimeoutMS=timeout_ms,
+        connectTimeoutMS=timeout_ms,
+        socketTimeoutMS=socket_timeout_ms,
+        retryWrites=True,
+        retryReads=True,
+        # Per-command latency for /metrics
+        event_listeners=[MongoCommandMetrics()],
+    )
+
+
+class LatencyStats:
+    """Count, errors, mean and max latency per operation name."""
+
+    def __init__(self):
+        self._ops = {}
+
+    @contextmanager
+    def timed(self, op):
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            ms = (time.perf_counter() - t0) * 1000
+            entry = self._ops.get(op)
+            if entry is None:
+                entry = self._ops[op] = [0, 0, 0.0, 0.0]
+            entry[0] += 1
+            entry[1] += 0 if ok else 1
+            entry[2] += ms
+            entry[3] = max(entry[3], ms)
+            STORAGE_OPS.observe(ms / 1000, op)
+            if not ok:
+                STORAGE_ERRORS.inc(op)
+
+    def snapshot(self):
+        return {op: {"count": n, "errors": err, "avg_ms": round(total / n, 3), "max_ms": round(peak, 3)}
+                for op, (n, err, total, peak) in sorted(self._ops.items())}
+
+
+class CircuitBreaker:
+    """Closed -> open after ``failure_threshold`` consecutive failures; one trial call after ``reset_timeout``."""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=3, reset_timeout=10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+
+    def allow(self):
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+        return self.state != self.OPEN
+
+    def record_success(self):
+        self.failures = 0
+        self.state = self.CLOSED
+
+    def trip(self):
+        if self.state != self.OPEN:
+            self.trips += 1
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.trip()
+
+    def stats(self):
+        return {"state": self.state, "consecutive_failures": self.failures, "trips": self.trips}
+
+
+def merge_dedupe_messages(payload_msgs, memory_msgs):
+    """Messages from both lists, deduped by id/wamid and sorted by timestamp."""
+    deduped = []
+    seen = set()
+    for msg in (payload_msgs + memory_msgs):
+        key = msg.get('id') or msg.get('wamid') or (msg.get('text', {}).get('body'), msg.get('timestamp'))
+        if key in seen:
+            continue
+        seen.add(key)
+        deduped.append(msg)
+    # sort by timestamp if present
+    try:
+        deduped.sort(key=lambda m: float(m.get('timestamp', 0)))
+    except Exception:
+        pass
+    return deduped
+
+
+class MongoRepository:
+    name = 'mongo'
+
+    def __init__(self, db):
+        self.db = db
+        self.collection = db['processed_messages']
+        # One row per conversation, maintained on every write so /chats never scans messages
+        self.summaries = ChatSummaryStore(db['chat_summaries'])
+        # Change sequence stamped on every write so clients can /sync deltas
+        self.sequence = MongoSequence(db['counters'])
+        self.prepared = False
+
+    def prepare(self, payloads_dir):
+        """Ping; the first time, also create indexes and ingest the payload files into an empty database.
+
+        A database written by older versions gets its string timestamps converted
+        (range queries and page cursors only match numbers) and its chat summaries
+        rebuilt, since /chats reads nothing else.
+        """
+        self.db.client.admin.command('ping')
+        if self.prepared:
+            return
+        ensure_indexes(self.collection)
+        ensure_indexes(self.summaries.collection, SUMMARY_INDEXES)
+        migrations = self.db['counters'].find_one({'_id': 'migrations'}) or {}
+        # Full scans, so each runs once per database
+        done = {'numeric_timestamps': True, 'inbound_unread': True}
+        if self.collection.estimated_document_count() == 0:
+            # Same bulk ingestion as process_payloads.py
+            stats = ingest_directory(self.collection, payloads_dir, summaries=self.summaries, sequence=self.sequence)
+            log.info("Bootstrap ingest: %s", stats)
+            rebuild = False
+        else:
+            if not migrations.get('numeric_timestamps'):
+                # Every write path stores numbers
+                fixed = normalize_timestamps(self.collection)
+                log.info("Converted %d string timestamps to numbers", fixed)
+            # unread_count used to count the agent's own messages too
+            rebuild = not migrations.get('inbound_unread') or \
+                self.summaries.collection.estimated_document_count() < len(self.collection.distinct('wa_id'))
+        if rebuild:
+            count = self.summaries.rebuild(self.collection)
+            log.info("Rebuilt %d chat summaries", count)
+        if any(not migrations.get(k) for k in done):
+            self.db['counters'].update_one({'_id': 'migrations'}, {'$set': done}, upsert=True)
+        # Reconnects after an outage only ping
+        self.prepared = True
+
+    def append_message(self, msg):
+        with self.sequence.reserve() as seq:
+            msg['seq'] = msg['created_seq'] = seq
+            try:
+                self.collection.insert_one(msg)
+            except DuplicateKeyError:
+                # Retried send with the same client_id; the unique wamid index already has it
+                return False
+            finally:
+                msg.pop('_id', None)
+        self.summaries.record_message(msg)
+        return True
+
+    def append_messages(self, docs):
+        ingestor = Ingestor(self.collection, summaries=self.summaries, batch_size=len(docs) + 1, sequence=self.sequence)
+        for doc in docs:
+            ingestor.add_document(dict(doc))
+        ingestor.flush()
+
+    def update_statuses(self, latest):
+        return update_statuses(self.collection, self.summaries, latest, sequence=self.sequence)
+
+    def mark_read(self, wa_id, up_to):
+        # One ranged update (served by the unread_by_chat index); the messages share one seq.
+        # Only the contact's messages: the agent's own keep the ticks the contact's receipts gave them
+        with self.sequence.reserve() as seq:
+            result = self.collection.update_many(
+                {'wa_id': wa_id, 'from': wa_id, 'status': {'$in': UNREAD_STATUSES}, 'timestamp': {'$lte': up_to}},
+                {'$set': {'status': 'read', 'seq': seq}},
+            )
+        summary = self.summaries.record_read(wa_id, up_to, result.modified_count) or {}
+        return {"marked": result.modified_count, "unread_count": summary.get('unread_count', 0),
+                "read_up_to": summary.get('read_up_to', up_to)}
+
+    def conversations(self):
+        return [{
+            "wa_id": c['_id'],
+            "name": c.get('name', 'Unknown'),
+            "last_message": c.get('last_message', ''),
+            "last_timestamp": c.get('last_timestamp', ''),
+            "unread_count": c.get('unread_count', 0),
+        } for c in self.summaries.list()]
+
+    def history(self, wa_id):
+        return list(self.collection.find({"wa_id": wa_id}, MESSAGE_FIELDS).sort("timestamp", 1))
+
+    def history_page(self, wa_id, limit, before, after):
+        query, sort, newest_first = mongo_page_query(wa_id, before, after)
+        rows = list(self.collection.find(query, MESSAGE_FIELDS).sort(sort).limit(limit + 1))
+        return build_page(rows, limit, newest_first, before, after)
+
+    def current_seq(self):
+        return self.sequence.committed
+
+    def changes_since(self, since, limit):
+        return mongo_changes_since(self.collection, since, limit, self.sequence.committed)
+
+    def archivable(self, wa_id, before, limit):
+        query = {'wa_id': wa_id, 'timestamp': {'$lt': before}, 'wamid': {'$exists': True}}
+        return list(self.collection.find(query, MESSAGE_FIELDS).sort([('timestamp', 1), ('wamid', 1)]).limit(limit))
+
+    def drop_archived(self, wa_id, docs):
+        self.collection.delete_many({'wamid': {'$in': [d['wamid'] for d in docs]}})
+        # Archived messages stop counting as unread
+        settled = [(wa_id, d.get('status'), 'read') for d in docs if is_inbound(d) and d.get('status') != 'read']
+        if settled:
+            self.summaries.record_batch([], settled)
+
+    def iter_messages(self):
+        fields = {'_id': 0, 'id': 1, 'wamid': 1, 'wa_id': 1, 'name': 1, 'timestamp': 1, 'text.body': 1}
+        return self.collection.find({'text.body': {'$exists': True}}, fields).batch_size(5000)
+
+
+class LocalRepository:
+    """MemoryStore or LogStore plus the in-process change log."""
+
+    name = 'local'
+
+    def __init__(self, store, change_log):
+        self.store = store
+        self.change_log = change_log
+        self.read_up_to = {}  # wa_id -> read watermark (timestamp)
+
+    def append_message(self, msg, wait=True):
+        record = self.store.add(msg, wait=wait)
+        if record is None:
+            return False
+        msg['seq'] = msg['created_seq'] = record.seq = record.created_seq = self.change_log.allocate()
+        self.change_log.append(msg['seq'], 'message', msg)
+        return True
+
+    def append_messages(self, docs):
+        for doc in docs:
+            self.append_message(doc, wait=False)
+        # One shared fsync for the batch when the store is durable
+        self.store.wait_durable()
+
+    def update_statuses(self, latest):
+        applied = []
+        for message_id, status in latest.items():
+            record = self.store.get(message_id)
+            if record is not None and is_forward(record.status, status):
+                record = self.store.set_status(message_id, status, wait=False)
+                record.seq = self.change_log.allocate()
+                change = record.status_change()
+                self.change_log.append(record.seq, 'status', change)
+                applied.append(change)
+        self.store.wait_durable()
+        return applied
+
+    def mark_read(self, wa_id, up_to):
+        marked = 0
+        for record in self.store.mark_read(wa_id, up_to):
+            record.seq = self.change_log.allocate()
+            self.change_log.append(record.seq, 'status', record.status_change())
+            marked += 1
+        self.store.wait_durable()
+        up_to = self.read_up_to[wa_id] = max(up_to, self.read_up_to.get(wa_id, up_to))
+        return {"marked": marked, "unread_count": self.store.unread(wa_id), "read_up_to": up_to}
+
+    def conversations(self):
+        rows = []
+        for wa_id, name in self.store.conversations():
+            last = self.store.last(wa_id) or {}
+            rows.append({
+                "wa_id": wa_id,
+                "name": name,
+                "last_message": (last.get('text') or {}).get('body', ''),
+                "last_timestamp": last.get('timestamp', ''),
+                "unread_count": self.store.unread(wa_id),
+            })
+        return rows
+
+    def history(self, wa_id):
+        return self.store.messages(wa_id)
+
+    def history_page(self, wa_id, limit, before, after):
+        # Bisects the store's per-chat order; only the page's records are decoded
+        rows = self.store.page_rows(wa_id, limit, before, after)
+        return build_page(rows, limit, after is None, before, after)
+
+    def current_seq(self):
+        return self.change_log.current
+
+    def changes_since(self, since, limit):
+        return memory_changes_since(self.change_log, since, limit)
+
+    def archivable(self, wa_id, before, limit):
+        return self.store.archivable(wa_id, before, limit)
+
+    def drop_archived(self, wa_id, docs):
+        self.store.drop(wa_id, [d.get('id') or d.get('wamid') for d in docs])
+
+    def iter_messages(self):
+        # Least recently used first, so touching each chat keeps the LRU order
+        for wa_id, _ in reversed(self.store.conversations()):
+            yield from self.store.messages(wa_id)
+
+
+class PayloadRepository:
+    """Read-only view of the payload files (see payload_index.py)."""
+
+    name = 'payloads'
+
+    def __init__(self, index):
+        self.index = index
+
+    def conversations(self):
+        rows = []
+        for contact in self.index.contacts():
+            last = (self.index.messages(contact['wa_id'])[-1:] or [{}])[0]
+            rows.append({
+                "wa_id": contact['wa_id'],
+                "name": contact['name'],
+                "last_message": (last.get('text') or {}).get('body', ''),
+                "last_timestamp": last.get('timestamp', ''),
+                "unread_count": 0,
+            })
+        return rows
+
+    def history(self, wa_id):
+        # Already sorted by timestamp in the index
+        return self.index.messages(wa_id)
+
+    def iter_messages(self):
+        for contact in self.index.contacts():
+            yield from self.index.messages(contact['wa_id'])
+
+
+class Storage:
+    """Routes' entry point: Mongo while healthy, the local store while it is not. See the module docstring."""
+
+    def __init__(self, primary, local, payloads, payloads_dir, breaker=None, reconcile_interval=5.0, archive=None):
+        self.primary = primary
+        self.local = local
+        self.payloads = payloads
+        self.payloads_dir = payloads_dir
+        # Cold tier behind both backends (see archive.py); history reads go through to it
+        self.archive = archive
+        self.breaker = breaker or CircuitBreaker()
+        self.reconcile_interval = reconcile_interval
+        self.latency = LatencyStats()
+        self.primary_ready = False
+        self.connecting = False
+        self.connect_seconds = None
+        # Writes taken by the local store while Mongo was unavailable, replayed on recovery
+        self._pending_messages = []
+        self._pending_statuses = {}
+        self._pending_reads = {}  # wa_id -> highest read watermark
+        self._reconciler = None
+
+    @property
+    def using_primary(self):
+        return self.primary is not None and self.primary_ready and self.breaker.state != CircuitBreaker.OPEN
+
+    @property
+    def state(self):
+        """``local`` (no Mongo configured), ``connecting`` (first attempt running), ``mongo`` or ``degraded``."""
+        if self.primary is None:
+            return 'local'
+        if self.using_primary:
+            return 'mongo'
+        return 'connecting' if self.connect_seconds is None else 'degraded'
+
+    def connect(self):
+        """Prepare Mongo (bounded by the client's timeouts) and replay writes taken meanwhile. Returns True if it is usable."""
+        if self.primary is None or self.connecting:
+            return False
+        self.connecting = True
+        t0 = time.perf_counter()
+        try:
+            with self.latency.timed('mongo.prepare'):
+                self.primary.prepare(self.payloads_dir)
+            # Before switching over, so reads on Mongo never miss writes the local store took
+            self._replay()
+            self.primary_ready = True
+            self.breaker.record_success()
+            log.info("MongoDB connected")
+            return True
+        except Exception as e:
+            log.error("MongoDB connection failed: %s", e)
+            self.breaker.trip()
+            self._ensure_reconciler()
+            return False
+        finally:
+            self.connecting = False
+            if self.connect_seconds is None:
+                self.connect_seconds = time.perf_counter() - t0
+
+    def _run(self, op, call, journal=None):
+        """``call(repo)`` on Mongo if its breaker allows, else (or on an outage error) on the local store.
+
+        Returns ``(backend_name, result)``.
+        """
+        if self.primary is not None and self.primary_ready and self.breaker.allow():
+            try:
+                with self.latency.timed(f'mongo.{op}'):
+                    result = call(self.primary)
+                self.breaker.record_success()
+                return 'mongo', result
+            except UNAVAILABLE_ERRORS as e:
+                self.breaker.record_failure()
+                log.warning("MongoDB %s failed (%s); using the local store", op, e)
+        if journal is not None and self.primary is not None:
+            journal()
+            self._ensure_reconciler()
+        with self.latency.timed(f'local.{op}'):
+            return 'local', call(self.local)
+
+    # --- writes --------------------------------------------------------------
+
+    def append_message(self, msg):
+        return self._run('append_message', lambda r: r.append_message(msg),
+                         journal=lambda: self._pending_messages.append(dict(msg)))[1]
+
+    def append_messages(self, docs):
+        return self._run('append_messages', lambda r: r.append_messages(docs),
+                         journal=lambda: self._pending_messages.extend(dict(d) for d in docs))[1]
+
+    def update_statuses(self, latest):
+        return self._run('update_statuses', lambda r: r.update_statuses(latest),
+                         journal=lambda: self._pending_statuses.update(latest))[1]
+
+    def mark_read(self, wa_id, up_to):
+        def journal():
+            self._pending_reads[wa_id] = max(up_to, self._pending_reads.get(wa_id, up_to))
+        return self._run('mark_read', lambda r: r.mark_read(wa_id, up_to), journal=journal)[1]
+
+    # --- reads ---------------------------------------------------------------
+
+    def conversations(self):
+        backend, rows = self._run('conversations', lambda r: r.conversations())
+        by_id = {r['wa_id']: r for r in rows}
+        chats = []
+        # Every payload contact appears, with the backend's row when it has one
+        for contact in self.payloads.conversations():
+            row = by_id.pop(contact['wa_id'], None)
+            if backend == 'mongo':
+                chats.append(row or dict(contact, last_message='', last_timestamp=''))
+            elif row is None or _ts(contact['last_timestamp']) > _ts(row['last_timestamp']):
+                # The local store only has messages sent since startup
+                chats.append(contact)
+            else:
+                chats.append(dict(row, name=contact['name']))
+        # Plus chats that exist only in the backend (webhook, sends to new numbers)
+        chats.extend(by_id.values())
+        return chats
+
+    def history(self, wa_id):
+        backend, messages = self._run('history', lambda r: r.history(wa_id))
+        if self.archive is not None and self.archive.span(wa_id) is not None:
+            with self.latency.timed('archive.history'):
+                messages = merge_dedupe_messages(messages, self.archive.messages(wa_id))
+        if backend == 'mongo':
+            # Fallback to payloads if empty in DB
+            return messages or self.payloads.history(wa_id)
+        return merge_dedupe_messages(self.payloads.history(wa_id), messages)
+
+    def history_page(self, wa_id, limit, before, after):
+        # Both backends page by cursor; the archive is read only when the page reaches into it
+        backend, page = self._run('history_page', lambda r: r.history_page(wa_id, limit, before, after))
+        page = self._read_through(page, wa_id, limit, before, after)
+        if backend == 'mongo':
+            if page['messages'] or before is not None or after is not None:
+                return page
+            # Fallback to payloads if empty in DB
+            return paginate_list(self.payloads.history(wa_id), limit)
+        # The local store is served together with the payload files, as in history()
+        rows = list_page_rows(self.payloads.history(wa_id), limit, before, after)
+        return merge_page(page, rows, limit, before, after)
+
+    def _read_through(self, page, wa_id, limit, before, after):
+        """Add archived messages to a hot-tier page when it reaches past the hot tier's oldest message."""
+        span = self.archive.span(wa_id) if self.archive is not None else None
+        if span is None:
+            return page
+        msgs = page['messages']
+        if after is not None:
+            # Forward: archived rows count only if some are newer than the cursor and older than the page's end
+            if span[1] <= after or (page['has_more_after'] and msgs and message_key(msgs[-1]) < span[0]):
+                return page
+        elif (before is not None and span[0] >= before) or \
+                (page['has_more_before'] and msgs and message_key(msgs[0]) > span[1]):
+            return page
+        with self.latency.timed('archive.history_page'):
+            rows = self.archive.page_rows(wa_id, limit, before, after)
+        return merge_page(page, rows, limit, before, after)
+
+    def current_seq(self):
+        return self._run('current_seq', lambda r: r.current_seq())[1]
+
+    def changes_since(self, since, limit):
+        return self._run('changes_since', lambda r: r.changes_since(since, limit))[1]
+
+    def iter_messages(self):
+        """Payload messages, then everything in the active backend (duplicates included)."""
+        yield from self.payloads.iter_messages()
+        yield from (self.primary if self.using_primary else self.local).iter_messages()
+
+    # --- recovery ------------------------------------------------------------
+
+    def _ensure_reconciler(self):
+        if self._reconciler is None:
+            self._reconciler = eventlet.spawn(self._reconcile_loop)
+
+    def _reconcile_loop(self):
+        while True:
+            eventlet.sleep(self.reconcile_interval)
+            try:
+                self.reconcile()
+            except Exception as e:
+                log.exception("Reconcile failed: %s", e)
+
+    def reconcile(self):
+        """Bring Mongo back into use and replay the writes it missed. Returns the number replayed."""
+        if self.primary is None or self.connecting or not self.breaker.allow():
+            return 0
+        if not self.primary_ready:
+            pending = len(self._pending_messages) + len(self._pending_statuses) + len(self._pending_reads)
+            return pending if self.connect() else 0
+        try:
+            replayed = self._replay()
+        except UNAVAILABLE_ERRORS as e:
+            self.breaker.record_failure()
+            log.warning("Reconcile postponed: %s", e)
+            return 0
+        self.breaker.record_success()
+        return replayed
+
+    def _replay(self):
+        """Write the journaled writes into Mongo. On failure they stay journaled and the error propagates."""
+        messages, self._pending_messages = self._pending_messages, []
+        statuses, self._pending_statuses = self._pending_statuses, {}
+        reads, self._pending_reads = self._pending_reads, {}
+        try:
+            with self.latency.timed('mongo.reconcile'):
+                if messages:
+                    # Upserts keyed on wamid, so replaying twice is harmless
+                    self.primary.append_messages(messages)
+                if statuses:
+                    self.primary.update_statuses(statuses)
+                for wa_id, up_to in reads.items():
+                    self.primary.mark_read(wa_id, up_to)
+        except Exception:
+            self._pending_messages = messages + self._pending_messages
+            self._pending_statuses = {**statuses, **self._pending_statuses}
+            for wa_id, up_to in reads.items():
+                self._pending_reads[wa_id] = max(up_to, self._pending_reads.get(wa_id, up_to))
+            raise
+        if messages or statuses or reads:
+            log.info("Reconciled %d messages, %d statuses and %d read watermarks into MongoDB",
+                     len(messages), len(statuses), len(reads))
+        return len(messages) + len(statuses) + len(reads)
+
+    def stats(self):
+        return {
+            "backend": 'mongo' if self.using_primary else 'local',
+            "state": self.state,
+            "connect_seconds": round(self.connect_seconds, 3) if self.connect_seconds is not None else None,
+            "mongo_configured": self.primary is not None,
+            "breaker": self.breaker.stats(),
+            "pending_reconcile": {"messages": len(self._pending_messages), "statuses": len(self._pending_statuses),
+                                  "reads": len(self._pending_reads)},
+            "latency": self.latency.snapshot(),
+        }
+
+
+def _ts(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
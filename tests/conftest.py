@@ -0,0 +1,23 @@
+import os
+import sys
+
+# The app is a set of top-level modules, not a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from mongomock.collection import BulkOperationBuilder
+except ImportError:
+    BulkOperationBuilder = None
+
+
+def _drop_sort(method):
+    def wrapper(self, *args, sort=None, **kwargs):
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+if BulkOperationBuilder is not None and not getattr(BulkOperationBuilder, '_accepts_sort', False):
+    # pymongo >= 4.10 passes sort= to bulk builders; mongomock 4.3 predates the argument
+    BulkOperationBuilder.add_update = _drop_sort(BulkOperationBuilder.add_update)
+    BulkOperationBuilder.add_replace = _drop_sort(BulkOperationBuilder.add_replace)
+    BulkOperationBuilder._accepts_sort = True
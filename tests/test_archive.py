@@ -0,0 +1,91 @@
+import random
+
+import pytest
+
+from archive import Archive, Archiver
+from changes import ChangeLog
+from log_store import LogStore
+from memory_store import MemoryStore
+from pagination import decode_cursor, message_key
+from payload_index import PayloadIndex
+from storage import Storage, LocalRepository, PayloadRepository
+
+DAY = 86400.0
+NOW = 1_000 * DAY
+
+
+@pytest.fixture(params=['memory', 'log'])
+def storage(request, tmp_path):
+    if request.param == 'memory':
+        store = MemoryStore(max_per_chat=100_000)
+    else:
+        store = LogStore(str(tmp_path / 'log'), sync='none')
+    (tmp_path / 'payloads').mkdir()
+    storage = Storage(None, LocalRepository(store, ChangeLog()), PayloadRepository(PayloadIndex(str(tmp_path / 'payloads'))),
+                      str(tmp_path / 'payloads'), archive=Archive(str(tmp_path / 'archive')))
+    yield storage
+    if request.param == 'log':
+        store.close()
+
+
+def fill(storage, n, seed=3):
+    rng = random.Random(seed)
+    for i in range(n):
+        # Mostly old, arriving out of order, with ties
+        ts = NOW - rng.randint(0, 60) * DAY if i % 10 else NOW - rng.randint(0, 20) * 3600.0
+        storage.append_message({'id': f"wamid.{i:04d}", 'wamid': f"wamid.{i:04d}", 'wa_id': '1', 'name': 'A', 'timestamp': ts, 'type': 'text',
+                                'text': {'body': str(i)}, 'status': 'read' if i % 3 else 'sent'})
+
+
+def walk_back(storage, limit):
+    seen = []
+    before = None
+    while True:
+        page = storage.history_page('1', limit, before, None)
+        seen = [m['id'] for m in page['messages']] + seen
+        if not page['next_before']:
+            return seen
+        before = decode_cursor(page['next_before'])
+
+
+def walk_forward(storage, limit):
+    seen = []
+    page = storage.history_page('1', limit, None, (0.0, ''))
+    seen += [m['id'] for m in page['messages']]
+    while page['has_more_after']:
+        page = storage.history_page('1', limit, None, decode_cursor(page['next_after']))
+        seen += [m['id'] for m in page['messages']]
+    return seen
+
+
+def test_read_through_matches_unarchived_history(storage):
+    fill(storage, 2000)
+    expected = [m['id'] for m in sorted(storage.history('1'), key=message_key)]
+    moved = Archiver(storage.archive, storage, max_age=7 * DAY).run_once(now=NOW)
+    assert 0 < moved < 2000
+    assert len(storage.local.history('1')) == 2000 - moved
+
+    assert [m['id'] for m in sorted(storage.history('1'), key=message_key)] == expected
+    assert walk_back(storage, 37) == expected
+    assert walk_forward(storage, 37) == expected
+
+
+def test_hot_pages_do_not_read_the_archive(storage):
+    fill(storage, 2000)
+    Archiver(storage.archive, storage, max_age=7 * DAY).run_once(now=NOW)
+    storage.archive._decoded.clear()
+    page = storage.history_page('1', 20, None, None)
+    assert len(page['messages']) == 20 and page['has_more_before']
+    assert not storage.archive._decoded
+
+
+def test_run_reports_the_chats_it_changed(storage):
+    fill(storage, 300)
+    storage.append_message({'id': 'recent', 'wamid': 'recent', 'wa_id': '2', 'name': 'B', 'timestamp': NOW,
+                            'type': 'text', 'text': {'body': 'hi'}, 'status': 'sent'})
+    changed = []
+    archiver = Archiver(storage.archive, storage, max_age=7 * DAY, on_moved=changed.append)
+    assert archiver.run_once(now=NOW) > 0
+    assert changed == [['1']]
+    assert archiver.run_once(now=NOW) == 0
+    assert changed == [['1']]
@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+from db_indexes import (MESSAGES, SUMMARIES, SUMMARY_INDEXES, ensure_indexes, check_query_plans,
+                        unindexed_queries)
+
+mongomock = pytest.importorskip('mongomock')
+
+
+@pytest.fixture
+def db():
+    db = mongomock.MongoClient()['whatsapp']
+    ensure_indexes(db[MESSAGES])
+    ensure_indexes(db[SUMMARIES], SUMMARY_INDEXES)
+    return db
+
+
+def test_every_hot_query_has_an_index(db):
+    assert unindexed_queries(db) == []
+
+
+def test_missing_indexes_are_caught(db):
+    db[MESSAGES].drop_index('unread_by_chat')
+    db[MESSAGES].drop_index('wa_id_timestamp_wamid')
+    db[SUMMARIES].drop_index('last_timestamp')
+    assert unindexed_queries(db) == [
+        "history by wa_id sorted by timestamp",
+        "history page before a cursor",
+        "unread messages by wa_id",
+        "mark read up to a timestamp",
+        "chat list newest first",
+    ]
+
+
+@pytest.mark.skipif(not os.environ.get('MONGO_TEST_URI'), reason="MONGO_TEST_URI not set")
+def test_query_plans_on_a_real_server():
+    from pymongo import MongoClient
+    client = MongoClient(os.environ['MONGO_TEST_URI'], serverSelectionTimeoutMS=2000)
+    db = client['whatsapp_plan_check']
+    try:
+        ensure_indexes(db[MESSAGES])
+        ensure_indexes(db[SUMMARIES], SUMMARY_INDEXES)
+        check_query_plans(db)
+    finally:
+        client.drop_database(db.name)
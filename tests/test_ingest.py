@@ -0,0 +1,12 @@
+from ingest import message_doc
+
+
+def test_webhook_media_is_not_a_media_store_reference():
+    msg = {'id': 'wamid.1', 'from': '1', 'timestamp': '1700000000', 'type': 'image',
+           'image': {'id': '1234567890', 'mime_type': 'image/jpeg', 'sha256': 'x', 'caption': 'look'}}
+    doc = message_doc(msg, '1', 'A')
+    # /media/<id> serves only ids from the media store
+    assert 'media' not in doc
+    assert doc['provider_media'] == {'id': '1234567890', 'mime_type': 'image/jpeg'}
+    assert doc['text'] == {'body': 'look'}
+    assert doc['timestamp'] == 1700000000.0
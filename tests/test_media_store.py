@@ -0,0 +1,34 @@
+import io
+import os
+
+import pytest
+
+from media_store import MediaStore, MediaTooLarge, EmptyMedia
+
+
+def files(root):
+    return sorted(os.path.relpath(os.path.join(d, f), root) for d, _, names in os.walk(root) for f in names)
+
+
+def test_empty_upload_leaves_nothing_behind(tmp_path):
+    store = MediaStore(str(tmp_path), max_bytes=1024)
+    with pytest.raises(EmptyMedia):
+        store.save(io.BytesIO(b''), 'image/png', 'x.png')
+    assert files(str(tmp_path)) == []
+
+
+def test_oversized_upload_leaves_nothing_behind(tmp_path):
+    store = MediaStore(str(tmp_path), max_bytes=10)
+    with pytest.raises(MediaTooLarge):
+        store.save(io.BytesIO(b'x' * 11), 'text/plain')
+    assert files(str(tmp_path)) == []
+
+
+def test_same_bytes_stored_once(tmp_path):
+    store = MediaStore(str(tmp_path), max_bytes=1024)
+    first = store.save(io.BytesIO(b'hello'), 'text/plain', 'a.txt')
+    second = store.save(io.BytesIO(b'hello'), 'text/plain', 'b.txt')
+    assert first == second == store.info(first['id'])
+    assert first['size'] == 5 and store.deduplicated == 1
+    with open(store.path(first['id']), 'rb') as f:
+        assert f.read() == b'hello'
@@ -0,0 +1,66 @@
+import json
+import os
+
+from changes import ChangeLog
+from memory_store import MemoryStore, MessageRecord
+from payload_index import PayloadIndex
+from storage import Storage, LocalRepository, PayloadRepository
+
+
+PAYLOAD = os.path.join(os.path.dirname(__file__), '..', 'payloads', 'conversation_1_message_1.json')
+
+
+def message(wamid, wa_id, ts, status='sent'):
+    return {'id': wamid, 'wamid': wamid, 'wa_id': wa_id, 'from': wa_id, 'name': f"Contact {wa_id}", 'timestamp': ts,
+            'type': 'text', 'text': {'body': wamid}, 'status': status}
+
+
+def budget_for(n):
+    # Room for ``n`` one-message chats, not n + 1
+    return int(MessageRecord(message('m.000', '000', 0.0)).size * (n + 0.5))
+
+
+def test_evicts_the_least_recently_used_chat():
+    store = MemoryStore(budget_bytes=budget_for(2))
+    store.add(message('m.a', 'a', 1.0))
+    store.add(message('m.b', 'b', 2.0))
+    store.messages('a')  # reading a chat makes it recently used
+    store.add(message('m.c', 'c', 3.0))
+
+    assert [wa_id for wa_id, _ in store.conversations()] == ['c', 'a']
+    assert store.get('m.b') is None and store.unread('b') == 0
+    assert store.stats()['evicted_conversations'] == 1 and store.stats()['evicted_messages'] == 1
+    assert store.bytes <= store.budget_bytes
+    # Gone from the dedupe index too, so it can be stored again
+    assert store.add(message('m.b', 'b', 2.0)) is not None
+
+
+def test_ring_drops_the_oldest_messages_of_a_chat():
+    store = MemoryStore(max_per_chat=3)
+    for i in range(5):
+        store.add(message(f"m.{i}", 'a', float(i)))
+    assert [m['id'] for m in store.messages('a')] == ['m.2', 'm.3', 'm.4']
+    assert store.get('m.0') is None and store.unread('a') == 3
+    assert store.stats()['evicted_messages'] == 2
+
+
+def test_evicted_chat_is_served_again_from_the_payload_files(tmp_path):
+    with open(PAYLOAD, encoding='utf-8') as f:
+        payload = json.load(f)
+    (tmp_path / 'conversation_1_message_1.json').write_text(json.dumps(payload), encoding='utf-8')
+    value = payload['metaData']['entry'][0]['changes'][0]['value']
+    wa_id, payload_id = value['contacts'][0]['wa_id'], value['messages'][0]['id']
+
+    store = MemoryStore(budget_bytes=budget_for(2))
+    storage = Storage(None, LocalRepository(store, ChangeLog()), PayloadRepository(PayloadIndex(str(tmp_path))),
+                      str(tmp_path))
+    storage.append_message(message('m.local', wa_id, 1754400100.0))
+    assert [m['id'] for m in storage.history(wa_id)] == [payload_id, 'm.local']
+    for other in ('b', 'c'):
+        storage.append_message(message(f"m.{other}", other, 1754400200.0))
+
+    assert store.get('m.local') is None
+    assert [m['id'] for m in storage.history(wa_id)] == [payload_id]
+    assert [m['id'] for m in storage.history_page(wa_id, 10, None, None)['messages']] == [payload_id]
+    chats = {c['wa_id']: c for c in storage.conversations()}
+    assert chats[wa_id]['last_message'] == value['messages'][0]['text']['body']
@@ -0,0 +1,37 @@
+import eventlet
+from eventlet.greenpool import GreenPool
+
+from metrics import GreenletCounter
+
+
+def test_greenlet_counter_tracks_start_and_exit():
+    counter = GreenletCounter()
+    counter.install()
+    counter.install()  # idempotent
+    gate = eventlet.event.Event()
+    threads = [eventlet.spawn(gate.wait) for _ in range(3)]
+    eventlet.spawn_n(gate.wait)
+    pool = GreenPool()
+    pool.spawn_n(gate.wait)
+    eventlet.sleep(0)
+    assert counter.running == 5
+    gate.send()
+    for gt in threads:
+        gt.wait()
+    pool.waitall()
+    eventlet.sleep(0)
+    assert (counter.running, counter.started) == (0, 5)
+
+    def boom():
+        raise ValueError("x")
+
+    failing = eventlet.spawn(boom)
+    try:
+        failing.wait()
+    except ValueError:
+        pass
+    eventlet.spawn(gate.wait).kill()
+    blocked = eventlet.spawn(eventlet.event.Event().wait)
+    eventlet.sleep(0)
+    blocked.kill()
+    assert counter.running == 0
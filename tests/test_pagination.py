@@ -0,0 +1,71 @@
+import random
+
+import pytest
+
+from log_store import LogStore
+from memory_store import MemoryStore
+from pagination import paginate_list, decode_cursor
+from storage import LocalRepository
+from changes import ChangeLog
+
+
+def messages(n, seed=7):
+    rng = random.Random(seed)
+    # Few distinct timestamps so pages break inside runs of equal ones
+    return [{'id': f"wamid.{i:04d}", 'wa_id': '1', 'name': 'A', 'timestamp': float(rng.randint(0, n // 4)),
+             'type': 'text', 'text': {'body': str(i)}, 'status': 'sent'} for i in rng.sample(range(n), n)]
+
+
+@pytest.fixture(params=['memory', 'log'])
+def repo(request, tmp_path):
+    if request.param == 'memory':
+        store = MemoryStore()
+    else:
+        store = LogStore(str(tmp_path), segment_bytes=4096, sync='none')
+    yield LocalRepository(store, ChangeLog())
+    if request.param == 'log':
+        store.close()
+
+
+def walk(repo, limit, backwards):
+    seen = []
+    page = repo.history_page('1', limit, None, None)
+    cursor = None
+    while True:
+        ids = [m['id'] for m in page['messages']]
+        seen = ids + seen if backwards else seen + ids
+        cursor = page['next_before'] if backwards else page['next_after']
+        if backwards and not page['has_more_before'] or not backwards and not page['has_more_after']:
+            return seen
+        before, after = (decode_cursor(cursor), None) if backwards else (None, decode_cursor(cursor))
+        page = repo.history_page('1', limit, before, after)
+
+
+def test_cursors_round_trip_across_pages(repo):
+    msgs = messages(300)
+    for m in msgs:
+        repo.append_message(dict(m), wait=False)
+    expected = [m['id'] for m in paginate_list(msgs, 1000)['messages']]
+    assert walk(repo, 7, backwards=True) == expected
+
+    oldest = repo.history_page('1', 1, (-1.0, ''), None)
+    assert oldest['messages'] == [] and not oldest['has_more_before']
+    first = repo.history_page('1', 7, None, (-1.0, ''))
+    forward = [m['id'] for m in first['messages']]
+    while first['has_more_after']:
+        first = repo.history_page('1', 7, None, decode_cursor(first['next_after']))
+        forward += [m['id'] for m in first['messages']]
+    assert forward == expected
+
+
+def test_pages_match_paginate_list(repo):
+    msgs = messages(120)
+    for m in msgs:
+        repo.append_message(dict(m), wait=False)
+    everything = paginate_list(msgs, 1000)['messages']
+    for cursor in [(m['timestamp'], m['id']) for m in everything[::11]] + [(5.0, ''), (5.0, '~')]:
+        for before, after in ((cursor, None), (None, cursor)):
+            got = repo.history_page('1', 10, before, after)
+            want = paginate_list(msgs, 10, before, after)
+            assert [m['id'] for m in got['messages']] == [m['id'] for m in want['messages']]
+            assert (got['next_before'], got['next_after']) == (want['next_before'], want['next_after'])
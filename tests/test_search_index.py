@@ -0,0 +1,34 @@
+from search_index import SearchIndex, MAX_PREFIX_TERMS
+
+
+def index(bodies):
+    idx = SearchIndex()
+    for i, body in enumerate(bodies):
+        idx.add({'id': f"m{i}", 'wa_id': '1', 'name': 'A', 'timestamp': i, 'text': {'body': body}})
+    return idx
+
+
+def test_prefix_past_the_term_cap_still_finds_every_match():
+    # More "ab..." terms than MAX_PREFIX_TERMS; the one that matters sorts after the cap
+    words = [f"ab{i:03d}" for i in range(MAX_PREFIX_TERMS * 2)]
+    bodies = [f"common {w}" for w in words] + ["common abzzz"] * 50
+    idx = index(bodies)
+    # The prefix group is rarer than "common", so it used to drive the walk and skip abzzz
+    found = idx.search("common ab", limit=1000)['results']
+    assert len(found) == len(bodies)
+    assert sum(r['id'] == f"m{len(words)}" for r in found) == 1
+
+
+def test_short_prefix_alone_scans_newest_first():
+    words = [f"ab{i:03d}" for i in range(MAX_PREFIX_TERMS + 10)]
+    idx = index(words + ["zz", "abzzz"])
+    page = idx.search("ab", limit=3)
+    assert [r['id'] for r in page['results']] == [f"m{len(words) + 1}", f"m{len(words) - 1}", f"m{len(words) - 2}"]
+    rest = idx.search("ab", limit=1000, before=int(page['next_before']))['results']
+    assert len(rest) == len(words) - 2
+
+
+def test_exact_terms_and_chat_filter():
+    idx = index(["hello world", "hello there", "world"])
+    assert [r['id'] for r in idx.search("hello wor")['results']] == ['m0']
+    assert idx.search("hello", wa_id='2')['results'] == []
@@ -0,0 +1,216 @@
+import pytest
+from pymongo.errors import ConnectionFailure
+
+from changes import ChangeLog
+from memory_store import MemoryStore
+from payload_index import PayloadIndex
+from storage import CircuitBreaker, MongoRepository, LocalRepository, PayloadRepository, Storage
+
+mongomock = pytest.importorskip('mongomock')
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient()['whatsapp']
+
+
+def message(wamid, wa_id, ts, status='sent', **extra):
+    # The contact's message unless ``extra`` says otherwise
+    return dict({'wamid': wamid, 'id': wamid, 'wa_id': wa_id, 'from': wa_id, 'name': f"Contact {wa_id}", 'timestamp': ts,
+                 'status': status, 'text': {'body': wamid}}, **extra)
+
+
+def test_prepare_builds_summaries_for_an_existing_database(db, tmp_path):
+    # Written before chat summaries existed
+    db['processed_messages'].insert_many([message('a', '555', 1.0), message('b', '555', 2.0, status='read'),
+                                          message('c', '777', 3.0)])
+    repo = MongoRepository(db)
+    repo.prepare(str(tmp_path))
+    chats = {c['wa_id']: c for c in repo.conversations()}
+    assert set(chats) == {'555', '777'}
+    assert chats['555']['last_message'] == 'b' and chats['555']['unread_count'] == 1
+
+
+def test_prepare_fills_in_summaries_that_lag(db, tmp_path):
+    db['processed_messages'].insert_many([message('a', '555', 1.0), message('c', '777', 3.0)])
+    db['chat_summaries'].insert_one({'_id': '555', 'name': 'Contact 555', 'last_message': 'a', 'last_timestamp': 1.0,
+                                     'unread_count': 1, 'read_up_to': 0.5})
+    repo = MongoRepository(db)
+    repo.prepare(str(tmp_path))
+    assert {c['wa_id'] for c in repo.conversations()} == {'555', '777'}
+    assert db['chat_summaries'].find_one({'_id': '555'})['read_up_to'] == 0.5
+
+
+def test_prepare_recounts_unread_without_the_agents_messages(db, tmp_path):
+    db['processed_messages'].insert_many([message('a', '555', 1.0), message('b', '555', 2.0, **{'from': '0'})])
+    # Counted by an older version: both messages
+    db['chat_summaries'].insert_one({'_id': '555', 'name': 'Contact 555', 'last_message': 'b', 'last_timestamp': 2.0,
+                                     'unread_count': 2})
+    repo = MongoRepository(db)
+    repo.prepare(str(tmp_path))
+    assert repo.conversations()[0]['unread_count'] == 1
+    # Once per database
+    db['chat_summaries'].update_one({'_id': '555'}, {'$set': {'unread_count': 5}})
+    MongoRepository(db).prepare(str(tmp_path))
+    assert db['chat_summaries'].find_one({'_id': '555'})['unread_count'] == 5
+
+
+def test_prepare_converts_string_timestamps(db, tmp_path):
+    # Older ingests stored the webhook's string timestamps next to send_message's floats
+    db['processed_messages'].insert_many([message('a', '555', '100'),
+                                          message('b', '555', 150.0),
+                                          message('c', '555', '200')])
+    repo = MongoRepository(db)
+    repo.prepare(str(tmp_path))
+    assert db['processed_messages'].count_documents({'timestamp': {'$type': 'string'}}) == 0
+
+    page = repo.history_page('555', 2, None, None)
+    assert [m['wamid'] for m in page['messages']] == ['b', 'c']
+    assert repo.mark_read('555', 150.0)['marked'] == 2
+    assert db['processed_messages'].find_one({'wamid': 'c'})['status'] == 'sent'
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_half_opens_and_closes(monkeypatch):
+    import storage
+    clock = Clock()
+    monkeypatch.setattr(storage.time, 'monotonic', clock)
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10.0)
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow()
+
+    clock.now += 10.0
+    assert breaker.allow() and breaker.state == CircuitBreaker.HALF_OPEN
+    # One failed trial call is enough to open it again
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow()
+    assert breaker.trips == 2
+
+    clock.now += 10.0
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.failures == 0
+    assert breaker.stats() == {"state": "closed", "consecutive_failures": 0, "trips": 2}
+
+
+class Flaky:
+    """A repository whose calls raise ConnectionFailure while ``down``."""
+
+    def __init__(self, repo):
+        self.repo = repo
+        self.down = False
+        self.calls = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self.repo, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            self.calls += 1
+            if self.down:
+                raise ConnectionFailure("down")
+            return attr(*args, **kwargs)
+        return call
+
+
+def test_writes_during_an_outage_are_replayed_on_recovery(db, tmp_path, monkeypatch):
+    import storage as storage_module
+    clock = Clock()
+    monkeypatch.setattr(storage_module.time, 'monotonic', clock)
+    primary = Flaky(MongoRepository(db))
+    storage = Storage(primary, LocalRepository(MemoryStore(), ChangeLog()), PayloadRepository(PayloadIndex(str(tmp_path))),
+                      str(tmp_path), breaker=CircuitBreaker(failure_threshold=2, reset_timeout=5.0))
+    assert storage.connect() and storage.state == 'mongo'
+    storage.append_message(message('a', '555', 1.0))
+
+    primary.down = True
+    for wamid, ts in (('b', 2.0), ('c', 3.0), ('d', 4.0)):
+        storage.append_message(message(wamid, '555', ts))
+    # Two failures open the breaker; the third write goes straight to the local store
+    assert primary.calls == 4 and storage.state == 'degraded'
+    storage.update_statuses({'d': 'delivered'})
+    storage.mark_read('555', 3.0)
+    assert [m['wamid'] for m in storage.history('555')] == ['b', 'c', 'd']
+    assert storage.stats()['pending_reconcile'] == {"messages": 3, "statuses": 1, "reads": 1}
+
+    # Still open: reconcile does not touch Mongo
+    assert storage.reconcile() == 0 and primary.calls == 4
+    clock.now += 5.0
+    primary.down = False
+    assert storage.reconcile() == 5
+    assert storage.state == 'mongo' and storage.breaker.state == CircuitBreaker.CLOSED
+    assert storage.stats()['pending_reconcile'] == {"messages": 0, "statuses": 0, "reads": 0}
+    stored = {m['wamid']: m['status'] for m in db['processed_messages'].find()}
+    assert stored == {'a': 'read', 'b': 'read', 'c': 'read', 'd': 'delivered'}
+    assert {c['wa_id']: c['unread_count'] for c in storage.conversations()} == {'555': 1}
+
+
+def test_failed_replay_keeps_the_journal(db, tmp_path, monkeypatch):
+    import storage as storage_module
+    clock = Clock()
+    monkeypatch.setattr(storage_module.time, 'monotonic', clock)
+    primary = Flaky(MongoRepository(db))
+    storage = Storage(primary, LocalRepository(MemoryStore(), ChangeLog()), PayloadRepository(PayloadIndex(str(tmp_path))),
+                      str(tmp_path), breaker=CircuitBreaker(failure_threshold=1, reset_timeout=5.0))
+    storage.connect()
+    primary.down = True
+    storage.append_message(message('a', '555', 1.0))
+    clock.now += 5.0
+    # Half-open trial fails: the breaker opens again and the write stays journaled
+    assert storage.reconcile() == 0
+    assert storage.breaker.state == CircuitBreaker.OPEN
+    assert storage.stats()['pending_reconcile']['messages'] == 1
+    clock.now += 5.0
+    primary.down = False
+    assert storage.reconcile() == 1
+    assert db['processed_messages'].count_documents({'wamid': 'a'}) == 1
+
+
+@pytest.fixture(params=['mongo', 'memory', 'log'])
+def any_storage(request, db, tmp_path):
+    primary = MongoRepository(db) if request.param == 'mongo' else None
+    if request.param == 'log':
+        from log_store import LogStore
+        store = LogStore(str(tmp_path / 'log'), sync='none')
+    else:
+        store = MemoryStore()
+    storage = Storage(primary, LocalRepository(store, ChangeLog()), PayloadRepository(PayloadIndex(str(tmp_path))),
+                      str(tmp_path))
+    if primary is not None:
+        assert storage.connect()
+    yield storage
+    if request.param == 'log':
+        store.close()
+
+
+def test_reading_a_chat_leaves_the_agents_messages_alone(any_storage):
+    storage = any_storage
+    storage.append_message(message('in.1', '555', 1.0))
+    storage.append_message(message('out.1', '555', 2.0, status='delivered', **{'from': '918329446654'}))
+    storage.append_message(message('in.2', '555', 3.0))
+    sent = message('out.2', '555', 4.0, name='You')
+    del sent['from']  # as send_message stores it
+    storage.append_message(sent)
+
+    result = storage.mark_read('555', 10.0)
+    assert result['marked'] == 2 and result['unread_count'] == 0
+    statuses = {m['id']: m['status'] for m in storage.history('555')}
+    assert statuses == {'in.1': 'read', 'out.1': 'delivered', 'in.2': 'read', 'out.2': 'sent'}
+    assert storage.conversations()[0]['unread_count'] == 0
+
+    # The contact's receipts still move the agent's ticks forward
+    assert [c['id'] for c in storage.update_statuses({'out.1': 'read', 'out.2': 'delivered'})] == ['out.1', 'out.2']
+    statuses = {m['id']: m['status'] for m in storage.history('555')}
+    assert statuses['out.1'] == 'read' and statuses['out.2'] == 'delivered'
+    assert storage.conversations()[0]['unread_count'] == 0
@@ -0,0 +1,78 @@
+import pytest
+
+from changes import ChangeLog, MongoSequence, mongo_changes_since, memory_changes_since
+
+mongomock = pytest.importorskip('mongomock')
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient()['whatsapp']
+
+
+def insert(db, seq, wamid):
+    db['processed_messages'].insert_one({'wamid': wamid, 'wa_id': '1', 'seq': seq, 'created_seq': seq, 'timestamp': seq})
+
+
+def test_sync_waits_for_a_write_that_commits_late(db):
+    sequence = MongoSequence(db['counters'])
+    slow = sequence.reserve()
+    first = slow.__enter__()
+    with sequence.reserve() as second:
+        insert(db, second, 'b')
+    # b landed, but a (reserved earlier) has not: a cursor past b would skip a forever
+    assert sequence.committed == first - 1
+    page = mongo_changes_since(db['processed_messages'], 0, 10, sequence.committed)
+    assert page['messages'] == [] and page['seq'] == 0
+
+    insert(db, first, 'a')
+    slow.__exit__(None, None, None)
+    assert sequence.committed == second
+    page = mongo_changes_since(db['processed_messages'], 0, 10, sequence.committed)
+    assert [m['wamid'] for m in page['messages']] == ['a', 'b']
+    assert page['seq'] == second
+    assert db['counters'].find_one({'_id': 'changes'})['inflight'] == []
+
+
+def test_failed_write_releases_its_numbers(db):
+    sequence = MongoSequence(db['counters'])
+    with pytest.raises(RuntimeError):
+        with sequence.reserve(3):
+            raise RuntimeError("write failed")
+    assert sequence.committed == sequence.current == 3
+
+
+def test_abandoned_reservation_goes_stale(db):
+    sequence = MongoSequence(db['counters'], stale_after=0)
+    sequence.reserve(2).__enter__()  # writer died without releasing
+    with sequence.reserve() as seq:
+        insert(db, seq, 'c')
+    assert sequence.committed == seq
+    assert db['counters'].find_one({'_id': 'changes'})['inflight'] == []
+
+
+def test_page_never_splits_a_shared_seq(db):
+    messages = db['processed_messages']
+    for i in range(5):
+        insert(db, i + 1, f"m{i}")
+    # Marked read together: one seq for three messages
+    messages.update_many({'wamid': {'$in': ['m2', 'm3', 'm4']}}, {'$set': {'seq': 6, 'status': 'read'}})
+    page = mongo_changes_since(messages, 0, 3, 6)
+    assert [m['wamid'] for m in page['messages']] == ['m0', 'm1'] and page['has_more']
+    page = mongo_changes_since(messages, page['seq'], 3, 6)
+    # Created after the client's cursor, so they arrive as messages, already read
+    assert sorted(m['wamid'] for m in page['messages']) == ['m2', 'm3', 'm4']
+    assert page['seq'] == 6 and not page['has_more']
+    page = mongo_changes_since(messages, 5, 1, 6)
+    assert sorted(s['id'] for s in page['statuses']) == ['m2', 'm3', 'm4']
+
+
+def test_memory_feed_resets_clients_it_cannot_serve():
+    log = ChangeLog(maxlen=3)
+    for i in range(5):
+        seq = log.allocate()
+        log.append(seq, 'message', {'id': f"m{i}"})
+    assert memory_changes_since(log, 1, 10)['reset']
+    assert memory_changes_since(log, 9, 10)['reset']
+    page = memory_changes_since(log, 2, 1)
+    assert [m['id'] for m in page['messages']] == ['m2'] and page['has_more'] and page['seq'] == 3
@@ -0,0 +1,36 @@
+import eventlet
+
+from write_behind import WriteBehindQueue
+
+
+class Flaky:
+    def __init__(self, failures):
+        self.failures = failures
+        self.written = []
+
+    def __call__(self, batch):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("database unavailable")
+        self.written.extend(batch)
+
+
+def test_failed_batch_is_retried():
+    flush = Flaky(failures=2)
+    queue = WriteBehindQueue(flush, max_delay=0, retry_delay=0)
+    assert queue.offer([1, 2, 3])
+    eventlet.sleep(0.05)
+    assert flush.written == [1, 2, 3]
+    stats = queue.stats()
+    assert (stats['flushed'], stats['errors'], stats['retries'], stats['dropped']) == (3, 2, 2, 0)
+
+
+def test_batch_is_dropped_and_counted_after_the_last_attempt():
+    flush = Flaky(failures=3)
+    queue = WriteBehindQueue(flush, max_delay=0, max_attempts=3, retry_delay=0)
+    queue.offer(['a', 'b'])
+    eventlet.sleep(0.05)
+    queue.offer(['c'])
+    eventlet.sleep(0.05)
+    assert flush.written == ['c']
+    assert queue.stats()['dropped'] == 2
@@ -0,0 +1,160 @@
+import time
+import hashlib
+import logging
+from collections import defaultdict
+
+import eventlet
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TTL = 6.0
+DEFAULT_FRAME_INTERVAL = 0.25
+# Per connection: sustained typing events per second, and the burst allowed on top
+DEFAULT_RATE = 4.0
+DEFAULT_BURST = 8
+
+
+def typer_id(sid):
+    """Opaque id for a connection in typing frames, so sids are not handed to other clients."""
+    return hashlib.sha1(sid.encode()).hexdigest()[:10]
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, burst):
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self, rate, burst, now):
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+class TypingTracker:
+    """Per-(sid, wa_id) typing state, emitted as coalesced frames.
+
+    Client ``typing_start``/``typing_stop`` events only change state here;
+    repeats (one per keystroke burst) just push the expiry forward. Every
+    ``frame_interval`` the greenlet expires typers idle for ``ttl`` seconds
+    and hands each chat with real transitions to
+    ``emit_frame(wa_id, started, stopped)`` once, with lists of typer ids.
+    A start and stop inside the same frame cancel out. Each connection
+    has a token bucket; events past it are dropped.
+    """
+
+    def __init__(self, emit_frame, ttl=DEFAULT_TTL, frame_interval=DEFAULT_FRAME_INTERVAL,
+                 rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+        self.emit_frame = emit_frame
+        self.ttl = ttl
+        self.frame_interval = frame_interval
+        self.rate = rate
+        self.burst = burst
+        self._expires = {}                 # (sid, wa_id) -> monotonic expiry
+        self._by_sid = defaultdict(set)    # sid -> wa_ids it is typing in
+        self._buckets = {}                 # sid -> TokenBucket
+        self._changes = {}                 # (sid, wa_id) -> True (started) / False (stopped) this frame
+        self._runner = None
+        self.received = 0
+        self.rate_limited = 0
+        self.ignored = 0
+        self.expired = 0
+        self.transitions = 0
+        self.frames = 0
+        self.errors = 0
+
+    def _allow(self, sid, now):
+        bucket = self._buckets.get(sid)
+        if bucket is None:
+            bucket = self._buckets[sid] = TokenBucket(self.burst)
+        if bucket.take(self.rate, self.burst, now):
+            return True
+        self.rate_limited += 1
+        return False
+
+    def start(self, sid, wa_id):
+        self.received += 1
+        now = time.monotonic()
+        if not self._allow(sid, now):
+            return
+        key = (sid, wa_id)
+        if key in self._expires:
+            self.ignored += 1
+        else:
+            self._by_sid[sid].add(wa_id)
+            self._change(key, True)
+        self._expires[key] = now + self.ttl
+
+    def stop(self, sid, wa_id):
+        self.received += 1
+        if not self._allow(sid, time.monotonic()):
+            return
+        if (sid, wa_id) not in self._expires:
+            self.ignored += 1
+            return
+        self._end((sid, wa_id))
+
+    def disconnect(self, sid):
+        for wa_id in list(self._by_sid.get(sid, ())):
+            self._end((sid, wa_id))
+        self._by_sid.pop(sid, None)
+        self._buckets.pop(sid, None)
+
+    def _end(self, key):
+        del self._expires[key]
+        sids = self._by_sid.get(key[0])
+        if sids is not None:
+            sids.discard(key[1])
+            if not sids:
+                del self._by_sid[key[0]]
+        self._change(key, False)
+
+    def _change(self, key, started):
+        if self._changes.get(key) is (not started):
+            # Undoes a change not yet emitted
+            del self._changes[key]
+        else:
+            self._changes[key] = started
+        if self._runner is None:
+            self._runner = eventlet.spawn(self._run)
+
+    def _run(self):
+        while True:
+            eventlet.sleep(self.frame_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                self.errors += 1
+                log.exception("Typing frame failed: %s", e)
+
+    def flush(self, now=None):
+        """Expire idle typers and emit one frame per chat with transitions. Returns the number of frames."""
+        now = time.monotonic() if now is None else now
+        for key in [k for k, expires in self._expires.items() if expires <= now]:
+            self.expired += 1
+            self._end(key)
+        changes, self._changes = self._changes, {}
+        by_chat = defaultdict(lambda: ([], []))
+        for (sid, wa_id), started in changes.items():
+            by_chat[wa_id][0 if started else 1].append(typer_id(sid))
+        for wa_id, (started, stopped) in by_chat.items():
+            self.emit_frame(wa_id, started, stopped)
+        self.transitions += len(changes)
+        self.frames += len(by_chat)
+        return len(by_chat)
+
+    def stats(self):
+        return {
+            "typing": len(self._expires),
+            "received": self.received,
+            "rate_limited": self.rate_limited,
+            "ignored_repeats": self.ignored,
+            "expired": self.expired,
+            "transitions_emitted": self.transitions,
+            "frames_emitted": self.frames,
+            "errors": self.errors,
+        }
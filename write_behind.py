@@ -0,0 +1,124 @@
+import time
+import logging
+
+import eventlet
+from eventlet.queue import LightQueue, Empty
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MAX_BATCH = 500
+DEFAULT_MAX_DELAY = 0.05
+DEFAULT_MAX_PENDING = 20000
+DEFAULT_MAX_ATTEMPTS = 6
+DEFAULT_RETRY_DELAY = 0.5
+MAX_RETRY_DELAY = 10.0
+
+
+class WriteBehindQueue:
+    """Bounded queue drained by one greenlet that writes in batches.
+
+    ``offer()`` only enqueues, so a request handler can acknowledge right
+    away. The flusher collects items until it has ``max_batch`` of them or
+    the oldest has waited ``max_delay`` seconds, then calls
+    ``flush_batch(items)`` once. When ``max_pending`` items are already
+    waiting, ``offer()`` refuses the whole set so the caller can answer
+    503 and let the sender retry instead of growing memory without bound.
+
+    The items were acknowledged already, so a batch whose flush raises is
+    retried (``flush_batch`` must be idempotent) with exponential backoff,
+    up to ``max_attempts`` times, before it is dropped and counted in
+    ``dropped``. Later batches wait meanwhile, which keeps their order and
+    lets ``max_pending`` push back on the sender.
+    """
+
+    def __init__(self, flush_batch, max_batch=DEFAULT_MAX_BATCH, max_delay=DEFAULT_MAX_DELAY,
+                 max_pending=DEFAULT_MAX_PENDING, max_attempts=DEFAULT_MAX_ATTEMPTS, retry_delay=DEFAULT_RETRY_DELAY):
+        self.flush_batch = flush_batch
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._queue = LightQueue()
+        self._runner = None
+        self.accepted = 0
+        self.rejected = 0
+        self.flushed = 0
+        self.batches = 0
+        self.errors = 0
+        self.retries = 0
+        self.dropped = 0
+        self.last_flush_ms = 0.0
+
+    def offer(self, items):
+        """Enqueue ``items`` (all or nothing). Returns False when the queue is full."""
+        if self._queue.qsize() + len(items) > self.max_pending:
+            self.rejected += len(items)
+            return False
+        for item in items:
+            self._queue.put_nowait(item)
+        self.accepted += len(items)
+        if self._runner is None:
+            self._runner = eventlet.spawn(self._run)
+        return True
+
+    def _next_batch(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            self._flush(self._next_batch(self._queue.get()))
+
+    def _flush(self, batch):
+        t0 = time.perf_counter()
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self.flush_batch(batch)
+                self.flushed += len(batch)
+                break
+            except Exception as e:
+                self.errors += 1
+                if attempt == self.max_attempts:
+                    self.dropped += len(batch)
+                    log.exception("Write-behind flush of %d items failed %d times; dropping them: %s",
+                                  len(batch), attempt, e)
+                    break
+                delay = min(self.retry_delay * 2 ** (attempt - 1), MAX_RETRY_DELAY)
+                self.retries += 1
+                log.warning("Write-behind flush of %d items failed (attempt %d of %d), retrying in %.1fs: %s",
+                            len(batch), attempt, self.max_attempts, delay, e)
+                eventlet.sleep(delay)
+        self.batches += 1
+        self.last_flush_ms = (time.perf_counter() - t0) * 1000
+
+    def drain(self):
+        """Flush everything queued right now from the calling greenlet."""
+        while self._queue.qsize():
+            batch = []
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except Empty:
+                    break
+            self._flush(batch)
+
+    def stats(self):
+        return {
+            "pending": self._queue.qsize(),
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "errors": self.errors,
+            "retries": self.retries,
+            "dropped": self.dropped,
+            "last_flush_ms": round(self.last_flush_ms, 1),
+        }